@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import gzip
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+import get_metadata
+import get_successful_samples
+import qc_reprocessing
+
+SOLO_QC_HEADER = [
+    "Sample",
+    "Rd_all",
+    "Rd_in_cells",
+    "Frc_in_cells",
+    "UMI_in_cells",
+    "Cells",
+    "Med_nFeature",
+    "Good_BC",
+    "WL",
+    "Species",
+    "Paired",
+    "Strand",
+    "all_u+m",
+    "all_u",
+    "exon_u+m",
+    "exon_u",
+    "full_u+m",
+    "full_u",
+]
+
+# failures injected into datasets, each breaks a different validator
+FAILURES = [
+    "missing_run_list",
+    "missing_fastq",
+    "star_tmp",
+    "missing_final_log",
+    "failed_sample",
+]
+
+# scripts started once per dataset or job, their imports are timed in fresh interpreters
+STARTUP_SCRIPTS = [
+    "qc_reprocessing",
+    "get_metadata",
+    "get_successful_samples",
+    "build_qc_warehouse",
+    "qc_gate",
+    "load_samples",
+]
+
+RESULT_HEADER = [
+    "scale",
+    "datasets",
+    "samples",
+    "runs",
+    "failed_datasets",
+    "files",
+    "benchmark",
+    "seconds",
+]
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generates synthetic reprocessing trees and times the QC and metadata scripts on them"
+    )
+    parser.add_argument(
+        "--scales",
+        metavar="<list>",
+        type=str,
+        help="Specify comma-separated tree sizes as datasets x samples per dataset x runs per sample. Default: 10x4x2,100x4x2,100x16x4",
+        default="10x4x2,100x4x2,100x16x4",
+    )
+    parser.add_argument(
+        "--failure_rate",
+        metavar="<num>",
+        type=float,
+        help="Specify a fraction of datasets with an injected failure. Default: 0.1",
+        default=0.1,
+    )
+    parser.add_argument(
+        "--seed",
+        metavar="<num>",
+        type=int,
+        help="Specify a seed of the generated trees. Default: 0",
+        default=0,
+    )
+    parser.add_argument(
+        "--repeat",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of runs of every benchmark, the fastest one is reported. Default: 3",
+        default=3,
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of workers passed to the benchmarked scripts. Default: 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--max_startup",
+        metavar="<num>",
+        type=float,
+        help="Specify the longest import time in seconds of a script on top of the interpreter startup, the benchmark fails if a script is slower or imports pandas. Default: 0.5",
+        default=0.5,
+    )
+    parser.add_argument(
+        "--workdir",
+        metavar="<dir>",
+        type=str,
+        help="Specify a directory for generated trees and outputs, it is kept after the run. Default: a temporary directory",
+        default=None,
+    )
+    parser.add_argument(
+        "--output",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the results file. Default: benchmark.tsv",
+        default="benchmark.tsv",
+    )
+    return parser
+
+
+class Scale(NamedTuple):
+    """
+    A size of a synthetic tree.
+    """
+
+    datasets: int
+    samples: int
+    runs: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Scale":
+        datasets, samples, runs = (int(number) for number in value.split("x"))
+        return cls(datasets, samples, runs)
+
+    def __str__(self) -> str:
+        return f"{self.datasets}x{self.samples}x{self.runs}"
+
+
+class SyntheticTree(NamedTuple):
+    """
+    Dataset directories of a generated tree and the failures injected into them.
+    """
+
+    root: str
+    dataset_paths: List[str]
+    failures: Dict[str, str]
+    files: int
+
+
+def fastq_content(run: str, read: int) -> bytes:
+    """
+    Return a small gzipped FASTQ file with a couple of records.
+    """
+    records = "".join(
+        f"@{run}.{i} {i}/{read}\nACGTACGTAC\n+\nFFFFFFFFFF\n" for i in range(1, 3)
+    )
+    return gzip.compress(records.encode(), mtime=0)
+
+
+def write_text(path: str, lines: List[str]) -> None:
+    with open(path, "w") as file:
+        file.write("".join(f"{line}\n" for line in lines))
+
+
+def solo_qc_row(sample: str, rng: random.Random) -> List[str]:
+    """
+    Return solo_qc.tsv values of a successful sample.
+    """
+    reads = rng.randint(10**6, 5 * 10**8)
+    in_cells = int(reads * rng.uniform(0.2, 0.9))
+    mapped = rng.uniform(0.3, 0.98)
+    return [
+        sample,
+        str(reads),
+        str(in_cells),
+        f"{in_cells / reads:.3f}",
+        str(int(in_cells * 0.6)),
+        str(rng.randint(500, 15000)),
+        str(rng.randint(300, 4000)),
+        f"{rng.uniform(0.5, 1):.6f}",
+        rng.choice(["v2", "v3"]),
+        rng.choice(["Human", "Mouse"]),
+        rng.choice(["Single", "Paired"]),
+        rng.choice(["Forward", "Reverse"]),
+        f"{mapped:.6f}",
+        f"{mapped * 0.85:.6f}",
+        f"{mapped * 0.6:.6f}",
+        f"{mapped * 0.58:.6f}",
+        f"{mapped * 0.8:.6f}",
+        f"{mapped * 0.7:.6f}",
+    ]
+
+
+def generate_dataset(
+    basedir: str,
+    dataset: str,
+    samples: int,
+    runs: int,
+    failure: str,
+    rng: random.Random,
+) -> int:
+    """
+    Write a dataset directory in the layout produced by the reprocessing pipeline.
+
+    Args:
+        basedir (str): A directory to create the dataset in.
+        dataset (str): The dataset name.
+        samples (int): A number of samples.
+        runs (int): A number of runs per sample.
+        failure (str): A failure from FAILURES to inject, or an empty string.
+        rng (random.Random): The random generator.
+
+    Returns:
+        int: A number of files written.
+    """
+    path = os.path.join(basedir, dataset)
+    number = dataset[3:]
+    sample_to_runs = {
+        f"GSM{number}{s:03d}": [f"SRR{number}{s:03d}{r}" for r in range(runs)]
+        for s in range(samples)
+    }
+    all_runs = [run for sample_runs in sample_to_runs.values() for run in sample_runs]
+    os.makedirs(path)
+
+    # dataset metafiles
+    metafiles = {
+        "sample_x_run.tsv": [
+            f"{sample}\t{','.join(sample_runs)}"
+            for sample, sample_runs in sample_to_runs.items()
+        ],
+        "run.list": all_runs,
+        "sample.list": list(sample_to_runs),
+        "parsed.tsv": [
+            f"{run}\t{run}_1.fastq.gz\t{run}_2.fastq.gz" for run in all_runs
+        ],
+        "accessions.tsv": [
+            f"{sample}\t{sample}\t{','.join(f'SRX{run[3:]}' for run in sample_runs)}\t{','.join(sample_runs)}"
+            for sample, sample_runs in sample_to_runs.items()
+        ],
+    }
+    if failure == "missing_run_list":
+        del metafiles["run.list"]
+    for suffix, lines in metafiles.items():
+        write_text(os.path.join(path, f"{dataset}.{suffix}"), lines)
+    write_text(os.path.join(path, f"{dataset}_family.soft"), [f"^SERIES = {dataset}"])
+    files = len(metafiles) + 1
+
+    # fastq pairs, STARsolo outputs and QC rows of every sample
+    solo_qc = ["\t".join(SOLO_QC_HEADER)]
+    for sample, sample_runs in sample_to_runs.items():
+        fastq_dir = os.path.join(path, "fastqs", sample)
+        os.makedirs(fastq_dir)
+        for run in sample_runs:
+            for read in (1, 2):
+                with open(os.path.join(fastq_dir, f"{run}_{read}.fastq.gz"), "wb") as f:
+                    f.write(fastq_content(run, read))
+                files += 1
+        gene_dir = os.path.join(path, sample, "output", "Gene", "filtered")
+        os.makedirs(gene_dir)
+        for name in ("barcodes.tsv", "features.tsv", "matrix.mtx"):
+            write_text(os.path.join(gene_dir, name), [name])
+        write_text(
+            os.path.join(path, sample, "Log.final.out"),
+            ["Uniquely mapped reads % |\t90.00%"],
+        )
+        files += 4
+        solo_qc.append("\t".join(solo_qc_row(sample, rng)))
+
+    first_sample, first_runs = next(iter(sample_to_runs.items()))
+    if failure == "missing_fastq":
+        os.remove(
+            os.path.join(path, "fastqs", first_sample, f"{first_runs[0]}_2.fastq.gz")
+        )
+        files -= 1
+    elif failure == "star_tmp":
+        os.makedirs(os.path.join(path, first_sample, "_STARtmp", "BAMsort"))
+    elif failure == "missing_final_log":
+        os.remove(os.path.join(path, first_sample, "Log.final.out"))
+        files -= 1
+    elif failure == "failed_sample":
+        solo_qc[1] = "\t".join([first_sample] + ["-"] * (len(SOLO_QC_HEADER) - 1))
+    write_text(os.path.join(path, f"{dataset}.solo_qc.tsv"), solo_qc)
+    return files + 1
+
+
+def generate_tree(
+    root: str, scale: Scale, failure_rate: float = 0.1, seed: int = 0
+) -> SyntheticTree:
+    """
+    Generate a tree of synthetic datasets, a fraction of them with an injected failure.
+
+    The tree is the same for the same scale, failure rate and seed.
+
+    Args:
+        root (str): A directory to create datasets in, it must not contain them yet.
+        scale (Scale): The size of the tree.
+        failure_rate (float, optional): A fraction of datasets with a failure. Defaults to 0.1.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        SyntheticTree: The generated tree.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    dataset_paths = []
+    failures = {}
+    files = 0
+    failed = rng.sample(range(scale.datasets), round(scale.datasets * failure_rate))
+    for index in range(scale.datasets):
+        dataset = f"GSE{100000 + index}"
+        failure = (
+            FAILURES[failed.index(index) % len(FAILURES)] if index in failed else ""
+        )
+        if failure:
+            failures[dataset] = failure
+        files += generate_dataset(
+            root, dataset, scale.samples, scale.runs, failure, rng
+        )
+        dataset_paths.append(os.path.join(root, dataset))
+    return SyntheticTree(root, dataset_paths, failures, files)
+
+
+@contextmanager
+def script_args(*args: str) -> Iterator[None]:
+    """
+    Run a script main function with command line arguments and without its output.
+    """
+    argv = sys.argv
+    sys.argv = [argv[0], *args]
+    try:
+        with redirect_stdout(io.StringIO()):
+            yield
+    except SystemExit as error:
+        if error.code:
+            raise
+    finally:
+        sys.argv = argv
+
+
+def best_time(func: Callable[[], None], repeat: int) -> float:
+    """
+    Return the shortest wall time of several runs of a function.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def startup_time(module: str, repeat: int) -> Tuple[float, bool]:
+    """
+    Return the shortest wall time of importing a script in a fresh interpreter.
+
+    Args:
+        module (str): The script module name, an empty string times the interpreter alone.
+        repeat (int): A number of runs.
+
+    Returns:
+        Tuple[float, bool]: The best time in seconds and whether the import loaded pandas.
+    """
+    code = f"import sys; {'import ' + module if module else 'pass'}; sys.exit('pandas' in sys.modules)"
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    times, pandas_loaded = [], False
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", code], cwd=scripts_dir)
+        times.append(time.perf_counter() - start)
+        pandas_loaded = process.returncode == 1
+        if process.returncode > 1:
+            raise RuntimeError(f"Importing {module} failed")
+    return min(times), pandas_loaded
+
+
+def run_startup_benchmarks(
+    repeat: int = 3, max_startup: float = 0.5
+) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Time imports of STARTUP_SCRIPTS, net of the interpreter startup, and check them.
+
+    Args:
+        repeat (int, optional): A number of runs of every import. Defaults to 3.
+        max_startup (float, optional): The longest allowed import time in seconds. Defaults to 0.5.
+
+    Returns:
+        Tuple[Dict[str, float], List[str]]: Import times of the scripts and the failed checks.
+    """
+    interpreter, _ = startup_time("", repeat)
+    results, errors = {}, []
+    for module in STARTUP_SCRIPTS:
+        seconds, pandas_loaded = startup_time(module, repeat)
+        results[f"startup.{module}"] = seconds = max(seconds - interpreter, 0.0)
+        if pandas_loaded:
+            errors.append(f"{module} imports pandas at startup")
+        if seconds > max_startup:
+            errors.append(
+                f"{module} takes {seconds:.3f}s to import, more than {max_startup}s"
+            )
+    return results, errors
+
+
+def run_benchmarks(
+    tree: SyntheticTree, workdir: str, repeat: int = 3, workers: int = 1
+) -> Dict[str, float]:
+    """
+    Time the QC validation, metadata and successful samples scripts on a tree.
+
+    Args:
+        tree (SyntheticTree): The generated tree.
+        workdir (str): A directory for outputs of the scripts.
+        repeat (int, optional): A number of runs of every benchmark. Defaults to 3.
+        workers (int, optional): A number of workers passed to the scripts. Defaults to 1.
+
+    Returns:
+        Dict[str, float]: The best time in seconds of every benchmark.
+    """
+    dataset_list = os.path.join(workdir, "datasets.txt")
+    write_text(dataset_list, tree.dataset_paths)
+    qc_list = os.path.join(workdir, "solo_qc_files.csv")
+    write_text(
+        qc_list,
+        [
+            f"{os.path.basename(path)},{path}/{os.path.basename(path)}.solo_qc.tsv"
+            for path in tree.dataset_paths
+        ],
+    )
+
+    def validate_basedir() -> None:
+        for _ in qc_reprocessing.validate_basedir(
+            tree.dataset_paths,
+            qc_reprocessing.INFORMATIVE_COLUMNS + qc_reprocessing.ADDITIONAL_COLUMNS,
+            qc_reprocessing.METAFILE_SUFFIXES,
+            qc_reprocessing.DB_METAFILE_SUFFIXES,
+            workers=workers,
+        ):
+            pass
+
+    def get_metadata_main() -> None:
+        outputdir = os.path.join(workdir, "metadata")
+        shutil.rmtree(outputdir, ignore_errors=True)
+        with script_args(
+            "--dataset_list",
+            dataset_list,
+            "--outputdir",
+            outputdir,
+            "--summary",
+            os.path.join(workdir, "metadata_summary.tsv"),
+            "--workers",
+            str(workers),
+        ):
+            get_metadata.main()
+
+    def get_successful_samples_main() -> None:
+        with script_args(
+            qc_list,
+            os.path.join(workdir, "successful_samples.csv"),
+            "--filtered_qc",
+            os.path.join(workdir, "filtered_solo_qc.tsv"),
+            "--workers",
+            str(workers),
+        ):
+            get_successful_samples.main()
+
+    benchmarks = {
+        "validate_basedir": validate_basedir,
+        "get_metadata.main": get_metadata_main,
+        "get_successful_samples.main": get_successful_samples_main,
+    }
+    return {name: best_time(func, repeat) for name, func in benchmarks.items()}
+
+
+def main() -> None:
+    """
+    The main entry point for the benchmark script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    scales = [Scale.parse(value) for value in args.scales.split(",")]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="reprocessing_benchmark_")
+    try:
+        with open(args.output, "w") as output:
+            output.write("\t".join(RESULT_HEADER) + "\n")
+            for scale in scales:
+                scale_dir = os.path.join(workdir, str(scale))
+                shutil.rmtree(scale_dir, ignore_errors=True)
+                tree = generate_tree(
+                    os.path.join(scale_dir, "datasets"),
+                    scale,
+                    args.failure_rate,
+                    args.seed,
+                )
+                print(
+                    f"{scale}: generated {tree.files} files, {len(tree.failures)} datasets with failures",
+                    file=sys.stderr,
+                )
+                results = run_benchmarks(tree, scale_dir, args.repeat, args.workers)
+                for benchmark, seconds in results.items():
+                    values = [
+                        scale,
+                        *scale,
+                        len(tree.failures),
+                        tree.files,
+                        benchmark,
+                        f"{seconds:.4f}",
+                    ]
+                    line = "\t".join(str(value) for value in values)
+                    output.write(line + "\n")
+                    print(line)
+            # imports do not depend on the tree size
+            results, errors = run_startup_benchmarks(args.repeat, args.max_startup)
+            for benchmark, seconds in results.items():
+                line = "\t".join(["-"] * 6 + [benchmark, f"{seconds:.4f}"])
+                output.write(line + "\n")
+                print(line)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Results saved to {args.output}", file=sys.stderr)
+    if errors:
+        sys.exit("ERROR: " + "; ".join(errors))
+
+
+if __name__ == "__main__":
+    main()
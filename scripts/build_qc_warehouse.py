@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import sqlite3
+import hashlib
+import argparse
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from solo_qc import SoloQCReader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# pandas and pyarrow.dataset, which imports pandas, are only needed to read the
+# warehouse and are imported there, so ingestion starts without them
+if TYPE_CHECKING:
+    import pandas as pd
+
+MANIFEST_NAME = "_manifest.sqlite"
+
+# columns added to every QC file, `dataset` is the partition key
+DIRECTORY_COLUMN = "directory"
+COMPLETE_COLUMN = "complete"
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initialise argument parser for the script
+    """
+    parser = argparse.ArgumentParser(
+        description="Builds a Parquet dataset partitioned by dataset from solo_qc.tsv files, only new and changed files are ingested on re-runs"
+    )
+    parser.add_argument(
+        "input",
+        type=str,
+        help="Specify a path to the file list of STARsolo QC files (first column is dataset name, second column is path to the file) or to a directory with dataset directories",
+    )
+    parser.add_argument(
+        "output",
+        metavar="<dir>",
+        type=str,
+        help="Specify a path to the Parquet dataset directory",
+    )
+    parser.add_argument(
+        "--sep",
+        metavar="<val>",
+        type=str,
+        help='Specify a separator of the file list. Default: ","',
+        default=",",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of QC files ingested in parallel. Default: 4",
+        default=4,
+    )
+    return parser
+
+
+def list_qc_files(input: str, sep: str = ",") -> List[Tuple[str, str]]:
+    """
+    Return dataset names and paths of solo_qc.tsv files
+    Args:
+        input (str): a path to a file list or to a directory with dataset directories
+        sep (str, optional): a separator of the file list. Defaults to ','.
+
+    Returns:
+        List[Tuple[str, str]]: a list of (dataset, filepath) tuples
+    """
+    if os.path.isdir(input):
+        return [
+            (os.path.basename(os.path.dirname(filepath)), filepath)
+            for filepath in sorted(glob.glob(os.path.join(input, "*", "*.solo_qc.tsv")))
+        ]
+    with open(input, "r") as file:
+        return [tuple(line.strip().split(sep)[:2]) for line in file if line.strip()]
+
+
+def arrow_type(value_type: type) -> "pa.DataType":
+    """
+    Return the Arrow type of a solo_qc.tsv column type
+    """
+    if value_type is int:
+        return pa.int64()
+    if value_type is float:
+        return pa.float64()
+    return pa.string()
+
+
+def read_qc_table(filepath: str) -> "pa.Table":
+    """
+    Read a solo_qc.tsv file to an Arrow table with typed columns
+    Args:
+        filepath (str): a path to the QC file
+
+    Returns:
+        pa.Table: a table with a column per header column, missing and malformed values are nulls.
+            The directory of the file and whether the row has no missing values are added as columns.
+    """
+    with SoloQCReader(filepath) as reader:
+        rows = list(reader)
+        columns = {
+            column: pa.array(
+                [row.get(column) for row in rows],
+                type=arrow_type(reader.column_types[idx]),
+            )
+            for idx, column in enumerate(reader.header)
+        }
+    columns[DIRECTORY_COLUMN] = pa.array(
+        [os.path.dirname(filepath)] * len(rows), type=pa.string()
+    )
+    columns[COMPLETE_COLUMN] = pa.array([row.complete for row in rows], pa.bool_())
+    return pa.table(columns)
+
+
+class WarehouseManifest:
+    """
+    Records sizes and mtimes of ingested QC files in the Parquet dataset directory.
+
+    Files starting with an underscore are ignored by Parquet readers, so the
+    manifest can live next to the partitions.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                filepath TEXT PRIMARY KEY,
+                dataset TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                part TEXT NOT NULL
+            )
+            """
+        )
+        self._index = {
+            filepath: (dataset, size, mtime_ns)
+            for filepath, dataset, size, mtime_ns in self._connection.execute(
+                "SELECT filepath, dataset, size, mtime_ns FROM files"
+            )
+        }
+
+    def is_ingested(self, dataset: str, filepath: str, stat: os.stat_result) -> bool:
+        """
+        Return True if a file was ingested to the same dataset and did not change since.
+        """
+        return self._index.get(filepath) == (dataset, stat.st_size, stat.st_mtime_ns)
+
+    def record(
+        self, dataset: str, filepath: str, stat: os.stat_result, part: str
+    ) -> None:
+        """
+        Record an ingested file and commit it.
+        """
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (filepath, dataset, stat.st_size, stat.st_mtime_ns, part),
+            )
+        self._index[filepath] = (dataset, stat.st_size, stat.st_mtime_ns)
+
+    def part(self, filepath: str) -> Optional[str]:
+        """
+        Return the Parquet file a QC file was ingested to or None.
+        """
+        row = self._connection.execute(
+            "SELECT part FROM files WHERE filepath = ?", (filepath,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "WarehouseManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def ingest_qc_file(output_dir: str, dataset: str, filepath: str) -> str:
+    """
+    Write a QC file to the partition of its dataset
+    Args:
+        output_dir (str): a path to the Parquet dataset directory
+        dataset (str): a dataset name
+        filepath (str): a path to the QC file
+
+    Returns:
+        str: a path to the written Parquet file relative to `output_dir`
+    """
+    # a QC file always maps to the same Parquet file, so a changed file replaces its previous version
+    name = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:16]
+    part = os.path.join(f"dataset={dataset}", f"{name}.parquet")
+    target = os.path.join(output_dir, part)
+    # readers skip hidden files, so a partially written file is never read
+    tmp_target = os.path.join(os.path.dirname(target), f".{name}.parquet.tmp")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    pq.write_table(read_qc_table(filepath), tmp_target)
+    os.replace(tmp_target, target)
+    return part
+
+
+def read_warehouse(
+    output_dir: str, columns: Optional[List[str]] = None, complete_only: bool = False
+) -> "pd.DataFrame":
+    """
+    Read the Parquet dataset to a pandas DataFrame
+    Args:
+        output_dir (str): a path to the Parquet dataset directory
+        columns (Optional[List[str]], optional): columns to read, all columns if None. Defaults to None.
+        complete_only (bool, optional): only read rows without missing values. Defaults to False.
+
+    Returns:
+        pd.DataFrame: QC rows of all ingested files with a `dataset` column, empty if no files are ingested
+    """
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    # QC files can have different columns, read them with the union of all schemas
+    parts = glob.glob(os.path.join(output_dir, "dataset=*", "*.parquet"))
+    if not parts:
+        return pd.DataFrame(columns=columns if columns is not None else ["dataset"])
+    schema = pa.unify_schemas([pq.read_schema(part) for part in parts])
+    schema = schema.append(pa.field("dataset", pa.string()))
+    dataset = ds.dataset(output_dir, schema=schema, partitioning="hive")
+    table = dataset.to_table(
+        columns=columns,
+        filter=ds.field(COMPLETE_COLUMN) if complete_only else None,
+    )
+    # keep integer columns with missing values as integers
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+
+def main():
+    # Parse arguments
+    parser = init_parser()
+    args = parser.parse_args()
+    if pa is None:
+        sys.exit("ERROR: build_qc_warehouse.py requires pyarrow: pip install pyarrow")
+
+    # Find files that are new or changed since the last run
+    qc_files = list_qc_files(args.input, args.sep)
+    os.makedirs(args.output, exist_ok=True)
+    with WarehouseManifest(os.path.join(args.output, MANIFEST_NAME)) as manifest:
+        pending = []
+        for dataset, filepath in qc_files:
+            stat = os.stat(filepath)
+            if not manifest.is_ingested(dataset, filepath, stat):
+                pending.append((dataset, filepath, stat))
+
+        # Ingest files in parallel and record them as soon as they are written
+        def ingest(item: Tuple[str, str, os.stat_result]) -> str:
+            dataset, filepath, _ = item
+            return ingest_qc_file(args.output, dataset, filepath)
+
+        with ThreadPoolExecutor(args.workers) as executor:
+            for (dataset, filepath, stat), part in zip(
+                pending, executor.map(ingest, pending)
+            ):
+                # a file moved to another dataset leaves a stale part behind
+                previous = manifest.part(filepath)
+                if previous is not None and previous != part:
+                    try:
+                        os.remove(os.path.join(args.output, previous))
+                    except FileNotFoundError:
+                        pass
+                manifest.record(dataset, filepath, stat, part)
+
+    print(
+        f"Ingested {len(pending)} new or changed of {len(qc_files)} QC files to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
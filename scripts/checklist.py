@@ -0,0 +1,115 @@
+import csv
+from functools import lru_cache
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, TextIO, Tuple
+
+# value written for checks that were not run
+MISSING_VALUE = "-"
+
+
+@lru_cache(maxsize=None)
+def column_index(columns: Tuple[str, ...]) -> Dict[str, int]:
+    """
+    Return positions of checklist columns, shared by all checklists with the same columns.
+    """
+    return {column: position for position, column in enumerate(columns)}
+
+
+class Checklist(MutableMapping):
+    """
+    Validation results of a dataset with a fixed set of columns.
+
+    Values are stored in a list ordered as the columns and the column positions
+    are shared between checklists, so a checklist costs a list of pointers rather
+    than a dict. It is used as a dict by the validators, but columns can not be
+    added or removed. A column that was not set is None.
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, columns: Sequence[str]) -> None:
+        """
+        Args:
+            columns (Sequence[str]): The checklist columns.
+        """
+        self._index = column_index(tuple(columns))
+        self._values: List[Any] = [None] * len(self._index)
+
+    @classmethod
+    def from_dict(
+        cls, columns: Sequence[str], values: Mapping[str, Any]
+    ) -> "Checklist":
+        """
+        Return a checklist with values of its columns taken from a dict, other keys are ignored.
+        """
+        checklist = cls(columns)
+        for column, position in checklist._index.items():
+            checklist._values[position] = values.get(column)
+        return checklist
+
+    def __getitem__(self, column: str) -> Any:
+        return self._values[self._index[column]]
+
+    def __setitem__(self, column: str, value: Any) -> None:
+        position = self._index.get(column)
+        if position is None:
+            raise KeyError(f"{column} is not a checklist column")
+        self._values[position] = value
+
+    def __delitem__(self, column: str) -> None:
+        raise TypeError("checklist columns can not be removed")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return f"Checklist({dict(self)!r})"
+
+    def is_passed(self, must_be_true: Sequence[str]) -> bool:
+        """
+        Return True if none of the required columns is false.
+
+        Columns that were not set do not fail a dataset, as the checks that
+        depend on an earlier failed one are not run.
+        """
+        return all(self[column] for column in must_be_true if self[column] is not None)
+
+
+class ChecklistWriter:
+    """
+    Writes checklists as rows of a table with a row per dataset.
+
+    The table has the format `DataFrame.to_csv` produced for the checklists: an
+    empty first header cell, the dataset name as the first value of a row and
+    columns that were not set written as `-`. Every row is flushed as it is
+    written, so the rows of datasets validated so far stay on disk if the run is
+    interrupted.
+    """
+
+    def __init__(self, file: TextIO, columns: Sequence[str], sep: str = "\t") -> None:
+        """
+        Args:
+            file (TextIO): A file opened for writing with newline=''.
+            columns (Sequence[str]): The checklist columns.
+            sep (str, optional): The separator. Defaults to '\\t'.
+        """
+        self.file = file
+        self.columns = list(columns)
+        self.rows = 0
+        self._writer = csv.writer(file, delimiter=sep, lineterminator="\n")
+        self._writer.writerow(["", *self.columns])
+        self.file.flush()
+
+    def write(self, dataset: str, checklist: Mapping[str, Any]) -> None:
+        """
+        Write the checklist of a dataset.
+        """
+        values = (checklist[column] for column in self.columns)
+        self._writer.writerow(
+            [dataset, *(MISSING_VALUE if value is None else value for value in values)]
+        )
+        self.file.flush()
+        self.rows += 1
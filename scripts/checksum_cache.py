@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+# 8 MiB reads keep Lustre busy without holding much memory per worker
+DEFAULT_BUFFER_SIZE = 1 << 23
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Prints MD5 checksums of files in md5sum format, reusing cached checksums of unchanged files"
+    )
+    parser.add_argument(
+        "files",
+        metavar="<file>",
+        type=str,
+        nargs="*",
+        help="Specify paths to the files to hash. Paths are read from stdin if none are given",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite checksum cache. Default: md5_cache.sqlite",
+        default="md5_cache.sqlite",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of files hashed concurrently. Default: number of CPUs",
+        default=os.cpu_count(),
+    )
+    return parser
+
+
+def md5_file(path: str, buffer: Optional[bytearray] = None) -> str:
+    """
+    Return the MD5 hex digest of a file read in large chunks into a reusable buffer.
+
+    Args:
+        path (str): A path to the file.
+        buffer (Optional[bytearray], optional): A buffer to read chunks into. Defaults to a new 8 MiB buffer.
+
+    Returns:
+        str: The MD5 hex digest.
+    """
+    if buffer is None:
+        buffer = bytearray(DEFAULT_BUFFER_SIZE)
+    view = memoryview(buffer)
+    md5 = hashlib.md5()
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            size = file.readinto(view)
+            if not size:
+                break
+            md5.update(view[:size])
+    return md5.hexdigest()
+
+
+def stat_key(stat: os.stat_result) -> Tuple[int, int, int, int]:
+    """
+    Return the key identifying a version of a file: device, inode, size and mtime.
+    """
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class ChecksumCache:
+    """
+    A persistent SQLite cache of MD5 checksums keyed on (device, inode, size, mtime).
+
+    A file that was rewritten gets a new mtime or size and a file that was replaced
+    gets a new inode, so a cached checksum is only returned for the same bytes.
+    The cache can be shared between threads, new checksums are written in batches.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+            batch_size (int, optional): A number of new checksums written at once. Defaults to 1000.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[int, int, int, int, str]] = []
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checksums (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                md5 TEXT NOT NULL,
+                PRIMARY KEY (device, inode, size, mtime_ns)
+            )
+            """
+        )
+
+    def get(self, stat: os.stat_result) -> Optional[str]:
+        """
+        Return the cached checksum of a file version or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT md5 FROM checksums WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                stat_key(stat),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, stat: os.stat_result, md5: str) -> None:
+        """
+        Queue the checksum of a file version to be written to the cache.
+        """
+        with self._lock:
+            self._pending.append((*stat_key(stat), md5))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self) -> None:
+        """
+        Write queued checksums to the SQLite file.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)", pending
+            )
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> "ChecksumCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class Hasher:
+    """
+    Computes MD5 checksums of files, reusing cached ones.
+
+    hashlib releases the GIL while hashing large buffers, so files are hashed in
+    parallel on a thread pool. Each thread reads into its own reusable buffer.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ChecksumCache] = None,
+        workers: int = 1,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+    ) -> None:
+        """
+        Args:
+            cache (Optional[ChecksumCache], optional): The checksum cache. Defaults to None.
+            workers (int, optional): A number of files hashed concurrently by `hash_files`. Defaults to 1.
+            buffer_size (int, optional): A size of read buffers. Defaults to 8 MiB.
+        """
+        self.cache = cache
+        self.workers = workers
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+
+    def md5(self, path: str) -> str:
+        """
+        Return the MD5 hex digest of a file, from the cache if the file did not change.
+        """
+        stat = os.stat(path)
+        if self.cache is not None:
+            md5 = self.cache.get(stat)
+            if md5 is not None:
+                return md5
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray(self.buffer_size)
+        md5 = md5_file(path, buffer)
+        # the file changed while it was read, don't cache a checksum of mixed versions
+        if self.cache is not None and stat_key(os.stat(path)) == stat_key(stat):
+            self.cache.put(stat, md5)
+        return md5
+
+    def hash_files(self, paths: List[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Hash files in parallel and yield paths with their checksums in the input order.
+        """
+        with ThreadPoolExecutor(self.workers) as executor:
+            yield from zip(paths, executor.map(self.md5, paths))
+
+
+def main() -> None:
+    """
+    The main entry point for the checksum script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    paths = args.files or [line.rstrip("\n") for line in sys.stdin if line.strip()]
+    with ChecksumCache(args.cache) as cache:
+        hasher = Hasher(cache, workers=args.workers)
+        for path, md5 in hasher.hash_files(paths):
+            print(f"{md5}  {path}")
+    print(f"CACHE: HITS: {cache.hits}, MISSES: {cache.misses}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,11 @@
 #!/bin/bash
 
-pattern="Successfully completed."
 directory=$1
 output=$2
 
-total_logs=$(find $directory -type f -name "transferOutput*.log" | wc -l)
-successful_logs=$(find $directory -type f -name "transferOutput*.log" -exec grep -q "$pattern" {} \; -print | wc -l)
+# Set script PATHS
+harvest_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/harvest_logs.py
 
-find "$directory" -type f -name "transferOutput*.log" ! -exec grep -q "$pattern" {} \; -print > $output
-
-echo "Total output*.log files: $total_logs"
-echo "Files containing 'Successfully completed.': $successful_logs"
-echo "Files do not contain 'Successfully completed.': $( wc -l $output )"
+# List transferOutput*.log files without "Successfully completed." in $output,
+# logs parsed by previous runs are skipped
+$harvest_script --transfer_dir "$directory" --failed_list "$output"
@@ -0,0 +1,202 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+# size value used for directories in the snapshot index
+DIR_ENTRY = -1
+# size value used for files that are listed but were not stat'ed during the scan
+UNKNOWN_SIZE = -2
+# files below the dataset root whose sizes the validators read, other files are only listed
+STAT_NAMES = {"Log.final.out"}
+
+
+class DatasetSnapshot:
+    """
+    An in-memory index of a dataset directory tree built with a single walk.
+
+    The tree is walked once with `os.scandir` down to `max_depth` levels below the
+    dataset root. Every entry is stored as a relative path mapped to its size
+    (`DIR_ENTRY` for directories), and every scanned directory keeps a tuple of its
+    children names. Existence, non-emptiness and count queries are answered from
+    the index without touching the filesystem.
+
+    Files directly in the root and files named in STAT_NAMES are stat'ed, other
+    files are listed but not stat'ed and directories at the deepest level are not
+    listed, both are read lazily on the first query. An entry that disappears
+    during the scan is left out. Directories that can't be read are kept in
+    `errors`, they look empty in the snapshot.
+    """
+
+    __slots__ = ("root", "max_depth", "errors", "_entries", "_children")
+
+    def __init__(
+        self,
+        root: str,
+        entries: Dict[str, int],
+        children: Dict[str, Tuple[str, ...]],
+        max_depth: int,
+        errors: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Args:
+            root (str): A path to the dataset directory.
+            entries (Dict[str, int]): A mapping of relative paths to entry sizes.
+            children (Dict[str, Tuple[str, ...]]): A mapping of scanned directories to their children names.
+            max_depth (int): The depth the tree was scanned to.
+            errors (Optional[List[str]], optional): Directories that could not be read with the errors. Defaults to None.
+        """
+        self.root = root
+        self.max_depth = max_depth
+        self.errors = errors or []
+        self._entries = entries
+        self._children = children
+
+    @classmethod
+    def scan(cls, root: str, max_depth: int = 3) -> "DatasetSnapshot":
+        """
+        Walk the dataset tree once and build a snapshot.
+
+        The default depth covers everything the validators look at:
+        `<sample>/output/*`, `<sample>/_STARtmp/*` and `fastqs/<sample>/*`.
+
+        Args:
+            root (str): A path to the dataset directory.
+            max_depth (int, optional): A number of levels to scan below the root. Defaults to 3.
+
+        Returns:
+            DatasetSnapshot: The snapshot of the dataset tree.
+        """
+        root = root.rstrip("/")
+        entries: Dict[str, int] = {}
+        children: Dict[str, Tuple[str, ...]] = {}
+        errors: List[str] = []
+        if os.path.isdir(root):
+            entries[""] = DIR_ENTRY
+            stack = [("", root, 1)]
+            while stack:
+                relpath, path, depth = stack.pop()
+                try:
+                    with os.scandir(path) as iterator:
+                        dir_entries = list(iterator)
+                except (FileNotFoundError, NotADirectoryError):
+                    # removed or replaced since its parent was listed
+                    del entries[relpath]
+                    continue
+                except OSError as error:
+                    errors.append(f"{path}: {error.strerror}")
+                    children[relpath] = ()
+                    continue
+                names = []
+                for entry in dir_entries:
+                    entry_relpath = f"{relpath}/{entry.name}" if relpath else entry.name
+                    try:
+                        if entry.is_dir():
+                            entries[entry_relpath] = DIR_ENTRY
+                            if depth < max_depth:
+                                stack.append((entry_relpath, entry.path, depth + 1))
+                        elif entry.is_file():
+                            entries[entry_relpath] = (
+                                entry.stat().st_size
+                                if depth == 1 or entry.name in STAT_NAMES
+                                else UNKNOWN_SIZE
+                            )
+                    except FileNotFoundError:
+                        entries.pop(entry_relpath, None)
+                        continue
+                    names.append(entry.name)
+                children[relpath] = tuple(names)
+        return cls(root, entries, children, max_depth, errors)
+
+    def path(self, *parts: str) -> str:
+        """
+        Return the absolute path for a path relative to the dataset root.
+        """
+        return os.path.join(self.root, *parts)
+
+    def is_file(self, *parts: str) -> bool:
+        """
+        Return True if the relative path is a file.
+        """
+        size = self._entries.get("/".join(parts))
+        return size is not None and size != DIR_ENTRY
+
+    def is_dir(self, *parts: str) -> bool:
+        """
+        Return True if the relative path is a directory.
+        """
+        return self._entries.get("/".join(parts)) == DIR_ENTRY
+
+    def getsize(self, *parts: str) -> int:
+        """
+        Return the size of a file at the relative path.
+
+        Raises:
+            FileNotFoundError: If there is no such file in the snapshot.
+        """
+        relpath = "/".join(parts)
+        size = self._entries.get(relpath)
+        if size is None or size == DIR_ENTRY:
+            raise FileNotFoundError(self.path(*parts))
+        if size == UNKNOWN_SIZE:
+            size = os.path.getsize(self.path(*parts))
+            self._entries[relpath] = size
+        return size
+
+    def listdir(self, *parts: str) -> List[str]:
+        """
+        Return the names of the entries in the directory at the relative path.
+
+        Raises:
+            NotADirectoryError: If there is no such directory in the snapshot.
+        """
+        names = self._get_children(*parts)
+        if names is None:
+            raise NotADirectoryError(self.path(*parts))
+        return list(names)
+
+    def count(self, *parts: str) -> int:
+        """
+        Return the number of entries in the directory at the relative path, 0 if there is no such directory.
+        """
+        return len(self._get_children(*parts) or ())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return numbers of indexed files and directories and of directories listed
+        and files stat'ed so far, including lazy reads.
+        """
+        dirs = sum(1 for size in self._entries.values() if size == DIR_ENTRY)
+        return {
+            "files": len(self._entries) - dirs,
+            "dirs": dirs,
+            "listdir_calls": len(self._children),
+            "stat_calls": sum(1 for size in self._entries.values() if size >= 0),
+        }
+
+    def _get_children(self, *parts: str) -> Optional[Tuple[str, ...]]:
+        """
+        Return the children names of a directory, listing it if it was below the scanned depth.
+        """
+        relpath = "/".join(parts)
+        names = self._children.get(relpath)
+        if names is None and self.is_dir(*parts):
+            names = tuple(os.listdir(self.path(*parts)))
+            self._children[relpath] = names
+        return names
+
+    def exist_nonempty(self, *parts: str, type: str = "file") -> bool:
+        """
+        Return True if file or directory at the relative path is non-empty.
+
+        Args:
+            *parts (str): Components of the path relative to the dataset root.
+            type (str, optional): The type of checking ('file' or 'dir'). Defaults to 'file'.
+
+        Returns:
+            bool: True if the specified path is non-empty, False otherwise.
+        """
+        if type == "file":
+            return self.is_file(*parts) and self.getsize(*parts) > 0
+        elif type == "dir":
+            return self.is_dir(*parts) and self.count(*parts) > 0
+        else:
+            raise ValueError
@@ -0,0 +1,315 @@
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+# integrity check modes, `tail` reads the end of every file, `full` decompresses it
+CHECK_MODES = ["tail", "full"]
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+# the empty block bgzip ends every file with
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+# the empty stored block of a deflate sync flush, pigz writes one after every 128 KiB of input
+SYNC_FLUSH = b"\x00\x00\xff\xff"
+# sync flushes tried from the end of a tail as the start of pigz blocks
+MAX_SYNC_FLUSHES = 16
+# bytes read from the end of a file by the tail check
+TAIL_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 20
+
+# `<stem>_1.fastq.gz` as written by fasterq-dump and `<stem>_R1_001.fastq.gz` as by bcl2fastq,
+# index reads such as `_I1` have no mates and are not paired
+MATE_PATTERN = re.compile(
+    r"^(?P<stem>.+?)_(?P<mate>R?[12])(?P<suffix>(?:_\d{3})?\.f(?:ast)?q(?:\.gz)?)$"
+)
+FASTQ_SUFFIXES = (".fastq.gz", ".fq.gz", ".fastq", ".fq")
+
+
+class FastqCheck(NamedTuple):
+    """
+    The result of a FASTQ integrity check.
+
+    `reason` is None if the file is intact or could not be verified, `verified`
+    is False in the latter case. `last_read` is the ID of the last read if the
+    check got to it, so the last reads of mates can be compared.
+    """
+
+    reason: Optional[str]
+    last_read: Optional[str] = None
+    verified: bool = True
+
+    @property
+    def ok(self) -> bool:
+        return self.reason is None
+
+
+def is_fastq(name: str) -> bool:
+    return name.endswith(FASTQ_SUFFIXES)
+
+
+def mate_key(name: str) -> Optional[Tuple[str, str]]:
+    """
+    Return the name of a FASTQ with the mate removed and the mate number, None if the name has no mate.
+    """
+    match = MATE_PATTERN.match(name)
+    if match is None:
+        return None
+    return match.group("stem") + match.group("suffix"), match.group("mate")[-1]
+
+
+def pair_fastqs(names: Iterable[str]) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """
+    Pair R1 and R2 FASTQs of a sample by their names.
+
+    Args:
+        names (Iterable[str]): FASTQ file names.
+
+    Returns:
+        Tuple[List[Tuple[str, str]], List[str]]: Sorted (R1, R2) pairs and sorted names of mates without a pair.
+    """
+    mates: Dict[str, Dict[str, str]] = {}
+    for name in names:
+        key = mate_key(name)
+        if key is not None:
+            mates.setdefault(key[0], {})[key[1]] = name
+    pairs, unpaired = [], []
+    for key in sorted(mates):
+        if len(mates[key]) == 2:
+            pairs.append((mates[key]["1"], mates[key]["2"]))
+        else:
+            unpaired.extend(mates[key].values())
+    return pairs, unpaired
+
+
+def read_id(header: bytes) -> str:
+    """
+    Return the read ID of a FASTQ header without the mate suffix.
+    """
+    name = header[1:].split(maxsplit=1)[0].decode(errors="replace") if header else ""
+    return name[:-2] if name.endswith(("/1", "/2")) else name
+
+
+def last_record(data: bytes, complete: bool) -> FastqCheck:
+    """
+    Check that FASTQ data ends with a complete record.
+
+    Args:
+        data (bytes): The end of a FASTQ file.
+        complete (bool): True if data starts at the beginning of the file.
+
+    Returns:
+        FastqCheck: The result with the ID of the last read.
+    """
+    if not data:
+        return FastqCheck(None if complete else "truncated record")
+    if not data.endswith(b"\n"):
+        return FastqCheck("truncated record")
+    lines = data[:-1].split(b"\n")
+    # the first line of a tail can be a part of a line
+    if len(lines) < (4 if complete else 5):
+        return FastqCheck(None)
+    header, sequence, separator, quality = lines[-4:]
+    if (
+        not header.startswith(b"@")
+        or not separator.startswith(b"+")
+        or len(sequence.rstrip(b"\r")) != len(quality.rstrip(b"\r"))
+    ):
+        return FastqCheck("malformed last record")
+    return FastqCheck(None, read_id(header))
+
+
+def inflate_last_member(tail: bytes) -> Tuple[Optional[bytes], bool]:
+    """
+    Return the data of the last non-empty gzip member that ends at the end of a tail.
+
+    Members are tried from the end of the tail, a member is found if it inflates
+    up to the end of the tail, or up to the BGZF EOF block, with a valid CRC and size.
+
+    Returns:
+        Tuple[Optional[bytes], bool]: The data or None if no member ends at the end
+        of the tail, and whether the tail has a complete member followed by other data.
+    """
+    end = len(tail) - len(BGZF_EOF) if tail.endswith(BGZF_EOF) else len(tail)
+    start = tail.rfind(GZIP_MAGIC, 0, end)
+    members = False
+    while start != -1:
+        inflater = zlib.decompressobj(wbits=31)
+        try:
+            data = inflater.decompress(tail[start:end])
+        except zlib.error:
+            data = None
+        if data and inflater.eof:
+            if not inflater.unused_data:
+                return data, members
+            members = True
+        start = tail.rfind(GZIP_MAGIC, 0, start)
+    return None, members
+
+
+def inflate_after_sync_flush(tail: bytes) -> Optional[bool]:
+    """
+    Check that the deflate stream of a pigz file ends at the gzip trailer of a tail.
+
+    A block after a sync flush starts on a byte boundary, so it can be inflated
+    without the data before it. Back-references to that data read from a dummy
+    dictionary, so the content is not checked. `00 00 ff ff` can occur in any
+    deflate stream, so a sync flush is only trusted as the start of a pigz block
+    if the next two sync flushes follow after the same amount of inflated data,
+    pigz's block size. The stream after it must then end right before the 8 byte
+    trailer.
+
+    Returns:
+        Optional[bool]: None if pigz blocks were not found or the stream after them
+        can't be inflated, whether the stream ends at the trailer otherwise.
+    """
+    flushes = []
+    position = tail.rfind(SYNC_FLUSH, 0, len(tail) - 8)
+    while position != -1:
+        flushes.append(position + len(SYNC_FLUSH))
+        position = tail.rfind(SYNC_FLUSH, 0, position)
+    flushes.reverse()
+    # the last two sync flushes can't start a block followed by two more
+    for idx in range(
+        len(flushes) - 3, max(len(flushes) - 3 - MAX_SYNC_FLUSHES, -1), -1
+    ):
+        start = flushes[idx]
+        inflater = zlib.decompressobj(wbits=-15, zdict=bytes(1 << 15))
+        inflated, sizes = 0, set()
+        try:
+            for end in flushes[idx + 1 :]:
+                inflated += len(inflater.decompress(tail[start:end]))
+                start = end
+                # the next two pigz blocks end after S and 2S bytes of inflated data
+                if inflated and inflated % 2 == 0 and inflated // 2 in sizes:
+                    break
+                sizes.add(inflated)
+            else:
+                continue
+            inflater.decompress(tail[start:])
+        except zlib.error:
+            continue
+        if not inflater.eof:
+            return False
+        return len(inflater.unused_data) == 8 or None
+    return None
+
+
+def check_fastq_tail(path: str, tail_size: int = TAIL_SIZE) -> FastqCheck:
+    """
+    Check the end of a FASTQ file without reading the whole file.
+
+    A BGZF file must end with the EOF block. The last gzip member found in the
+    tail must inflate to the end of the file with a valid CRC and end with a
+    complete FASTQ record. A gzip file with members larger than the tail has no
+    member start in it. If it was written by pigz, the stream after its last sync
+    flushes must end at the trailer. Files written by gzip as a single member can
+    not be checked without inflating them from the start and are not verified,
+    the full check covers them.
+
+    Args:
+        path (str): A path to the FASTQ file.
+        tail_size (int, optional): A number of bytes read from the end. Defaults to TAIL_SIZE.
+
+    Returns:
+        FastqCheck: The result.
+    """
+    size = os.path.getsize(path)
+    # a file that fits in the tail is checked whole
+    if size <= tail_size:
+        return check_fastq_full(path)
+    with open(path, "rb") as file:
+        head = file.read(18)
+        file.seek(size - tail_size)
+        tail = file.read()
+    if not path.endswith(".gz"):
+        return last_record(tail, complete=False)
+    if size < 18 or not head.startswith(GZIP_MAGIC):
+        return FastqCheck("not gzip")
+    bgzf = bool(head[3] & 4) and head[12:14] == b"BC"
+    if bgzf and not tail.endswith(BGZF_EOF):
+        return FastqCheck("no BGZF EOF")
+    data, members = inflate_last_member(tail)
+    if data is not None:
+        return last_record(data, complete=False)
+    # the member after a complete one would be in the tail as well
+    if bgzf or members:
+        return FastqCheck("truncated")
+    synced = inflate_after_sync_flush(tail)
+    if synced is None:
+        return FastqCheck(None, verified=False)
+    return FastqCheck(None if synced else "truncated")
+
+
+def check_fastq_full(path: str) -> FastqCheck:
+    """
+    Check a FASTQ file by decompressing it as a stream, all gzip members must be complete with valid CRCs.
+
+    Args:
+        path (str): A path to the FASTQ file.
+
+    Returns:
+        FastqCheck: The result.
+    """
+    gzipped = path.endswith(".gz")
+    inflater = zlib.decompressobj(wbits=31)
+    lines = 0
+    end = b""
+    with open(path, "rb") as file:
+        if gzipped and file.read(3) != GZIP_MAGIC:
+            return FastqCheck("not gzip")
+        file.seek(0)
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = b""
+            try:
+                while chunk:
+                    if not gzipped:
+                        data, chunk = chunk, b""
+                        break
+                    data += inflater.decompress(chunk)
+                    # concatenated members and BGZF blocks
+                    chunk = inflater.unused_data
+                    if inflater.eof and chunk:
+                        inflater = zlib.decompressobj(wbits=31)
+            except zlib.error as error:
+                return FastqCheck(f"corrupt ({error})")
+            lines += data.count(b"\n")
+            end = (end + data)[-CHUNK_SIZE:]
+    if gzipped and not inflater.eof:
+        return FastqCheck("truncated")
+    result = last_record(end, complete=True)
+    if result.ok and lines % 4:
+        return FastqCheck("incomplete records")
+    return result
+
+
+def check_fastqs(
+    paths: List[str], mode: str = "tail", workers: int = 8
+) -> Dict[str, FastqCheck]:
+    """
+    Check FASTQ files concurrently.
+
+    Reads of the files are bound by filesystem latency and zlib releases the GIL,
+    so the files are checked on a thread pool.
+
+    Args:
+        paths (List[str]): Paths to the FASTQ files.
+        mode (str, optional): One of CHECK_MODES. Defaults to 'tail'.
+        workers (int, optional): A number of files checked concurrently. Defaults to 8.
+
+    Returns:
+        Dict[str, FastqCheck]: Results by path.
+    """
+    check = check_fastq_full if mode == "full" else check_fastq_tail
+
+    def safe_check(path: str) -> FastqCheck:
+        try:
+            return check(path)
+        except OSError as error:
+            return FastqCheck(f"unreadable ({error.strerror})")
+
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        return dict(zip(paths, executor.map(safe_check, paths)))
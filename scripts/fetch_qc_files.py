@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import sqlite3
+import argparse
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from irods import IRODSClient, IRODSError, add_irods_arguments, get_client
+from checksum_cache import md5_file
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Downloads QC files from the iRODS archive concurrently, files downloaded by previous runs are skipped"
+    )
+    parser.add_argument(
+        "--pattern",
+        metavar="<pattern>",
+        type=str,
+        help="Specify an ilocate pattern of data objects to search. Default: /archive/cellgeni/datasets/%%",
+        default="/archive/cellgeni/datasets/%",
+    )
+    parser.add_argument(
+        "--match",
+        metavar="<str>",
+        type=str,
+        help="Specify a substring found data objects should contain. Default: solo_qc",
+        default="solo_qc",
+    )
+    parser.add_argument(
+        "--file_list",
+        metavar="<file>",
+        type=str,
+        help="Specify a file with iRODS paths to download instead of searching the archive. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--outputdir",
+        metavar="<dir>",
+        type=str,
+        help="Specify a path to the output directory. Default: solo_qc_dir",
+        default="solo_qc_dir",
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite manifest of downloaded files. Default: solo_qc_manifest.sqlite",
+        default="solo_qc_manifest.sqlite",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of concurrent downloads. Default: 8",
+        default=8,
+    )
+    add_irods_arguments(parser)
+    return parser
+
+
+class FetchManifest:
+    """
+    A record of downloaded files backed by SQLite.
+
+    A file is considered downloaded while its local copy keeps the size and mtime
+    recorded after the download, so interrupted runs resume without any iRODS call
+    for files that are already there.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS downloads (
+                irods_path TEXT PRIMARY KEY,
+                local_path TEXT NOT NULL,
+                md5 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )
+            """
+        )
+        self._index: Dict[str, Tuple[str, int, int]] = {
+            irods_path: (local_path, size, mtime_ns)
+            for irods_path, local_path, size, mtime_ns in self._connection.execute(
+                "SELECT irods_path, local_path, size, mtime_ns FROM downloads"
+            )
+        }
+
+    def is_downloaded(self, irods_path: str, local_path: str) -> bool:
+        """
+        Return True if a data object was downloaded to a local file that did not change since.
+        """
+        entry = self._index.get(irods_path)
+        if entry is None or entry[0] != local_path:
+            return False
+        try:
+            stat = os.stat(local_path)
+        except FileNotFoundError:
+            return False
+        return entry[1:] == (stat.st_size, stat.st_mtime_ns)
+
+    def record(self, irods_path: str, local_path: str, md5: str) -> None:
+        """
+        Record a downloaded file and commit it.
+        """
+        stat = os.stat(local_path)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?)",
+                (irods_path, local_path, md5, stat.st_size, stat.st_mtime_ns),
+            )
+        self._index[irods_path] = (local_path, stat.st_size, stat.st_mtime_ns)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "FetchManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def fetch_file(client: IRODSClient, irods_path: str, local_path: str) -> str:
+    """
+    Download a data object and validate it against the checksum stored in iRODS.
+
+    The file is downloaded next to the target and renamed once its checksum
+    matches, so a failed download never leaves a partial file behind.
+
+    Args:
+        client (IRODSClient): The iRODS client.
+        irods_path (str): A path to the data object.
+        local_path (str): A path to the local file.
+
+    Returns:
+        str: The MD5 checksum of the file.
+
+    Raises:
+        IRODSError: If the download fails or the checksums do not match.
+    """
+    md5_irods = client.ichksum(irods_path)
+    tmp_path = os.path.join(
+        os.path.dirname(local_path), f".{os.path.basename(local_path)}.tmp"
+    )
+    try:
+        client.iget(irods_path, tmp_path)
+        md5_local = md5_file(tmp_path)
+        if md5_local != md5_irods:
+            raise IRODSError(
+                f"iget {irods_path}: checksum mismatch, iRODS: {md5_irods}, local: {md5_local}"
+            )
+        os.replace(tmp_path, local_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return md5_local
+
+
+def get_local_paths(irods_paths: List[str], outputdir: str) -> Dict[str, str]:
+    """
+    Map data objects to files in the output directory named after them.
+
+    Data objects with a name that is already taken are reported and skipped.
+    """
+    local_paths = {}
+    taken: Dict[str, str] = {}
+    for irods_path in irods_paths:
+        name = os.path.basename(irods_path)
+        if name in taken:
+            print(
+                f"WARNING: {irods_path} is skipped, {name} is already downloaded from {taken[name]}",
+                file=sys.stderr,
+            )
+            continue
+        taken[name] = irods_path
+        local_paths[irods_path] = os.path.join(outputdir, name)
+    return local_paths
+
+
+def main() -> None:
+    """
+    The main entry point for the QC files download script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    client = get_client(args)
+
+    # Find files to download
+    if args.file_list is not None:
+        with open(args.file_list, "r") as file:
+            irods_paths = [line.strip() for line in file if line.strip()]
+    else:
+        print(f"Searching for *{args.match}* files in {args.pattern}...")
+        irods_paths = [
+            path for path in client.ilocate(args.pattern) if args.match in path
+        ]
+    os.makedirs(args.outputdir, exist_ok=True)
+    local_paths = get_local_paths(irods_paths, args.outputdir)
+
+    with FetchManifest(args.manifest) as manifest:
+        pending = [
+            (irods_path, local_path)
+            for irods_path, local_path in local_paths.items()
+            if not manifest.is_downloaded(irods_path, local_path)
+        ]
+        print(
+            f"Total files: {len(local_paths)}, already downloaded: {len(local_paths) - len(pending)}"
+        )
+
+        def fetch(item: Tuple[str, str]) -> Optional[str]:
+            irods_path, local_path = item
+            try:
+                return fetch_file(client, irods_path, local_path)
+            except (IRODSError, OSError) as error:
+                print(f"ERROR: {error}", file=sys.stderr)
+                return None
+
+        failed = 0
+        with ThreadPoolExecutor(args.workers) as executor:
+            for (irods_path, local_path), md5 in zip(
+                pending, executor.map(fetch, pending)
+            ):
+                if md5 is None:
+                    failed += 1
+                    continue
+                manifest.record(irods_path, local_path, md5)
+                print(f"Downloaded: {os.path.basename(local_path)}", file=sys.stderr)
+
+    print(f"Download complete! DOWNLOADED: {len(pending) - failed}, FAILED: {failed}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,49 +19,17 @@ if [[ ! -f "$input_file" ]]; then
   exit 1
 fi
 
-# 2) Initialize/empty the output files
->"$filter_file"
->"$pass_samples_file"
->"$failed_file"
-
-# 3) Loop over each dataset directory from input_file
-while IFS= read -r dataset_dir; do
-  # Use find to locate solo_qc.tsv anywhere *inside* this dataset directory
-  # -print -quit stops at the first match found
-  solo_qc_file="$(find "$dataset_dir" -type f -name "*solo*qc.tsv" -print -quit || true)"
-
-  # If find returned nothing, the dataset is considered "completely failed"
-  if [[ -z "$solo_qc_file" ]]; then
-    echo "ERROR: Could not find solo_qc.tsv in $dataset_dir"
-    echo "$dataset_dir" >>"$failed_file"
-    continue
-  fi
-
-  # Extract samples with no empty columns (ignoring header line)
-  pass_samples="$(awk -F'\t' 'NR>1 {
-    missing=0
-    for(i=1; i<=NF; i++){
-      if($i == ""){
-        missing=1
-        break
-      }
-    }
-    if(!missing) print $1
-  }' "$solo_qc_file")"
-
-  # If no samples pass, dataset is failed
-  if [[ -z "$pass_samples" ]]; then
-    echo "$dataset_dir" >>"$failed_file"
-  else
-    # Otherwise, record the dataset in filter_file
-    echo "$dataset_dir" >>"$filter_file"
-    # And append each passing sample to pass_samples_file
-    while IFS= read -r sample; do
-      echo "$sample" >>"$pass_samples_file"
-    done <<<"$pass_samples"
-  fi
-
-done <"$input_file"
+# Set script PATHS
+gate_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/qc_gate.py
+
+# 2) Gate samples of all solo_qc.tsv files at once, a sample passes if none of its values is missing,
+# datasets without a solo_qc.tsv file or passing samples are considered "completely failed"
+$gate_script "$input_file" \
+  --qc_rules complete \
+  --output "${filter_file%.*}.qc_gate.tsv" \
+  --passed_datasets "$filter_file" \
+  --passed_samples "$pass_samples_file" \
+  --failed_datasets "$failed_file"
 
 # Print filtering stats
 all_datasets_count="$(wc -l <"$input_file")"
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
 import os
-from typing import Dict, List, Any, Tuple
+import sys
+import json
+from typing import Dict, List, Any, Optional, Tuple
 import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from qc_rules import READS_RULES, Rule, add_rules_argument, load_rules
+from metrics import add_metrics_arguments, metrics
 
 # GLOBAL VARIABLES
 TARGET_KEYS = [
@@ -21,6 +27,14 @@ SPECIES_CONVERT = {"Human": "Homo sapiens", "Mouse": "Mus musculus"}
 
 KEY_CONVERT = {"Rd_all": "total_reads", "WL": "whitelist"}
 
+SUMMARY_COLUMNS = ["dataset", "status", "samples", "error"]
+
+
+class MetadataMismatchError(ValueError):
+    """
+    Raised when samples of solo_qc.tsv are missing from accessions.tsv
+    """
+
 
 def init_parser() -> argparse.ArgumentParser:
     """
@@ -32,7 +46,30 @@ def init_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "sourcedir",
         type=str,
+        nargs="?",
         help="Specify a path to the directory to be you want to get metadata from",
+        default=None,
+    )
+    parser.add_argument(
+        "--dataset_list",
+        metavar="<file>",
+        type=str,
+        help="Specify a file with a list of dataset directories (e.g. passlist.txt written by qc_reprocessing.py) to get metadata from instead of a single sourcedir",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of datasets processed in parallel with --dataset_list. Default: 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--summary",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the summary of datasets processed with --dataset_list. Default: metadata_summary.tsv",
+        default="metadata_summary.tsv",
     )
     parser.add_argument(
         "--outputdir",
@@ -48,6 +85,15 @@ def init_parser() -> argparse.ArgumentParser:
         help="Specify a separator for metadata files. Default: \\t",
         default="\t",
     )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["tsv", "jsonl"],
+        help="Specify an output format: a metadata file per sample or a single JSON lines file {dataset}.metadata.jsonl with a record per sample. Default: tsv",
+        default="tsv",
+    )
+    add_rules_argument(parser, "reads")
+    add_metrics_arguments(parser)
     return parser
 
 
@@ -69,19 +115,6 @@ def accessions_row_to_meta(row: str) -> Dict[str, List]:
     return sample_dict
 
 
-def solo_qc_row_to_meta(header: List[str], row: str) -> Dict[str, str]:
-    """
-    A row from solo_qc.tsv file is converted to Dict
-    Args:
-        header (List[str]): header of solo_qc.tsv file
-        row (str): a row of solo_qc.tsv file
-
-    Returns:
-        Dict[str, str]: a dict with a row metadata from solo_qc.tsv file
-    """
-    return dict(zip(header[1:], row[1:]))
-
-
 def get_accessions_meta(accessions_file: str, sep="\t") -> Dict[str, Dict]:
     """
     Convert accessions.tsv file's rows to Dict
@@ -103,27 +136,112 @@ def get_accessions_meta(accessions_file: str, sep="\t") -> Dict[str, Dict]:
     return samples
 
 
-def get_solo_qc_meta(solo_qc_file: str, sep="\t") -> Dict[str, Dict]:
+def get_solo_qc_meta(
+    solo_qc_file: str, sep="\t", qc_rules: Optional[List[Rule]] = None
+) -> Dict[str, Dict]:
     """
     Convert solo_qc.tsv file's rows to Dict
     Args:
         solo_qc_file (str): a path to solo_qc.tsv file
         sep (str, optional): separator used to split solo_qc.tsv file. Defaults to '\t'.
+        qc_rules (Optional[List[Rule]], optional): rules samples must pass, READS_RULES if None. Defaults to None.
 
     Returns:
         Dict[str, Dict]: a dict with metadata from rows of solo_qc.tsv file
     """
-    with open(solo_qc_file, "r") as file:
-        header = file.readline().rstrip().split(sep)
-        # split line and remove \n
-        lines = [line.rstrip().split(sep) for line in file.readlines()]
-        # convert to Dict[sample, meta]
-        meta = {line[0]: solo_qc_row_to_meta(header, line) for line in lines}
-        # filter out failed samples
-        meta_filtered = {
-            key: value for key, value in meta.items() if value["Rd_all"].isdigit()
-        }
-    return meta_filtered
+    # numpy is only imported once a QC file is read
+    from qc_gate import QCTable, gate
+
+    table = QCTable.read([(os.path.dirname(solo_qc_file), solo_qc_file)], sep=sep)
+    # convert to Dict[sample, meta] and filter out failed samples
+    passed = gate(
+        table, READS_RULES if qc_rules is None else qc_rules
+    ).passed.nonzero()[0]
+    return dict(zip(table.samples[passed].tolist(), table.records(passed)))
+
+
+def get_sample_meta(
+    source_dir: str, qc_rules: Optional[List[Rule]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Merge accessions.tsv and solo_qc.tsv metadata of the samples of a dataset
+    Args:
+        source_dir (str): a path to the dataset directory
+        qc_rules (Optional[List[Rule]], optional): rules samples must pass, READS_RULES if None. Defaults to None.
+
+    Returns:
+        List[Dict[str, Any]]: a list with metadata entries for each sample, the sample directory is saved under `dirname`
+
+    Raises:
+        MetadataMismatchError: if samples of solo_qc.tsv are missing from accessions.tsv
+    """
+    # get source dir path and dataset name
+    source_dir = source_dir.rstrip("/")
+    dataset = os.path.basename(source_dir)
+
+    # get paths of files with metadata
+    accessions_file = os.path.join(source_dir, f"{dataset}.accessions.tsv")
+    solo_qc_file = os.path.join(source_dir, f"{dataset}.solo_qc.tsv")
+
+    # get meta from metadata files
+    with metrics.stage("metadata.read_accessions", dataset) as stage:
+        accessions_meta = get_accessions_meta(accessions_file)
+        stage.add_files(accessions_file)
+        stage.add(rows=len(accessions_meta))
+    with metrics.stage("metadata.read_solo_qc", dataset) as stage:
+        solo_qc_meta = get_solo_qc_meta(solo_qc_file, qc_rules=qc_rules)
+        stage.add_files(solo_qc_file)
+        stage.add(rows=len(solo_qc_meta))
+
+    # report all samples without accessions at once instead of failing on the first one
+    missing = [key for key in solo_qc_meta.keys() if key not in accessions_meta]
+    if missing:
+        raise MetadataMismatchError(
+            f"{len(missing)} samples of {solo_qc_file} are missing from {accessions_file}: {', '.join(missing)}"
+        )
+
+    # concatenate dicts
+    return [
+        dict(dirname=key, **accessions_meta[key], **solo_qc_meta[key])
+        for key in solo_qc_meta.keys()
+    ]
+
+
+def filter_meta(
+    sample_meta: Dict[str, Any], target_keys: List[str], key_convert: Dict[str, str]
+) -> Dict[str, Any]:
+    """
+    Keep target keys of a sample metadata entry and convert them to the names used in iRODS
+    Args:
+        sample_meta (Dict[str, Any]): a metadata entry of a sample
+        target_keys (List[str]): a list of keys that should be included in the result
+        key_convert (Dict[str, str]): a dict to map names from meta to the target names
+
+    Returns:
+        Dict[str, Any]: a dict with filtered metadata, several values of the same key are kept in a list
+    """
+    # filter redundunt keys, change key names if neccessary and convert keys to lower case
+    filtered_meta = {
+        key_convert.get(key, key).lower(): value
+        for key, value in sample_meta.items()
+        if key in target_keys
+    }
+    # convert species names
+    filtered_meta["species"] = SPECIES_CONVERT.get(
+        filtered_meta["species"], filtered_meta["species"]
+    )
+    return filtered_meta
+
+
+def meta_to_pairs(filtered_meta: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Convert filtered metadata to key/value pairs (if there are several values for the same key then several pairs are created)
+    """
+    return [
+        (key, f"{val}")
+        for key, values in filtered_meta.items()
+        for val in (values if isinstance(values, list) else [values])
+    ]
 
 
 def write_meta(
@@ -145,21 +263,12 @@ def write_meta(
     for sample_meta in meta:
         # get sample accession number
         dirname = sample_meta["dirname"]
-        # filter redundunt keys, change key names if neccessary and convert keys to lower case
-        filtered_meta = {
-            key_convert.get(key, key).lower(): value
-            for key, value in sample_meta.items()
-            if key in target_keys
-        }
-        # convert species names
-        filtered_meta["species"] = SPECIES_CONVERT.get(
-            filtered_meta["species"], filtered_meta["species"]
-        )
-        # convert dict into lines (if there are several values for the same key then several lines are created)
+        # convert metadata into lines
         lines = [
             f"{key}{sep}{val}\n"
-            for key, values in filtered_meta.items()
-            for val in (values if isinstance(values, list) else [values])
+            for key, val in meta_to_pairs(
+                filter_meta(sample_meta, target_keys, key_convert)
+            )
         ]
         # get a filepath to metadata
         filepath = os.path.join(output_dir, f"{dirname}.tsv")
@@ -168,34 +277,156 @@ def write_meta(
             file.writelines(lines)
 
 
+def write_meta_jsonl(
+    meta: List[Dict],
+    filepath: str,
+    target_keys: List[str],
+    key_convert: Dict[str, str],
+) -> None:
+    """
+    Writes metadata from `meta` list to a single JSON lines file
+    Args:
+        meta (Dict[str, Any]): a list with metadata entries for each sample
+        filepath (str): a path to the output file
+        target_keys (List[str]): a list of keys that should be included in resulting file
+        key_convert (Dict[str, str]): a dict to map names from meta to the target names
+    """
+    with open(filepath, "w") as file:
+        for sample_meta in meta:
+            record = {
+                "dirname": sample_meta["dirname"],
+                "meta": filter_meta(sample_meta, target_keys, key_convert),
+            }
+            file.write(json.dumps(record) + "\n")
+
+
+def read_meta_jsonl(filepath: str) -> List[Dict[str, Any]]:
+    """
+    Read records written by `write_meta_jsonl`
+    Args:
+        filepath (str): a path to the JSON lines file
+
+    Returns:
+        List[Dict[str, Any]]: a list of records with `dirname` and filtered `meta`
+    """
+    with open(filepath, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_dataset_meta(
+    source_dir: str,
+    output_dir: str,
+    format: str = "tsv",
+    sep="\t",
+    qc_rules: Optional[List[Rule]] = None,
+) -> int:
+    """
+    Get metadata of a dataset and write it in the requested format
+    Args:
+        source_dir (str): a path to the dataset directory
+        output_dir (str): a path to output dir
+        format (str, optional): 'tsv' for a file per sample or 'jsonl' for {dataset}.metadata.jsonl. Defaults to 'tsv'.
+        sep (str, optional): a separator used to write metadata files. Defaults to '\t'.
+        qc_rules (Optional[List[Rule]], optional): rules samples must pass, READS_RULES if None. Defaults to None.
+
+    Returns:
+        int: a number of samples written
+    """
+    dataset = os.path.basename(source_dir.rstrip("/"))
+    meta = get_sample_meta(source_dir, qc_rules)
+    os.makedirs(output_dir, exist_ok=True)
+    with metrics.stage("metadata.write", dataset, rows=len(meta)):
+        if format == "jsonl":
+            filepath = os.path.join(output_dir, f"{dataset}.metadata.jsonl")
+            write_meta_jsonl(meta, filepath, TARGET_KEYS, KEY_CONVERT)
+        else:
+            write_meta(meta, output_dir, TARGET_KEYS, KEY_CONVERT, sep=sep)
+    return len(meta)
+
+
+def process_dataset(
+    source_dir: str,
+    output_dir: str,
+    format: str = "tsv",
+    sep="\t",
+    qc_rules: Optional[List[Rule]] = None,
+) -> Dict[str, Any]:
+    """
+    Write metadata of a dataset of a dataset list and return its summary row
+    Args:
+        source_dir (str): a path to the dataset directory
+        output_dir (str): a path to output dir, per sample files are written to its `{dataset}` subdirectory
+        format (str, optional): 'tsv' for a file per sample or 'jsonl' for {dataset}.metadata.jsonl. Defaults to 'tsv'.
+        sep (str, optional): a separator used to write metadata files. Defaults to '\t'.
+        qc_rules (Optional[List[Rule]], optional): rules samples must pass, READS_RULES if None. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: a dict with SUMMARY_COLUMNS keys
+    """
+    dataset = os.path.basename(source_dir.rstrip("/"))
+    if format == "tsv":
+        output_dir = os.path.join(output_dir, dataset)
+    summary = {"dataset": dataset, "status": "success", "samples": 0, "error": "-"}
+    try:
+        summary["samples"] = write_dataset_meta(
+            source_dir, output_dir, format, sep, qc_rules
+        )
+    except MetadataMismatchError as e:
+        summary.update(status="mismatch", error=str(e))
+    except Exception as e:
+        summary.update(status="fail", error=f"{type(e).__name__}: {e}")
+    return summary
+
+
 def main():
     # parse script arguments
     parser = init_parser()
     args = parser.parse_args()
+    metrics.configure(args.metrics)
+    if (args.sourcedir is None) == (args.dataset_list is None):
+        parser.error("specify either sourcedir or --dataset_list")
+    qc_rules = load_rules(args.qc_rules)
 
-    # get source dir path and dataset name
-    source_dir = args.sourcedir.rstrip("/")
-    dataset = os.path.basename(source_dir)
-
-    # get paths of files with metadata
-    accessions_file = os.path.join(source_dir, f"{dataset}.accessions.tsv")
-    solo_qc_file = os.path.join(source_dir, f"{dataset}.solo_qc.tsv")
-
-    # get meta from metadata files
-    accessions_meta = get_accessions_meta(accessions_file)
-    solo_qc_meta = get_solo_qc_meta(solo_qc_file)
+    # a single dataset is written to the output directory and errors are raised
+    if args.sourcedir is not None:
+        write_dataset_meta(
+            args.sourcedir, args.outputdir, args.format, args.sep, qc_rules
+        )
+        return
 
-    # concatenate dicts
-    meta = [
-        dict(dirname=key, **accessions_meta[key], **solo_qc_meta[key])
-        for key in solo_qc_meta.keys()
-    ]
+    # get dataset paths
+    with open(args.dataset_list, "r") as file:
+        source_dirs = [line.strip() for line in file if line.strip()]
 
-    # make output directory
-    os.makedirs(args.outputdir, exist_ok=True)
+    # process datasets in parallel, results keep the order of the list
+    process = partial(
+        process_dataset,
+        output_dir=args.outputdir,
+        format=args.format,
+        sep=args.sep,
+        qc_rules=qc_rules,
+    )
+    if args.workers > 1:
+        with ProcessPoolExecutor(
+            args.workers, initializer=metrics.configure, initargs=(args.metrics,)
+        ) as executor:
+            summaries = list(executor.map(process, source_dirs))
+    else:
+        summaries = list(map(process, source_dirs))
 
-    # write metadata
-    write_meta(meta, args.outputdir, TARGET_KEYS, KEY_CONVERT, sep=args.sep)
+    # write summary and report failed datasets
+    with open(args.summary, "w") as file:
+        file.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        for summary in summaries:
+            file.write("\t".join(str(summary[col]) for col in SUMMARY_COLUMNS) + "\n")
+            if summary["status"] != "success":
+                print(
+                    f"ERROR: {summary['dataset']}: {summary['error']}", file=sys.stderr
+                )
+    failed = sum(summary["status"] != "success" for summary in summaries)
+    print(
+        f"Metadata written for {len(summaries) - failed} of {len(summaries)} datasets. Summary saved to {args.summary}"
+    )
 
 
 if __name__ == "__main__":
@@ -1,22 +1,8 @@
 #!/bin/bash
 
-# Find all *solo_qc* files in the archive
-echo "Searching for *solo_qc* files in the archive..."
-ilocate /archive/cellgeni/datasets/% | grep solo_qc > solo_qc.list
+# Set script PATHS
+fetch_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/fetch_qc_files.py
 
-# Create a directory to store the files
-mkdir -p solo_qc_dir
-
-# Count total files first
-total=$(wc -l < solo_qc.list)
-
-# Use pv to show progress
-echo "Total files to download: $total"
-echo "Starting download..."
-cat solo_qc.list | pv -l -e -r -s $total | while read file; do
-    iget -K -f "$file" ./solo_qc_dir/
-    echo "Downloaded: $(basename "$file")" >&2
-done
-
-echo  # New line after completion
-echo "Download complete!"
\ No newline at end of file
+# Find all *solo_qc* files in the archive and download them concurrently,
+# files downloaded by previous runs are skipped
+$fetch_script --pattern "/archive/cellgeni/datasets/%" --match solo_qc --outputdir solo_qc_dir "$@"
@@ -2,8 +2,18 @@
 
 import os
 import sys
+import csv
+import pickle
 import argparse
-import pandas as pd
+import tempfile
+from typing import Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from solo_qc import SoloQCReader
+
+# columns added to every QC file
+EXTRA_COLUMNS = ["dataset", "directory"]
+# columns of the successful samples list
+LIST_COLUMNS = ["Sample", "dataset", "directory"]
 
 
 def init_parser() -> argparse.ArgumentParser:
@@ -39,9 +49,65 @@ def init_parser() -> argparse.ArgumentParser:
         help='Specify a separator for metadata files. Default: ","',
         default=",",
     )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of QC files read in parallel. Default: 4",
+        default=4,
+    )
+    parser.add_argument(
+        "--batch_size",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of QC files held in memory at once. Default: 100",
+        default=100,
+    )
     return parser
 
 
+def union_columns(headers: Iterable[List[str]]) -> List[str]:
+    """
+    Return columns of all QC files with complete rows in the order pd.concat would put them
+    """
+    columns = {}
+    for header in headers:
+        columns.update(dict.fromkeys(header + EXTRA_COLUMNS))
+    return list(columns)
+
+
+def read_successful_samples(
+    dataset: str, filepath: str
+) -> Tuple[List[str], List[List[str]]]:
+    """
+    Read complete rows of a QC file in a single pass, raw values are kept as they are
+    Args:
+        dataset (str): a dataset name
+        filepath (str): a path to the QC file
+
+    Returns:
+        Tuple[List[str], List[List[str]]]: the header and fields of every complete row followed by EXTRA_COLUMNS values
+    """
+    extra = [dataset, os.path.dirname(filepath)]
+    with SoloQCReader(filepath) as reader:
+        rows = [row.fields + extra for row in reader if row.complete]
+    return reader.header, rows
+
+
+def select_columns(
+    header: List[str], rows: List[List[str]], columns: List[str]
+) -> List[List[str]]:
+    """
+    Return values of `columns` of rows read by read_successful_samples, empty if the file lacks some of the columns
+    """
+    # rows of files without some of the columns would have missing values
+    if not set(columns).issubset(header + EXTRA_COLUMNS):
+        return []
+    positions = {column: idx for idx, column in enumerate(header + EXTRA_COLUMNS)}
+    order = [positions[column] for column in columns]
+    return [[values[idx] for idx in order] for values in rows]
+
+
 def main():
     # Parse arguments
     parser = init_parser()
@@ -53,40 +119,49 @@ def main():
             file_list = file.readlines()
             file_list = [line.strip().split(args.sep) for line in file_list]
 
-    # Read files to dataframe
-    dataframe_list = []
+    # Check if the files exist
     for dataset, filepath in file_list:
-        # Check if the file exists
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"File {filepath} does not exist.")
-        # Read the file into a DataFrame
-        df = pd.read_csv(filepath, sep="\t")
-        if not df.empty:
-            # Add a column with the dataset name and directory path
-            df["dataset"] = dataset
-            df["directory"] = os.path.dirname(filepath)
-            # Append the DataFrame to the list
-            dataframe_list.append(df)
-
-    # Concatenate all DataFrames into a single DataFrame
-    if len(dataframe_list) == 0:
-        print("No successful samples found.")
-        sys.exit(0)
-
-    successful_samples = pd.concat(dataframe_list, ignore_index=True, axis=0)
-
-    # Filter samples with NaN values
-    successful_samples = successful_samples.dropna()
-
-    # Split dataframe in two
-    successful_samples_list = successful_samples[
-        ["Sample", "dataset", "directory"]
-    ].copy()
-    filtered_qc = successful_samples.iloc[:, :-2].copy()
-
-    # Save files
-    successful_samples_list.to_csv(args.output, sep="\t", index=False, header=False)
-    filtered_qc.to_csv(args.filtered_qc, sep="\t", index=False)
+
+    # Every file is read once, in batches. Output columns are the union of the
+    # columns of all files, so complete rows are spooled to a temporary file next
+    # to the output until the last file is read.
+    headers = []
+    spool_dir = os.path.dirname(os.path.abspath(args.output))
+    with tempfile.TemporaryFile(dir=spool_dir) as spool:
+        with ThreadPoolExecutor(args.workers) as executor:
+            for start in range(0, len(file_list), args.batch_size):
+                batch = file_list[start : start + args.batch_size]
+                for header, rows in executor.map(
+                    lambda item: read_successful_samples(*item), batch
+                ):
+                    if rows:
+                        headers.append(header)
+                        pickle.dump((header, rows), spool)
+        columns = union_columns(headers)
+        if len(columns) == 0:
+            print("No successful samples found.")
+            sys.exit(0)
+        list_positions = [columns.index(column) for column in LIST_COLUMNS]
+        filtered_columns = columns[:-2]
+
+        # Append complete rows of files with all the columns to both outputs
+        spool.seek(0)
+        with open(args.output, "w", newline="") as output, open(
+            args.filtered_qc, "w", newline=""
+        ) as filtered_qc:
+            output_writer = csv.writer(output, delimiter="\t", lineterminator="\n")
+            filtered_writer = csv.writer(
+                filtered_qc, delimiter="\t", lineterminator="\n"
+            )
+            filtered_writer.writerow(filtered_columns)
+            for _ in headers:
+                rows = select_columns(*pickle.load(spool), columns)
+                output_writer.writerows(
+                    [row[idx] for idx in list_positions] for row in rows
+                )
+                filtered_writer.writerows(row[: len(filtered_columns)] for row in rows)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_HEADER = [
+    "DATASET",
+    "COMPLETED",
+    "START_TIME",
+    "TERMINATE_TIME",
+    "LOG_PATH",
+    "ERROR_PATH",
+]
+
+SUCCESS_PATTERN = "Successfully completed."
+JOB_ID_PATTERN = re.compile(r"\d+\.\d+")
+DATASET_PATTERN = re.compile(r"Using file ([^ ]*)_subset\.txt")
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Summarises reprocessing and transfer job logs, every log is read once and logs parsed by previous runs are skipped"
+    )
+    parser.add_argument(
+        "logdir",
+        metavar="<dir>",
+        type=str,
+        nargs="?",
+        help="Specify a path to the directory with reprocessOutput*.log and reprocessError*.log files and dataset directories",
+    )
+    parser.add_argument(
+        "--transfer_dir",
+        metavar="<dir>",
+        type=str,
+        help="Specify a directory to search for transferOutput*.log files in, including all its subdirectories. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--summary",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the summary of reprocessing jobs. Default: logs/job_summary.tsv",
+        default="logs/job_summary.tsv",
+    )
+    parser.add_argument(
+        "--completed_list",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of dataset directories logs were copied to. Default: logs/completed_list.txt",
+        default="logs/completed_list.txt",
+    )
+    parser.add_argument(
+        "--failed_list",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of transfer logs without 'Successfully completed.'. Default: logs/failed_logs.txt",
+        default="logs/failed_logs.txt",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite index of parsed logs. Default: logs/log_index.sqlite",
+        default="logs/log_index.sqlite",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of logs read in parallel. Default: 8",
+        default=8,
+    )
+    return parser
+
+
+class LogRecord(NamedTuple):
+    """
+    Fields of a job log, empty strings stand for lines that were not found.
+    """
+
+    start_time: str
+    terminate_time: str
+    completed: bool
+    dataset: Optional[str]
+
+
+def parse_log(filepath: str) -> LogRecord:
+    """
+    Read a job log once and extract its fields.
+
+    The first `Started at`, `Terminated at` and `Using file <dataset>_subset.txt`
+    lines are used. A job is completed if any line contains `Successfully completed.`.
+
+    Args:
+        filepath (str): A path to the log.
+
+    Returns:
+        LogRecord: The fields of the log, dataset is None if the log does not name it.
+    """
+    start_time = terminate_time = ""
+    completed = False
+    dataset = None
+    with open(filepath, "r", errors="replace") as file:
+        for line in file:
+            if not start_time and line.startswith("Started at "):
+                start_time = line[len("Started at ") :].rstrip("\n")
+            elif not terminate_time and line.startswith("Terminated at "):
+                terminate_time = line[len("Terminated at ") :].rstrip("\n")
+            if not completed and SUCCESS_PATTERN in line:
+                completed = True
+            if dataset is None and "Using file " in line:
+                match = DATASET_PATTERN.search(line)
+                if match:
+                    dataset = match.group(1)
+    return LogRecord(start_time, terminate_time, completed, dataset)
+
+
+class LogIndex:
+    """
+    Parsed logs backed by SQLite.
+
+    A log is parsed again only if its size or mtime changed since it was indexed,
+    so logs of finished jobs are read once across all runs.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS logs (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        self._index: Dict[str, Tuple[int, int, LogRecord]] = {
+            path: (size, mtime_ns, LogRecord(*json.loads(record)))
+            for path, size, mtime_ns, record in self._connection.execute(
+                "SELECT path, size, mtime_ns, record FROM logs"
+            )
+        }
+
+    def lookup(self, path: str, stat: os.stat_result) -> Optional[LogRecord]:
+        """
+        Return the indexed record of a log if the log did not change.
+        """
+        entry = self._index.get(path)
+        if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return entry[2]
+
+    def update(self, records: List[Tuple[str, os.stat_result, LogRecord]]) -> None:
+        """
+        Index parsed logs and commit them.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?)",
+                [
+                    (path, stat.st_size, stat.st_mtime_ns, json.dumps(record))
+                    for path, stat, record in records
+                ],
+            )
+        for path, stat, record in records:
+            self._index[path] = (stat.st_size, stat.st_mtime_ns, record)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "LogIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def list_reprocess_logs(logdir: str) -> List[str]:
+    """
+    Return sorted paths of reprocessOutput*.log files directly in a directory.
+    """
+    with os.scandir(logdir) as iterator:
+        return sorted(
+            entry.path
+            for entry in iterator
+            if entry.name.startswith("reprocessOutput")
+            and entry.name.endswith(".log")
+            and entry.is_file()
+        )
+
+
+def find_transfer_logs(directory: str) -> List[str]:
+    """
+    Return sorted paths of transferOutput*.log files in a directory and all its subdirectories.
+    """
+    paths = []
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif (
+                    entry.name.startswith("transferOutput")
+                    and entry.name.endswith(".log")
+                    and entry.is_file()
+                ):
+                    paths.append(entry.path)
+    return sorted(paths)
+
+
+def error_log_path(logdir: str, output_log: str) -> str:
+    """
+    Return the path of the error log of a job named after the job ID in its output log name.
+    """
+    match = JOB_ID_PATTERN.search(os.path.basename(output_log))
+    job_id = match.group(0) if match else ""
+    return os.path.join(logdir, f"reprocessError{job_id}.log")
+
+
+def parse_logs(
+    paths: List[str], index: LogIndex, workers: int = 8
+) -> Tuple[Dict[str, LogRecord], Set[str]]:
+    """
+    Return records of logs, parsing in parallel only the logs that are not indexed.
+
+    Args:
+        paths (List[str]): Paths to existing logs.
+        index (LogIndex): The index of parsed logs.
+        workers (int, optional): A number of logs read in parallel. Defaults to 8.
+
+    Returns:
+        Tuple[Dict[str, LogRecord], Set[str]]: Records of the logs and paths of the logs parsed by this call.
+    """
+    records = {}
+    pending = []
+    for path in paths:
+        stat = os.stat(path)
+        record = index.lookup(path, stat)
+        if record is None:
+            pending.append((path, stat))
+        else:
+            records[path] = record
+    with ThreadPoolExecutor(workers) as executor:
+        parsed = list(executor.map(parse_log, [path for path, _ in pending]))
+    index.update(
+        [(path, stat, record) for (path, stat), record in zip(pending, parsed)]
+    )
+    records.update((path, record) for (path, _), record in zip(pending, parsed))
+    return records, {path for path, _ in pending}
+
+
+def summarise_jobs(
+    logdir: str, output_logs: List[str], records: Dict[str, LogRecord]
+) -> Iterator[Tuple[List[str], Optional[str]]]:
+    """
+    Yield summary rows of reprocessing jobs with the dataset directories their logs belong to.
+
+    A job belongs to a dataset if it started, its error log names the dataset and
+    the dataset directory exists in the log directory.
+
+    Yields:
+        Tuple[List[str], Optional[str]]: A row with SUMMARY_HEADER columns and the dataset directory or None.
+    """
+    for output_log in output_logs:
+        error_log = error_log_path(logdir, output_log)
+        output_record = records[output_log]
+        dataset_dir = None
+        if error_log in records:
+            dataset = records[error_log].dataset or ""
+            if (
+                dataset
+                and output_record.start_time
+                and os.path.isdir(os.path.join(logdir, dataset))
+            ):
+                dataset_dir = os.path.join(logdir, dataset)
+        else:
+            dataset = "Unknown"
+        row = [
+            dataset,
+            "Yes" if output_record.completed else "No",
+            output_record.start_time,
+            output_record.terminate_time,
+            output_log,
+            error_log,
+        ]
+        yield row, dataset_dir
+
+
+def copy_logs(paths: List[str], dataset_dir: str, changed: bool) -> None:
+    """
+    Copy logs to a dataset directory, unless they are there and did not change.
+    """
+    for path in paths:
+        target = os.path.join(dataset_dir, os.path.basename(path))
+        if changed or not os.path.exists(target):
+            shutil.copyfile(path, target)
+
+
+def main() -> None:
+    """
+    The main entry point for the log harvesting script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.logdir is None and args.transfer_dir is None:
+        parser.error("specify logdir, --transfer_dir or both")
+
+    # find logs, error logs of reprocessing jobs are named after their output logs
+    output_logs, error_logs, transfer_logs = [], [], []
+    if args.logdir is not None:
+        logdir = args.logdir.rstrip("/") or "/"
+        output_logs = list_reprocess_logs(logdir)
+        error_logs = [
+            path
+            for path in (error_log_path(logdir, log) for log in output_logs)
+            if os.path.isfile(path)
+        ]
+    if args.transfer_dir is not None:
+        transfer_logs = find_transfer_logs(args.transfer_dir)
+
+    os.makedirs(os.path.dirname(args.index) or ".", exist_ok=True)
+    with LogIndex(args.index) as index:
+        all_logs = output_logs + error_logs + transfer_logs
+        records, changed = parse_logs(all_logs, index, args.workers)
+    print(
+        f"Logs: {len(all_logs)}, parsed: {len(changed)}, skipped: {len(all_logs) - len(changed)}",
+        file=sys.stderr,
+    )
+
+    # reprocessing jobs
+    if args.logdir is not None:
+        for filepath in (args.summary, args.completed_list):
+            os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        with open(args.summary, "w") as summary, open(
+            args.completed_list, "w"
+        ) as completed_list:
+            summary.write("\t".join(SUMMARY_HEADER) + "\n")
+            for row, dataset_dir in summarise_jobs(logdir, output_logs, records):
+                if dataset_dir is not None:
+                    logs = row[4:]
+                    copy_logs(logs, dataset_dir, any(log in changed for log in logs))
+                    completed_list.write(dataset_dir + "\n")
+                summary.write("\t".join(row) + "\n")
+        print(
+            f"Parsing complete. Results written to {args.summary}. Completed list is in {args.completed_list}"
+        )
+
+    # transfer jobs
+    if args.transfer_dir is not None:
+        os.makedirs(os.path.dirname(args.failed_list) or ".", exist_ok=True)
+        failed = [path for path in transfer_logs if not records[path].completed]
+        with open(args.failed_list, "w") as file:
+            file.write("".join(f"{path}\n" for path in failed))
+        print(f"Total output*.log files: {len(transfer_logs)}")
+        print(
+            f"Files containing '{SUCCESS_PATTERN}': {len(transfer_logs) - len(failed)}"
+        )
+        print(
+            f"Files do not contain '{SUCCESS_PATTERN}': {len(failed)}. List saved to {args.failed_list}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+import os
+import abc
+import time
+import random
+import shutil
+import sqlite3
+import fnmatch
+import hashlib
+import argparse
+import threading
+import subprocess
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class IRODSError(Exception):
+    """
+    Raised when an iRODS operation fails.
+    """
+
+
+class AVUOperation(NamedTuple):
+    """
+    A metadata change of a collection: `set` replaces all values of an attribute,
+    `add` adds a value next to the existing ones.
+    """
+
+    operation: str
+    attribute: str
+    value: str
+
+
+class IRODSClient(abc.ABC):
+    """
+    The iRODS operations used by the transfer scripts.
+    """
+
+    @abc.abstractmethod
+    def imkdir(self, collection: str) -> None:
+        """
+        Create a collection and all its parents.
+        """
+
+    @abc.abstractmethod
+    def iput(
+        self,
+        local_path: str,
+        irods_path: str,
+        metadata: Optional[Dict[str, str]] = None,
+        restart_file: Optional[str] = None,
+    ) -> None:
+        """
+        Upload a local file to iRODS, overwriting an existing data object, and attach metadata to it.
+        """
+
+    @abc.abstractmethod
+    def ichksum(self, irods_path: str) -> str:
+        """
+        Return the checksum of a data object.
+        """
+
+    @abc.abstractmethod
+    def imeta_ls(self, collection: str) -> List[Dict[str, str]]:
+        """
+        Return AVUs of a collection as dicts with attribute, value and units keys.
+        """
+
+    @abc.abstractmethod
+    def imeta_apply(self, collection: str, operations: List[AVUOperation]) -> None:
+        """
+        Apply a batch of metadata changes to a collection.
+        """
+
+    @abc.abstractmethod
+    def ilocate(self, pattern: str) -> List[str]:
+        """
+        Return paths of data objects matching a pattern with `%` and `_` wildcards.
+        """
+
+    @abc.abstractmethod
+    def iget(self, irods_path: str, local_path: str) -> None:
+        """
+        Download a data object to a local file, overwriting an existing file.
+        """
+
+
+class ICommandsClient(IRODSClient):
+    """
+    An iRODS client that runs icommands in subprocesses.
+    """
+
+    def __init__(self, retries: int = 10) -> None:
+        """
+        Args:
+            retries (int, optional): A number of times iput retries an upload. Defaults to 10.
+        """
+        self.retries = retries
+
+    def run(self, command: List[str], input: Optional[str] = None) -> str:
+        """
+        Run an icommand and return its stdout.
+
+        Interactive icommands exit with the code of their last command, so when
+        commands are given on stdin, errors they print are failures as well.
+
+        Raises:
+            IRODSError: If the command exits with a non-zero code or prints an error for a command read from stdin.
+        """
+        process = subprocess.run(command, input=input, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise IRODSError(
+                f"{' '.join(command)} failed with code {process.returncode}: {process.stderr.strip()}"
+            )
+        if input is not None:
+            errors = [
+                line.strip()
+                for line in (process.stdout + process.stderr).splitlines()
+                if "ERROR" in line
+            ]
+            if errors:
+                raise IRODSError(f"{' '.join(command)} failed: {'; '.join(errors)}")
+        return process.stdout
+
+    def imkdir(self, collection: str) -> None:
+        self.run(["imkdir", "-p", collection])
+
+    def iput(
+        self,
+        local_path: str,
+        irods_path: str,
+        metadata: Optional[Dict[str, str]] = None,
+        restart_file: Optional[str] = None,
+    ) -> None:
+        command = ["iput", "-K", "-N", "0", "-f"]
+        if restart_file is not None:
+            command += ["-X", restart_file, "--retries", str(self.retries)]
+        if metadata:
+            avus = "".join(f"{key};{value};;" for key, value in metadata.items())
+            command += [f"--metadata={avus}"]
+        self.run(command + [local_path, irods_path])
+
+    def ichksum(self, irods_path: str) -> str:
+        output = self.run(["ichksum", irods_path])
+        lines = [line.split() for line in output.splitlines() if line.strip()]
+        return lines[0][-1] if lines else ""
+
+    def imeta_ls(self, collection: str) -> List[Dict[str, str]]:
+        output = self.run(["imeta", "ls", "-C", collection])
+        avus = []
+        for line in output.splitlines():
+            key, _, value = line.partition(": ")
+            if key == "attribute":
+                avus.append({"attribute": value, "value": "", "units": ""})
+            elif key in ("value", "units") and avus:
+                avus[-1][key] = value
+        return avus
+
+    def imeta_apply(self, collection: str, operations: List[AVUOperation]) -> None:
+        # imeta reads commands from stdin, so a whole batch is a single process,
+        # its parser has no escapes, so a value is quoted with a quote it does not contain
+        def quote(value: str) -> str:
+            if "\n" in value or "\r" in value:
+                raise IRODSError(
+                    f"imeta {collection}: a value has a newline: {value!r}"
+                )
+            for mark in ('"', "'"):
+                if mark not in value:
+                    return mark + value + mark
+            raise IRODSError(f"imeta {collection}: a value has both quotes: {value!r}")
+
+        commands = [
+            f"{operation} -C {quote(collection)} {quote(attribute)} {quote(value)}"
+            for operation, attribute, value in operations
+        ]
+        self.run(["imeta"], input="\n".join(commands + ["quit"]) + "\n")
+
+    def ilocate(self, pattern: str) -> List[str]:
+        output = self.run(["ilocate", pattern])
+        return [line.strip() for line in output.splitlines() if line.strip()]
+
+    def iget(self, irods_path: str, local_path: str) -> None:
+        self.run(["iget", "-f", irods_path, local_path])
+
+
+class AVUStore:
+    """
+    AVUs of data objects and collections of the local stand-in, kept in SQLite.
+
+    The store is in memory by default. A store in a file keeps metadata between
+    runs and can be shared by several processes, e.g. a transfer and a later
+    metadata sync against the same stand-in.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        """
+        Args:
+            path (str, optional): A path to the SQLite file. Defaults to an in-memory store.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS avus (
+                    path TEXT NOT NULL,
+                    attribute TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    units TEXT NOT NULL,
+                    UNIQUE (path, attribute, value, units)
+                )
+                """
+            )
+
+    def get(self, path: str) -> List[Dict[str, str]]:
+        """
+        Return AVUs of a path in the order they were added.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT attribute, value, units FROM avus WHERE path = ? ORDER BY rowid",
+                (path,),
+            ).fetchall()
+        return [
+            {"attribute": attribute, "value": value, "units": units}
+            for attribute, value, units in rows
+        ]
+
+    def replace(self, path: str, metadata: Dict[str, str]) -> None:
+        """
+        Replace all AVUs of a path, as iput does for an overwritten data object.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM avus WHERE path = ?", (path,))
+            self._connection.executemany(
+                "INSERT INTO avus VALUES (?, ?, ?, '')",
+                [(path, key, value) for key, value in metadata.items()],
+            )
+
+    def apply(self, path: str, operations: List[AVUOperation]) -> None:
+        """
+        Apply a batch of metadata changes to a path in a single transaction.
+
+        Raises:
+            IRODSError: If an operation is unknown or adds an existing AVU, nothing is changed then.
+        """
+        with self._lock:
+            try:
+                with self._connection:
+                    for operation, attribute, value in operations:
+                        if operation == "set":
+                            self._connection.execute(
+                                "DELETE FROM avus WHERE path = ? AND attribute = ?",
+                                (path, attribute),
+                            )
+                        elif operation != "add":
+                            raise IRODSError(f"imeta {operation}: unknown operation")
+                        try:
+                            self._connection.execute(
+                                "INSERT INTO avus VALUES (?, ?, ?, '')",
+                                (path, attribute, value),
+                            )
+                        except sqlite3.IntegrityError:
+                            raise IRODSError(
+                                f"imeta add {path} {attribute} {value}: AVU already exists"
+                            )
+            except sqlite3.OperationalError as error:
+                raise IRODSError(f"imeta {path}: {error}")
+
+
+class LocalIRODS(IRODSClient):
+    """
+    A filesystem-backed stand-in for iRODS.
+
+    iRODS paths are mapped to paths under a local root directory, for example
+    `/archive/cellgeni/datasets/GSE1` is stored in `<root>/archive/cellgeni/datasets/GSE1`.
+    Metadata attached to data objects and collections is kept in an AVUStore.
+    """
+
+    def __init__(self, root: str, avu_store: Optional[str] = None) -> None:
+        """
+        Args:
+            root (str): A path to the local directory backing the stand-in.
+            avu_store (Optional[str], optional): A path to the SQLite file with AVUs. Defaults to an in-memory store.
+        """
+        self.root = root
+        self.avus = AVUStore(avu_store or ":memory:")
+
+    def local_path(self, irods_path: str) -> str:
+        """
+        Return the local path backing an iRODS path.
+        """
+        return os.path.join(self.root, irods_path.lstrip("/"))
+
+    def imkdir(self, collection: str) -> None:
+        os.makedirs(self.local_path(collection), exist_ok=True)
+
+    def iput(
+        self,
+        local_path: str,
+        irods_path: str,
+        metadata: Optional[Dict[str, str]] = None,
+        restart_file: Optional[str] = None,
+    ) -> None:
+        target = self.local_path(irods_path)
+        if not os.path.isdir(os.path.dirname(target)):
+            raise IRODSError(
+                f"iput {local_path} {irods_path}: collection {os.path.dirname(irods_path)} does not exist"
+            )
+        shutil.copyfile(local_path, target)
+        self.avus.replace(irods_path, metadata or {})
+
+    def ichksum(self, irods_path: str) -> str:
+        target = self.local_path(irods_path)
+        if not os.path.isfile(target):
+            raise IRODSError(f"ichksum {irods_path}: data object does not exist")
+        md5 = hashlib.md5()
+        with open(target, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def imeta_ls(self, collection: str) -> List[Dict[str, str]]:
+        if not os.path.isdir(self.local_path(collection)):
+            raise IRODSError(f"imeta ls {collection}: collection does not exist")
+        return self.avus.get(collection)
+
+    def imeta_apply(self, collection: str, operations: List[AVUOperation]) -> None:
+        if not os.path.isdir(self.local_path(collection)):
+            raise IRODSError(f"imeta {collection}: collection does not exist")
+        self.avus.apply(collection, operations)
+
+    def ilocate(self, pattern: str) -> List[str]:
+        # translate SQL LIKE wildcards used by ilocate to shell ones
+        pattern = pattern.replace("%", "*").replace("_", "?")
+        paths = []
+        for dirpath, _, filenames in os.walk(self.root):
+            collection = "/" + os.path.relpath(dirpath, self.root).lstrip(".")
+            for filename in filenames:
+                irods_path = os.path.join(collection, filename)
+                if fnmatch.fnmatchcase(irods_path, pattern):
+                    paths.append(irods_path)
+        return sorted(paths)
+
+    def iget(self, irods_path: str, local_path: str) -> None:
+        source = self.local_path(irods_path)
+        if not os.path.isfile(source):
+            raise IRODSError(f"iget {irods_path}: data object does not exist")
+        shutil.copyfile(source, local_path)
+
+
+class SimulatedIRODS(IRODSClient):
+    """
+    Wraps an iRODS client with the latency, bandwidth and failures of a real server.
+
+    Every call waits for a free server slot and then for the per-call latency.
+    Uploads and downloads additionally share a link of the given bandwidth, a
+    transfer reserves the link for `size / bandwidth` seconds after the transfers
+    started before it, so concurrent transfers slow each other down like on a
+    real network. A fraction of calls fails with an IRODSError before doing
+    anything. Numbers of calls, failures and transferred bytes are counted.
+    """
+
+    def __init__(
+        self,
+        client: IRODSClient,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+        failure_rate: float = 0.0,
+        slots: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            client (IRODSClient): The client doing the operations, usually LocalIRODS.
+            latency (float, optional): A delay of every call in seconds. Defaults to 0.
+            bandwidth (Optional[float], optional): A bandwidth of the link in bytes per second. Defaults to unlimited.
+            failure_rate (float, optional): A fraction of calls that fail. Defaults to 0.
+            slots (Optional[int], optional): A number of calls the server handles at the same time. Defaults to unlimited.
+            seed (Optional[int], optional): A seed of injected failures. Defaults to None.
+        """
+        self.client = client
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.slots = threading.Semaphore(slots) if slots else None
+        self.calls: Dict[str, int] = {}
+        self.failures = 0
+        self.bytes = 0
+        self._random = random.Random(seed)
+        self._link_free = 0.0
+        self._lock = threading.Lock()
+
+    def call(
+        self, name: str, operation: Callable, *args, size: Optional[Callable] = None
+    ):
+        """
+        Run an operation of the wrapped client as the server would.
+
+        Args:
+            name (str): The icommand name used in counters and errors.
+            operation (Callable): The operation of the wrapped client.
+            *args: Arguments of the operation.
+            size (Optional[Callable], optional): Returns a number of bytes transferred by the operation. Defaults to None.
+
+        Returns:
+            The result of the operation.
+        """
+        if self.slots is not None:
+            self.slots.acquire()
+        try:
+            with self._lock:
+                self.calls[name] = self.calls.get(name, 0) + 1
+                failed = self._random.random() < self.failure_rate
+                self.failures += failed
+            time.sleep(self.latency)
+            if failed:
+                raise IRODSError(f"{name} {args[0]}: injected failure")
+            result = operation(*args)
+            if size is not None:
+                self.throttle(size())
+            return result
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+    def throttle(self, size: int) -> None:
+        """
+        Wait until a transfer of a number of bytes would finish on the shared link.
+        """
+        with self._lock:
+            self.bytes += size
+            if not self.bandwidth:
+                return
+            start = max(time.monotonic(), self._link_free)
+            self._link_free = start + size / self.bandwidth
+            end = self._link_free
+        time.sleep(max(0.0, end - time.monotonic()))
+
+    def imkdir(self, collection: str) -> None:
+        self.call("imkdir", self.client.imkdir, collection)
+
+    def iput(
+        self,
+        local_path: str,
+        irods_path: str,
+        metadata: Optional[Dict[str, str]] = None,
+        restart_file: Optional[str] = None,
+    ) -> None:
+        self.call(
+            "iput",
+            self.client.iput,
+            local_path,
+            irods_path,
+            metadata,
+            restart_file,
+            size=lambda: os.path.getsize(local_path),
+        )
+
+    def ichksum(self, irods_path: str) -> str:
+        return self.call("ichksum", self.client.ichksum, irods_path)
+
+    def imeta_ls(self, collection: str) -> List[Dict[str, str]]:
+        return self.call("imeta", self.client.imeta_ls, collection)
+
+    def imeta_apply(self, collection: str, operations: List[AVUOperation]) -> None:
+        self.call("imeta", self.client.imeta_apply, collection, operations)
+
+    def ilocate(self, pattern: str) -> List[str]:
+        return self.call("ilocate", self.client.ilocate, pattern)
+
+    def iget(self, irods_path: str, local_path: str) -> None:
+        self.call(
+            "iget",
+            self.client.iget,
+            irods_path,
+            local_path,
+            size=lambda: os.path.getsize(local_path),
+        )
+
+
+def add_irods_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add arguments selecting the iRODS client to a parser.
+    """
+    parser.add_argument(
+        "--irods_root",
+        metavar="<dir>",
+        type=str,
+        help="Specify a local directory to use as an iRODS stand-in instead of running icommands",
+        default=None,
+    )
+    parser.add_argument(
+        "--irods_avus",
+        metavar="<file>",
+        type=str,
+        help="Specify a SQLite file keeping metadata of the iRODS stand-in between runs. Default: in memory",
+        default=None,
+    )
+    parser.add_argument(
+        "--irods_latency",
+        metavar="<sec>",
+        type=float,
+        help="Specify a delay of every call to the iRODS stand-in in seconds. Default: 0",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--irods_bandwidth",
+        metavar="<num>",
+        type=float,
+        help="Specify a bandwidth of uploads and downloads of the iRODS stand-in in MB/s. Default: unlimited",
+        default=None,
+    )
+    parser.add_argument(
+        "--irods_failure_rate",
+        metavar="<num>",
+        type=float,
+        help="Specify a fraction of calls to the iRODS stand-in that fail. Default: 0",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--irods_slots",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of calls the iRODS stand-in handles at the same time. Default: unlimited",
+        default=None,
+    )
+
+
+def get_client(args: argparse.Namespace) -> IRODSClient:
+    """
+    Return the iRODS client selected by the arguments added with `add_irods_arguments`.
+
+    The stand-in is wrapped with SimulatedIRODS if any of its latency, bandwidth,
+    failure rate or slots is set.
+    """
+    if not args.irods_root:
+        return ICommandsClient()
+    client = LocalIRODS(args.irods_root, args.irods_avus)
+    if (
+        args.irods_latency
+        or args.irods_bandwidth
+        or args.irods_failure_rate
+        or args.irods_slots
+    ):
+        client = SimulatedIRODS(
+            client,
+            latency=args.irods_latency,
+            bandwidth=args.irods_bandwidth * 1e6 if args.irods_bandwidth else None,
+            failure_rate=args.irods_failure_rate,
+            slots=args.irods_slots,
+        )
+    return client
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import abc
+import sys
+import csv
+import sqlite3
+import argparse
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from transfer_ledger import TransferLedger
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+STATUSES = ["success", "fail", "skip", "pending"]
+
+# checklist columns listing samples that failed a check
+SAMPLE_FAILURE_COLUMNS = [
+    "missing_runs_samples",
+    "missing_runs_fastq_samples",
+    "missing_fastq_samples",
+    "unpaired_fastq_samples",
+    "damaged_fastq_files",
+    "missing_starsolo_samples",
+    "starsolo_emptyOutput_samples",
+    "starsolo_noFinalLog_samples",
+    "starsolo_existTmp_samples",
+    "missing_solo_qc_samples",
+]
+
+# the samples table of create_table.sql without PostgreSQL types
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    sample_name VARCHAR(30) NOT NULL,
+    dataset_name VARCHAR(30) NOT NULL,
+    is_10x BOOLEAN DEFAULT true,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('success', 'fail', 'skip', 'pending')),
+    library_type VARCHAR(100),
+    sanger_id VARCHAR(50) UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(dataset_name, sample_name)
+)
+"""
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Loads sample statuses from QC and transfer outputs into the samples table"
+    )
+    database = parser.add_mutually_exclusive_group(required=True)
+    database.add_argument(
+        "--sqlite",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to a SQLite database, the samples table is created if it does not exist",
+    )
+    database.add_argument(
+        "--postgres",
+        metavar="<dsn>",
+        type=str,
+        help="Specify a PostgreSQL connection string, the samples table must be created with create_table.sql. Example: 'dbname=reprocessing host=localhost'",
+    )
+    parser.add_argument(
+        "--checklist",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the checklist of qc_reprocessing.py. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--successful_samples",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the successful samples list of get_successful_samples.py. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--filtered_qc",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the filtered QC file written together with --successful_samples, used for library types. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--tracking",
+        metavar="<file>",
+        type=str,
+        nargs="+",
+        help="Specify paths to transfer tracking files, successful samples with files with mismatching checksums are pending. Default: None",
+        default=[],
+    )
+    parser.add_argument(
+        "--ledgers",
+        metavar="<file>",
+        type=str,
+        nargs="+",
+        help="Specify paths to transfer ledgers of transfer_to_irods.py, successful samples with files that failed to upload or mismatch are pending. Default: None",
+        default=[],
+    )
+    parser.add_argument(
+        "--sep",
+        metavar="<val>",
+        type=str,
+        help="Specify a separator of the checklist file. Default: \\t",
+        default="\t",
+    )
+    parser.add_argument(
+        "--batch_size",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of rows sent to the database at once. Default: 10000",
+        default=10000,
+    )
+    return parser
+
+
+class SampleStatus(NamedTuple):
+    """
+    A row of the samples table, `library_type` is None if it is not known.
+    """
+
+    dataset_name: str
+    sample_name: str
+    status: str
+    is_10x: bool = True
+    library_type: Optional[str] = None
+
+
+SampleKey = Tuple[str, str]
+
+
+def split_samples(value: str) -> List[str]:
+    """
+    Split a checklist value with a list of samples, written either comma-separated or as a Python list.
+
+    Files are listed as `<sample>/<file>:<reason>`, their samples are returned.
+    """
+    if value in ("", "-"):
+        return []
+    samples = (sample.strip(" '\"") for sample in value.strip("[]").split(","))
+    return list(dict.fromkeys(sample.split("/")[0] for sample in samples if sample))
+
+
+def read_checklist(filepath: str, sep: str = "\t") -> Dict[SampleKey, str]:
+    """
+    Return statuses of samples named in a checklist.
+
+    Samples listed in any of SAMPLE_FAILURE_COLUMNS failed, mapped samples of
+    solo_qc.tsv are pending until they are found among successful samples.
+
+    Args:
+        filepath (str): A path to checklist.tsv.
+        sep (str, optional): The separator. Defaults to '\\t'.
+
+    Returns:
+        Dict[SampleKey, str]: Statuses of samples by dataset and sample name.
+    """
+    statuses = {}
+    with open(filepath, "r", newline="") as file:
+        reader = csv.reader(file, delimiter=sep)
+        header = next(reader, [])
+        columns = {column: position for position, column in enumerate(header)}
+        for row in reader:
+            dataset = row[0]
+            mapped = columns.get("solo_qc_mapped_samples")
+            if mapped is not None:
+                for sample in split_samples(row[mapped]):
+                    statuses[dataset, sample] = "pending"
+            for column in SAMPLE_FAILURE_COLUMNS:
+                if column in columns:
+                    for sample in split_samples(row[columns[column]]):
+                        statuses[dataset, sample] = "fail"
+    return statuses
+
+
+def read_successful_samples(
+    filepath: str, filtered_qc: Optional[str] = None
+) -> Dict[SampleKey, Optional[str]]:
+    """
+    Return successful samples with their library types.
+
+    get_successful_samples.py writes the same samples in the same order to both
+    files, the whitelist of a sample in the filtered QC file is its 10x library type.
+
+    Args:
+        filepath (str): A path to successful_samples.csv.
+        filtered_qc (Optional[str], optional): A path to filtered_solo_qc.tsv. Defaults to None.
+
+    Returns:
+        Dict[SampleKey, Optional[str]]: Library types of samples by dataset and sample name.
+    """
+    with open(filepath, "r") as file:
+        keys = [
+            (dataset, sample)
+            for sample, dataset, *_ in (
+                line.rstrip("\n").split("\t") for line in file if line.strip()
+            )
+        ]
+    library_types: List[Optional[str]] = [None] * len(keys)
+    if filtered_qc is not None:
+        with open(filtered_qc, "r") as file:
+            header = next(file).rstrip("\n").split("\t")
+            sample_column, wl_column = header.index("Sample"), header.index("WL")
+            rows = [line.rstrip("\n").split("\t") for line in file if line.strip()]
+        if len(rows) != len(keys) or any(
+            row[sample_column] != sample for row, (_, sample) in zip(rows, keys)
+        ):
+            raise ValueError(f"{filtered_qc} does not match {filepath}")
+        library_types = [row[wl_column] or None for row in rows]
+    return dict(zip(keys, library_types))
+
+
+def transfer_sample(dataset: str, local_path: str) -> Optional[SampleKey]:
+    """
+    Return the sample of a transferred file in `<dataset>/<sample>/` or `<dataset>/fastqs/<sample>/`.
+    """
+    parts = local_path.split("/")
+    if dataset not in parts:
+        return None
+    parts = parts[parts.index(dataset) + 1 : -1]
+    if parts[:1] == ["fastqs"]:
+        parts = parts[1:]
+    return (dataset, parts[0]) if parts else None
+
+
+def read_failed_transfers(
+    filepaths: Iterable[str], ledgers: Iterable[str] = ()
+) -> Set[SampleKey]:
+    """
+    Return samples with files that failed to upload or have mismatching checksums.
+
+    Tracking files only list uploaded files, files that failed to upload are
+    only recorded in transfer ledgers.
+
+    Args:
+        filepaths (Iterable[str]): Paths to tracking files.
+        ledgers (Iterable[str], optional): Paths to transfer ledgers. Defaults to ().
+
+    Returns:
+        Set[SampleKey]: Datasets and samples with failed files.
+    """
+    files = []
+    for filepath in filepaths:
+        with open(filepath, "r") as file:
+            for line in file:
+                row = line.rstrip("\n").split("\t")
+                if len(row) < 6 or row[5] in ("MATCH", "status"):
+                    continue
+                files.append((row[0], row[1]))
+    for ledger_file in ledgers:
+        # connecting would create a missing ledger
+        if not os.path.isfile(ledger_file):
+            raise FileNotFoundError(f"File {ledger_file} does not exist.")
+        with TransferLedger(ledger_file) as ledger:
+            files.extend(
+                (entry.dataset, entry.local_path)
+                for entry in ledger.with_status("FAILED", "MISMATCH")
+            )
+    samples = (transfer_sample(dataset, local_path) for dataset, local_path in files)
+    return {sample for sample in samples if sample is not None}
+
+
+def merge_statuses(
+    checklist: Dict[SampleKey, str],
+    successful: Dict[SampleKey, Optional[str]],
+    failed_transfers: Set[SampleKey],
+) -> List[SampleStatus]:
+    """
+    Combine sample statuses from all the outputs.
+
+    A sample failed if the checklist says so. Otherwise it is successful if it
+    is among successful samples and none of its files failed to upload, pending
+    if some did, or keeps its checklist status.
+
+    Returns:
+        List[SampleStatus]: Rows of the samples table sorted by dataset and sample.
+    """
+    rows = []
+    for key in sorted(set(checklist).union(successful)):
+        status = checklist.get(key, "pending")
+        if status != "fail" and key in successful:
+            status = "pending" if key in failed_transfers else "success"
+        library_type = successful.get(key)
+        rows.append(SampleStatus(*key, status, True, library_type))
+    return rows
+
+
+def batches(rows: List[SampleStatus], size: int) -> Iterable[List[SampleStatus]]:
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+class SamplesTable(abc.ABC):
+    """
+    Upserts rows into the samples table through a staging table.
+
+    Rows are first sent to a temporary staging table in batches and then merged
+    into the samples table with a single INSERT ... ON CONFLICT statement. A
+    sample that already exists is updated, and its updated_at is set, only if its
+    status, is_10x or library type changed.
+    """
+
+    # SQL comparing values with NULLs
+    distinct = "IS NOT"
+    status_type = "TEXT"
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    @abc.abstractmethod
+    def stage(self, rows: List[SampleStatus], batch_size: int) -> None:
+        """
+        Insert rows into the staging table in batches.
+        """
+
+    def upsert(
+        self, rows: List[SampleStatus], batch_size: int = 10000
+    ) -> Tuple[int, int]:
+        """
+        Load rows into the samples table in a single transaction.
+
+        Args:
+            rows (List[SampleStatus]): The rows.
+            batch_size (int, optional): A number of rows sent to the database at once. Defaults to 10000.
+
+        Returns:
+            Tuple[int, int]: Numbers of inserted and updated samples.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS staging")
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE staging (
+                dataset_name TEXT NOT NULL,
+                sample_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                is_10x BOOLEAN NOT NULL,
+                library_type TEXT
+            )
+            """
+        )
+        self.stage(rows, batch_size)
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM staging
+            WHERE NOT EXISTS (
+                SELECT 1 FROM samples
+                WHERE samples.dataset_name = staging.dataset_name
+                AND samples.sample_name = staging.sample_name
+            )
+            """
+        )
+        inserted = cursor.fetchone()[0]
+        cursor.execute(
+            f"""
+            INSERT INTO samples (dataset_name, sample_name, status, is_10x, library_type)
+            SELECT dataset_name, sample_name, CAST(status AS {self.status_type}), is_10x, library_type
+            FROM staging WHERE true
+            ON CONFLICT (dataset_name, sample_name) DO UPDATE SET
+                status = excluded.status,
+                is_10x = excluded.is_10x,
+                library_type = COALESCE(excluded.library_type, samples.library_type),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE samples.status {self.distinct} excluded.status
+            OR samples.is_10x {self.distinct} excluded.is_10x
+            OR samples.library_type {self.distinct} COALESCE(excluded.library_type, samples.library_type)
+            """
+        )
+        changed = cursor.rowcount
+        cursor.execute("DROP TABLE staging")
+        self.connection.commit()
+        return inserted, changed - inserted
+
+
+class SQLiteSamplesTable(SamplesTable):
+    """
+    The samples table in SQLite, rows are staged with batched executemany calls.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite database.
+        """
+        super().__init__(sqlite3.connect(path))
+        self.connection.execute(SQLITE_SCHEMA)
+
+    def stage(self, rows: List[SampleStatus], batch_size: int) -> None:
+        for batch in batches(rows, batch_size):
+            self.connection.executemany(
+                "INSERT INTO staging VALUES (?, ?, ?, ?, ?)", batch
+            )
+
+
+class PostgresSamplesTable(SamplesTable):
+    """
+    The samples table in PostgreSQL, rows are staged with COPY in the CSV format,
+    so values with tabs, quotes or backslashes are quoted by the csv module and an
+    unquoted empty value is NULL.
+    """
+
+    distinct = "IS DISTINCT FROM"
+    status_type = "status_enum"
+
+    def __init__(self, dsn: str) -> None:
+        """
+        Args:
+            dsn (str): The connection string.
+        """
+        super().__init__(psycopg2.connect(dsn))
+
+    def stage(self, rows: List[SampleStatus], batch_size: int) -> None:
+        cursor = self.connection.cursor()
+        for batch in batches(rows, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter="\t", lineterminator="\n")
+            writer.writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY staging FROM STDIN WITH (FORMAT csv, DELIMITER E'\\t', NULL '')",
+                buffer,
+            )
+
+
+def main() -> None:
+    """
+    The main entry point for the samples loader script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.postgres and psycopg2 is None:
+        sys.exit("ERROR: --postgres requires psycopg2: pip install psycopg2-binary")
+    if args.filtered_qc and not args.successful_samples:
+        parser.error("--filtered_qc requires --successful_samples")
+
+    # Collect statuses from the outputs
+    checklist = read_checklist(args.checklist, args.sep) if args.checklist else {}
+    successful = (
+        read_successful_samples(args.successful_samples, args.filtered_qc)
+        if args.successful_samples
+        else {}
+    )
+    failed_transfers = read_failed_transfers(args.tracking, args.ledgers)
+    rows = merge_statuses(checklist, successful, failed_transfers)
+
+    # Load them into the database
+    table = (
+        SQLiteSamplesTable(args.sqlite)
+        if args.sqlite
+        else PostgresSamplesTable(args.postgres)
+    )
+    inserted, updated = table.upsert(rows, args.batch_size)
+    table.connection.close()
+    counts = {status: 0 for status in STATUSES}
+    for row in rows:
+        counts[row.status] += 1
+    print(
+        f"Samples: {len(rows)} ({', '.join(f'{s}: {n}' for s, n in counts.items())}). "
+        f"INSERTED: {inserted}, UPDATED: {updated}, UNCHANGED: {len(rows) - inserted - updated}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Summarises stage metrics written with --metrics by the QC, metadata and transfer scripts"
+    )
+    parser.add_argument(
+        "files",
+        metavar="<file>",
+        type=str,
+        nargs="+",
+        help="Specify paths to the JSON lines metrics files",
+    )
+    parser.add_argument(
+        "--top",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of the slowest datasets to print. Default: 10",
+        default=10,
+    )
+    return parser
+
+
+class Stage:
+    """
+    Wall time and counters of a stage of a script, optionally for a single dataset.
+
+    Counters are arbitrary numbers such as files, bytes or remote calls. Time can
+    be measured around the whole stage with `Metrics.stage` or accumulated from
+    many timed blocks with `time`, for example for every file of a dataset handled
+    on a thread pool. Accumulation is thread-safe. Blocks of a `concurrent` stage
+    overlap, so their summed time is recorded as `thread_seconds` and the wall
+    time from the start of the first block to the end of the last as `seconds`.
+    A stage timed within another one names it as its `parent`.
+    """
+
+    __slots__ = (
+        "metrics",
+        "name",
+        "dataset",
+        "parent",
+        "concurrent",
+        "seconds",
+        "counts",
+        "_span",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        metrics: "Metrics",
+        name: str,
+        dataset: Optional[str] = None,
+        parent: Optional[str] = None,
+        concurrent: bool = False,
+    ) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.dataset = dataset
+        self.parent = parent
+        self.concurrent = concurrent
+        self.seconds = 0.0
+        self.counts: Dict[str, float] = {}
+        self._span: Optional[Tuple[float, float]] = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float = 0.0, **counts: float) -> None:
+        """
+        Add time and counters to the stage.
+        """
+        with self._lock:
+            self.seconds += seconds
+            for key, value in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def add_files(self, *paths: str) -> None:
+        """
+        Add files and their total size to the stage, files are stat'ed only if metrics are enabled.
+        """
+        if self.metrics.enabled:
+            self.add(files=len(paths), bytes=sum(os.path.getsize(p) for p in paths))
+
+    @contextmanager
+    def time(self, **counts: float) -> Iterator["Stage"]:
+        """
+        Add the time of a block and counters to the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            end = time.perf_counter()
+            self.add(end - start, **counts)
+            with self._lock:
+                if self._span is not None:
+                    start, end = min(start, self._span[0]), max(end, self._span[1])
+                self._span = (start, end)
+
+    def record(self) -> None:
+        """
+        Write the stage to the metrics file.
+        """
+        record: Dict = {"stage": self.name, "dataset": self.dataset}
+        if self.parent is not None:
+            record["parent"] = self.parent
+        if self.concurrent:
+            wall = self._span[1] - self._span[0] if self._span is not None else 0.0
+            record["seconds"] = round(wall, 6)
+            record["thread_seconds"] = round(self.seconds, 6)
+        else:
+            record["seconds"] = round(self.seconds, 6)
+        self.metrics.write(**record, **self.counts)
+
+
+class Metrics:
+    """
+    Writes stage metrics as JSON lines.
+
+    Metrics are disabled until `configure` is called with a file, then every
+    record is appended to the file with a single write, so threads and processes
+    of a script and different scripts can share one file.
+    """
+
+    def __init__(self) -> None:
+        self.path: Optional[str] = None
+        self.script = os.path.basename(sys.argv[0])
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: Optional[str], script: Optional[str] = None) -> None:
+        """
+        Enable writing metrics to a file, or disable them if path is None.
+        """
+        self.path = path
+        if script is not None:
+            self.script = script
+
+    def write(self, **record) -> None:
+        """
+        Append a record with a timestamp and the script name to the metrics file.
+        """
+        if self.path is None:
+            return
+        record = {"time": round(time.time(), 3), "script": self.script, **record}
+        line = (json.dumps(record) + "\n").encode()
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    @contextmanager
+    def stage(
+        self,
+        name: str,
+        dataset: Optional[str] = None,
+        parent: Optional[str] = None,
+        **counts: float,
+    ) -> Iterator[Stage]:
+        """
+        Measure the wall time of a block and record it as a stage when it ends.
+
+        Example:
+            with metrics.stage("transfer", dataset) as stage:
+                ...
+                stage.add(files=len(files))
+        """
+        stage = Stage(self, name, dataset, parent)
+        try:
+            with stage.time(**counts):
+                yield stage
+        finally:
+            stage.record()
+
+    def timed(self, name: str, dataset_arg: str = "dataset") -> Callable:
+        """
+        Decorator that records every call of a function as a stage.
+
+        Args:
+            name (str): The stage name.
+            dataset_arg (str, optional): The argument holding the dataset name. Defaults to 'dataset'.
+
+        Returns:
+            Callable: The decorator.
+        """
+
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.path is None:
+                    return func(*args, **kwargs)
+                dataset = signature.bind_partial(*args, **kwargs).arguments.get(
+                    dataset_arg
+                )
+                with self.stage(name, dataset):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+# metrics shared by all modules of a script
+metrics = Metrics()
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the argument enabling metrics to a parser.
+    """
+    parser.add_argument(
+        "--metrics",
+        metavar="<file>",
+        type=str,
+        help="Specify a JSON lines file to append stage timings and counters to. Default: None",
+        default=None,
+    )
+
+
+def read_metrics(filepaths: List[str]) -> List[Dict]:
+    """
+    Read records from metrics files, skipping lines that are not valid JSON.
+    """
+    records = []
+    for filepath in filepaths:
+        with open(filepath, "r") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def summarise(records: List[Dict], top: int = 10) -> str:
+    """
+    Summarise records by stage with throughput, and list the slowest datasets.
+
+    Throughput is per wall second. Thread seconds are the summed time of the blocks
+    of concurrent stages. Datasets are ranked by the wall time of their stages
+    without a parent, so time of nested stages is not counted twice.
+
+    Args:
+        records (List[Dict]): Records written by `Metrics`.
+        top (int, optional): A number of the slowest datasets to list. Defaults to 10.
+
+    Returns:
+        str: The summary.
+    """
+    stages: Dict[str, Dict[str, float]] = {}
+    datasets: Dict[str, Dict[str, float]] = {}
+    for record in records:
+        totals = stages.setdefault(
+            record["stage"],
+            {
+                "records": 0,
+                "seconds": 0.0,
+                "thread_seconds": 0.0,
+                "files": 0,
+                "bytes": 0,
+            },
+        )
+        totals["records"] += 1
+        for key, value in record.items():
+            if key not in ("time", "script", "stage", "dataset") and isinstance(
+                value, (int, float)
+            ):
+                totals[key] = totals.get(key, 0) + value
+        if record.get("dataset") and not record.get("parent"):
+            dataset = datasets.setdefault(record["dataset"], {})
+            dataset[record["stage"]] = (
+                dataset.get(record["stage"], 0.0) + record["seconds"]
+            )
+
+    lines = ["stage\trecords\tseconds\tthread_seconds\tfiles\tMB\tMB/s\tfiles/s\tother"]
+    for name, totals in sorted(stages.items()):
+        records_count = totals.pop("records")
+        seconds = totals.pop("seconds")
+        thread_seconds = totals.pop("thread_seconds")
+        files = totals.pop("files")
+        size_mb = totals.pop("bytes") / 1e6
+        other = ",".join(f"{key}={value:g}" for key, value in sorted(totals.items()))
+        lines.append(
+            f"{name}\t{records_count}\t{seconds:.2f}\t"
+            f"{f'{thread_seconds:.2f}' if thread_seconds else '-'}\t{files:g}\t{size_mb:.1f}\t"
+            f"{size_mb / seconds if seconds else 0:.1f}\t"
+            f"{files / seconds if seconds else 0:.1f}\t{other or '-'}"
+        )
+
+    # datasets are ranked by the time of all their top-level stages
+    lines.append("")
+    lines.append("rank\tdataset\tseconds\tslowest_stage\tstage_seconds")
+    slowest = sorted(
+        datasets.items(), key=lambda item: sum(item[1].values()), reverse=True
+    )
+    for rank, (dataset, dataset_stages) in enumerate(slowest[:top], start=1):
+        stage, seconds = max(dataset_stages.items(), key=lambda item: item[1])
+        lines.append(
+            f"{rank}\t{dataset}\t{sum(dataset_stages.values()):.2f}\t{stage}\t{seconds:.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """
+    The main entry point for the metrics summary script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    print(summarise(read_metrics(args.files), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import heapq
+import argparse
+from typing import Dict, List, NamedTuple, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from irods import add_irods_arguments, get_client
+from checksum_cache import Hasher
+from transfer_to_irods import TransferEngine, transfer_dataset
+from metrics import add_metrics_arguments, metrics
+
+PLAN_HEADER = [
+    "worker",
+    "source",
+    "subtree",
+    "recursive",
+    "files",
+    "bytes",
+    "est_seconds",
+]
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Plans uploads of many datasets to iRODS over a fixed number of workers and runs the plan"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser(
+        "plan",
+        help="Size datasets and pack them into workers, splitting large datasets by subdirectory",
+    )
+    plan_parser.add_argument(
+        "dataset_list",
+        type=str,
+        help="Specify a path to the file with a list of dataset directories",
+    )
+    plan_parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of workers running at the same time. Default: 7",
+        default=7,
+    )
+    plan_parser.add_argument(
+        "--output",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the plan file. Default: transfer_plan.tsv",
+        default="transfer_plan.tsv",
+    )
+    plan_parser.add_argument(
+        "--per_file_seconds",
+        metavar="<num>",
+        type=float,
+        help="Specify an estimated overhead of iRODS calls per file in seconds. Default: 1.0",
+        default=1.0,
+    )
+    plan_parser.add_argument(
+        "--bandwidth",
+        metavar="<num>",
+        type=float,
+        help="Specify an estimated upload bandwidth of a worker in MB/s. Default: 100",
+        default=100.0,
+    )
+
+    run_parser = subparsers.add_parser(
+        "run",
+        help="Upload datasets of a plan, all workers on a local process pool or a single worker of a job array",
+    )
+    run_parser.add_argument(
+        "plan",
+        type=str,
+        help="Specify a path to the plan file",
+    )
+    run_parser.add_argument(
+        "target",
+        metavar="<irods_target_directory>",
+        type=str,
+        help="Specify an iRODS collection to upload datasets to",
+    )
+    run_parser.add_argument(
+        "--worker",
+        metavar="<num>",
+        type=int,
+        help="Specify a worker of the plan to run, e.g. $LSB_JOBINDEX. Default: all workers",
+        default=None,
+    )
+    run_parser.add_argument(
+        "--workdir",
+        metavar="<dir>",
+        type=str,
+        help="Specify a directory for ledgers and tracking files, each dataset gets its own subdirectory. Default: .",
+        default=".",
+    )
+    run_parser.add_argument(
+        "--upload_workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of concurrent uploads per worker. Default: 4",
+        default=4,
+    )
+    run_parser.add_argument(
+        "--hash_workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of files hashed concurrently per worker. Default: 2",
+        default=2,
+    )
+    add_irods_arguments(run_parser)
+    add_metrics_arguments(run_parser)
+    return parser
+
+
+class TransferUnit(NamedTuple):
+    """
+    A part of a dataset uploaded by a single worker: a subdirectory with all its
+    subdirectories, or only the files directly in it if `recursive` is False.
+    """
+
+    source: str
+    subtree: str
+    recursive: bool
+    files: int
+    bytes: int
+
+
+class DatasetScan(NamedTuple):
+    """
+    Numbers of files and bytes of the directories of a dataset, directories are
+    relative to the dataset directory.
+    """
+
+    direct: Dict[str, Tuple[int, int]]
+    children: Dict[str, List[str]]
+    totals: Dict[str, Tuple[int, int]]
+
+
+class CostModel(NamedTuple):
+    """
+    Estimates upload time of a number of files with a total size.
+    """
+
+    per_file_seconds: float
+    bytes_per_second: float
+
+    def __call__(self, files: int, size: int) -> float:
+        return files * self.per_file_seconds + size / self.bytes_per_second
+
+
+def scan_dataset(source_dir: str) -> DatasetScan:
+    """
+    Count files and bytes of every directory of a dataset in a single walk.
+
+    Args:
+        source_dir (str): A path to the dataset directory.
+
+    Returns:
+        DatasetScan: Files and bytes directly in each directory, subdirectories of
+            each directory and files and bytes of each whole subtree.
+    """
+    direct = {}
+    children = {}
+    stack = ["."]
+    while stack:
+        relpath = stack.pop()
+        files = size = 0
+        subdirs = []
+        with os.scandir(os.path.join(source_dir, relpath)) as iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(os.path.normpath(os.path.join(relpath, entry.name)))
+                elif entry.is_file():
+                    files += 1
+                    size += entry.stat().st_size
+        direct[relpath] = (files, size)
+        children[relpath] = sorted(subdirs)
+        stack.extend(subdirs)
+
+    # children are counted before their parents, the dataset directory is the last
+    totals = {}
+    for relpath in sorted(
+        direct, key=lambda path: -1 if path == "." else path.count("/"), reverse=True
+    ):
+        files, size = direct[relpath]
+        for child in children[relpath]:
+            files += totals[child][0]
+            size += totals[child][1]
+        totals[relpath] = (files, size)
+    return DatasetScan(direct, children, totals)
+
+
+def split_dataset(
+    source_dir: str, scan: DatasetScan, max_cost: float, cost: CostModel
+) -> List[TransferUnit]:
+    """
+    Split a dataset into units that are not larger than `max_cost` where possible.
+
+    A directory that is too large is split into its files and its subdirectories,
+    which are split further in the same way. A directory without subdirectories is
+    never split.
+
+    Args:
+        source_dir (str): A path to the dataset directory.
+        scan (DatasetScan): The scan of the dataset.
+        max_cost (float): A maximum estimated upload time of a unit in seconds.
+        cost (CostModel): The cost model.
+
+    Returns:
+        List[TransferUnit]: A list of units with at least one file each.
+    """
+    units = []
+    stack = ["."]
+    while stack:
+        relpath = stack.pop()
+        files, size = scan.totals[relpath]
+        if files == 0:
+            continue
+        if cost(files, size) <= max_cost or not scan.children[relpath]:
+            units.append(TransferUnit(source_dir, relpath, True, files, size))
+            continue
+        if scan.direct[relpath][0]:
+            units.append(
+                TransferUnit(source_dir, relpath, False, *scan.direct[relpath])
+            )
+        stack.extend(reversed(scan.children[relpath]))
+    return units
+
+
+def pack_units(
+    units: List[TransferUnit], workers: int, cost: CostModel
+) -> List[List[TransferUnit]]:
+    """
+    Assign units to workers with the longest processing time first rule.
+
+    Units are assigned from the largest to the smallest, each to the worker with the
+    least estimated work so far, so small datasets share workers and the slowest
+    worker finishes close to the average.
+
+    Args:
+        units (List[TransferUnit]): A list of units.
+        workers (int): A number of workers.
+        cost (CostModel): The cost model.
+
+    Returns:
+        List[List[TransferUnit]]: Units of every worker that got any.
+    """
+    loads = [(0.0, worker) for worker in range(workers)]
+    assignment: List[List[TransferUnit]] = [[] for _ in range(workers)]
+    for unit in sorted(
+        units,
+        key=lambda unit: (-cost(unit.files, unit.bytes), unit.source, unit.subtree),
+    ):
+        load, worker = heapq.heappop(loads)
+        assignment[worker].append(unit)
+        heapq.heappush(loads, (load + cost(unit.files, unit.bytes), worker))
+    return [worker_units for worker_units in assignment if worker_units]
+
+
+def write_plan(
+    filepath: str, assignment: List[List[TransferUnit]], cost: CostModel
+) -> None:
+    """
+    Write units of workers to a plan file, workers are numbered from 1.
+    """
+    with open(filepath, "w") as file:
+        file.write("\t".join(PLAN_HEADER) + "\n")
+        for worker, units in enumerate(assignment, start=1):
+            for unit in units:
+                est_seconds = cost(unit.files, unit.bytes)
+                values = [worker, *unit, f"{est_seconds:.1f}"]
+                file.write("\t".join(str(value) for value in values) + "\n")
+
+
+def read_plan(filepath: str) -> Dict[int, List[TransferUnit]]:
+    """
+    Read units of workers from a plan file.
+    """
+    plan: Dict[int, List[TransferUnit]] = {}
+    with open(filepath, "r") as file:
+        next(file, None)
+        for line in file:
+            if not line.strip():
+                continue
+            worker, source, subtree, recursive, files, size, _ = line.rstrip(
+                "\n"
+            ).split("\t")
+            unit = TransferUnit(
+                source, subtree, recursive == "True", int(files), int(size)
+            )
+            plan.setdefault(int(worker), []).append(unit)
+    return plan
+
+
+def run_worker(
+    units: List[TransferUnit],
+    target: str,
+    workdir: str,
+    irods_args: argparse.Namespace,
+    upload_workers: int = 4,
+    hash_workers: int = 2,
+) -> int:
+    """
+    Upload units of a worker one by one.
+
+    Ledgers of each dataset are kept in `{workdir}/{dataset}`, where
+    transfer_finalize.bsub runs, every part in its own ledger. The later
+    `transfer_to_irods.py --finalize` merges them, retries failed files and writes
+    the tracking file.
+
+    Returns:
+        int: A number of files that failed to upload.
+    """
+    client = get_client(irods_args)
+    engine = TransferEngine(client, upload_workers, hash_workers, hasher=Hasher())
+    failed = 0
+    for unit in units:
+        dataset_workdir = os.path.join(workdir, os.path.basename(unit.source))
+        os.makedirs(dataset_workdir, exist_ok=True)
+        failed += transfer_dataset(
+            engine,
+            unit.source,
+            target,
+            unit.subtree,
+            unit.recursive,
+            workdir=dataset_workdir,
+        )
+    return failed
+
+
+def plan(args: argparse.Namespace) -> None:
+    """
+    Size datasets from the list and write the plan.
+    """
+    cost = CostModel(args.per_file_seconds, args.bandwidth * 1e6)
+    with open(args.dataset_list, "r") as file:
+        source_dirs = [line.strip().rstrip("/") for line in file if line.strip()]
+
+    with ThreadPoolExecutor(args.workers) as executor:
+        scans = list(executor.map(scan_dataset, source_dirs))
+
+    # the whole work spread evenly is the best possible makespan, larger units are split
+    total_cost = sum(cost(*scan.totals["."]) for scan in scans)
+    max_cost = total_cost / args.workers
+    units = [
+        unit
+        for source_dir, scan in zip(source_dirs, scans)
+        for unit in split_dataset(source_dir, scan, max_cost, cost)
+    ]
+    assignment = pack_units(units, args.workers, cost)
+    write_plan(args.output, assignment, cost)
+
+    makespan = max(
+        (
+            sum(cost(u.files, u.bytes) for u in worker_units)
+            for worker_units in assignment
+        ),
+        default=0,
+    )
+    print(
+        f"Planned {len(source_dirs)} datasets as {len(units)} units on {len(assignment)} workers. "
+        f"Estimated makespan: {makespan:.0f}s, lower bound: {max_cost:.0f}s. Plan saved to {args.output}"
+    )
+
+
+def run(args: argparse.Namespace) -> None:
+    """
+    Run a single worker of a plan or all of them on a process pool.
+    """
+    metrics.configure(args.metrics)
+    plan = read_plan(args.plan)
+    worker_args = (
+        args.target,
+        args.workdir,
+        args,
+        args.upload_workers,
+        args.hash_workers,
+    )
+    if args.worker is not None:
+        failed = run_worker(plan.get(args.worker, []), *worker_args)
+    else:
+        with ProcessPoolExecutor(
+            max(len(plan), 1), initializer=metrics.configure, initargs=(args.metrics,)
+        ) as executor:
+            futures = [
+                executor.submit(run_worker, units, *worker_args)
+                for units in plan.values()
+            ]
+            failed = sum(future.result() for future in futures)
+    if failed:
+        sys.exit(1)
+    print("COMPLETED")
+
+
+def main() -> None:
+    """
+    The main entry point for the transfer planning script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.command == "plan":
+        plan(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+from fastq_check import is_fastq
+
+# entries of sample directories the STARsolo checks read
+STARSOLO_ENTRIES = ["output", "Log.final.out", "_STARtmp"]
+
+
+def dataset_fingerprint(dataset_path: str, fastq_files: bool = False) -> str:
+    """
+    Return a fingerprint of the inputs the validation of a dataset depends on.
+
+    The fingerprint is built from mtimes and sizes of the dataset directory and of
+    every entry directly in it (metafiles, solo_qc.tsv, sample directories and
+    fastqs/), and of every entry in fastqs/. Creating or removing `output`,
+    `Log.final.out` or `_STARtmp` in a sample directory changes the mtime of that
+    directory. Emptying or filling `output` or `_STARtmp` and rewriting
+    `Log.final.out` does not, so these three are stat'ed in every sample directory.
+
+    A FASTQ truncated or overwritten in place does not change the mtime of its
+    sample directory, so the FASTQ integrity check also needs the FASTQs in
+    fastqs/<sample>/, they are included with `fastq_files`.
+
+    Args:
+        dataset_path (str): A path to the dataset directory.
+        fastq_files (bool, optional): Include FASTQs of the sample directories in fastqs/. Defaults to False.
+
+    Returns:
+        str: A hex digest of the dataset inputs.
+    """
+    fingerprint = hashlib.sha1()
+    for relpath in ("", "fastqs"):
+        path = os.path.join(dataset_path, relpath)
+        if not os.path.isdir(path):
+            continue
+        stat = os.stat(path)
+        fingerprint.update(f"{relpath}\t{stat.st_mtime_ns}\n".encode())
+        with os.scandir(path) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+        for entry in entries:
+            stat = entry.stat()
+            fingerprint.update(
+                f"{relpath}/{entry.name}\t{stat.st_mtime_ns}\t{stat.st_size}\n".encode()
+            )
+            if relpath == "" and entry.is_dir() and entry.name != "fastqs":
+                for name in STARSOLO_ENTRIES:
+                    try:
+                        stat = os.stat(os.path.join(entry.path, name))
+                    except FileNotFoundError:
+                        continue
+                    fingerprint.update(
+                        f"{entry.name}/{name}\t{stat.st_mtime_ns}\t{stat.st_size}\n".encode()
+                    )
+            if fastq_files and relpath == "fastqs" and entry.is_dir():
+                with os.scandir(entry.path) as iterator:
+                    fastqs = sorted(
+                        (fastq for fastq in iterator if is_fastq(fastq.name)),
+                        key=lambda fastq: fastq.name,
+                    )
+                for fastq in fastqs:
+                    stat = fastq.stat()
+                    fingerprint.update(
+                        f"fastqs/{entry.name}/{fastq.name}\t{stat.st_mtime_ns}\t{stat.st_size}\n".encode()
+                    )
+    return fingerprint.hexdigest()
+
+
+class ValidationCache:
+    """
+    A persistent SQLite cache of dataset checklists keyed on dataset fingerprints.
+
+    All cached rows are loaded once when the cache is opened, so lookups are
+    in-memory and safe to call from worker threads. New rows are written in a
+    single transaction on `flush`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        checklist_columns: List[str],
+        refresh: bool = False,
+        settings: str = "",
+    ) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+            checklist_columns (List[str]): A list of checklist columns, cached rows with other columns are ignored.
+            refresh (bool, optional): Ignore cached checklists and overwrite them. Defaults to False.
+            settings (str, optional): Other settings checklists depend on, such as QC rules, cached rows with other settings are ignored. Defaults to ''.
+        """
+        self.path = path
+        self.refresh = refresh
+        self.schema = hashlib.sha1(
+            "\t".join(
+                checklist_columns + [settings] if settings else checklist_columns
+            ).encode()
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, str, str, str, str]] = []
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checklists (
+                dataset_path TEXT PRIMARY KEY,
+                dataset TEXT NOT NULL,
+                schema TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                checklist TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        self._entries: Dict[str, Tuple[str, str]] = {
+            dataset_path: (fingerprint, checklist)
+            for dataset_path, fingerprint, checklist in self._connection.execute(
+                "SELECT dataset_path, fingerprint, checklist FROM checklists WHERE schema = ?",
+                (self.schema,),
+            )
+        }
+
+    def lookup(
+        self, dataset_path: str, fingerprint: str
+    ) -> Optional[Dict[str, Optional[bool]]]:
+        """
+        Return the cached checklist for a dataset if its fingerprint did not change.
+
+        Args:
+            dataset_path (str): A path to the dataset directory.
+            fingerprint (str): The current fingerprint of the dataset.
+
+        Returns:
+            Optional[Dict[str, Optional[bool]]]: The cached checklist or None on a cache miss.
+        """
+        cached = self._entries.get(dataset_path)
+        hit = not self.refresh and cached is not None and cached[0] == fingerprint
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(cached[1]) if hit else None
+
+    def update(
+        self,
+        dataset_path: str,
+        fingerprint: str,
+        checklist: Mapping[str, Optional[bool]],
+    ) -> None:
+        """
+        Queue a dataset checklist to be written to the cache on `flush`.
+
+        Args:
+            dataset_path (str): A path to the dataset directory.
+            fingerprint (str): The fingerprint of the dataset the checklist was built from.
+            checklist (Mapping[str, Optional[bool]]): The checklist of the dataset.
+        """
+        serialized = json.dumps(dict(checklist))
+        with self._lock:
+            self._entries[dataset_path] = (fingerprint, serialized)
+            self._pending.append(
+                (
+                    dataset_path,
+                    os.path.basename(dataset_path),
+                    self.schema,
+                    fingerprint,
+                    serialized,
+                )
+            )
+
+    def invalidate(self, datasets: List[str]) -> int:
+        """
+        Remove cached checklists for datasets given by name or by path.
+
+        Args:
+            datasets (List[str]): A list of dataset names or paths.
+
+        Returns:
+            int: A number of removed checklists.
+        """
+        datasets = [dataset.rstrip("/") for dataset in datasets]
+        with self._connection:
+            removed = self._connection.executemany(
+                "DELETE FROM checklists WHERE dataset = ? OR dataset_path = ?",
+                [(dataset, dataset) for dataset in datasets],
+            ).rowcount
+        self._entries = {
+            dataset_path: entry
+            for dataset_path, entry in self._entries.items()
+            if dataset_path not in datasets
+            and os.path.basename(dataset_path) not in datasets
+        }
+        return removed
+
+    def flush(self) -> None:
+        """
+        Write queued checklists to the SQLite file.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT OR REPLACE INTO checklists (dataset_path, dataset, schema, fingerprint, checklist)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                pending,
+            )
+
+    def close(self) -> None:
+        """
+        Flush queued checklists and close the SQLite file.
+        """
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> "ValidationCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
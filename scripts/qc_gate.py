@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import fnmatch
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from solo_qc import (
+    MISSING_VALUES,
+    MalformedRow,
+    SoloQCReader,
+    column_type,
+    parse_value,
+    report_malformed,
+)
+from qc_rules import (
+    ALL_COLUMNS,
+    OPERATORS,
+    PRESENT,
+    Rule,
+    add_rules_argument,
+    load_rules,
+)
+
+GATE_HEADER = ["dataset", "sample", "passed", "reasons"]
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Gates samples of solo_qc.tsv files of many datasets with a set of QC rules and writes pass/fail with reason codes"
+    )
+    parser.add_argument(
+        "input",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of dataset directories, the first *solo*qc.tsv file of a directory is gated",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the table with a row per sample. Default: qc_gate.tsv",
+        default="qc_gate.tsv",
+    )
+    parser.add_argument(
+        "--passed_datasets",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of dataset directories with passed samples. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--passed_samples",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of passed samples. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--failed_datasets",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the list of dataset directories without a QC file or passed samples. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--batch_size",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of datasets gated at once. Default: 1000",
+        default=1000,
+    )
+    add_rules_argument(parser, "all")
+    return parser
+
+
+class QCTable:
+    """
+    Rows of solo_qc.tsv files of many datasets held as column arrays.
+
+    Raw values are kept as string arrays and numeric columns are converted once,
+    when a rule first needs them, so gating evaluates a rule over all the rows
+    with a few array operations. Files can have different columns, values of
+    columns missing from a file are missing. Rows with a wrong number of fields
+    are reported and skipped as by SoloQCReader.
+    """
+
+    def __init__(self) -> None:
+        self.columns: List[str] = []
+        self.datasets: List[str] = []
+        self.paths: List[str] = []
+        self.headers: List[List[str]] = []
+        # samples of every file, including malformed rows, as SoloQCReader.samples
+        self.file_samples: List[List[str]] = []
+        self.raw: Dict[str, np.ndarray] = {}
+        self.samples = np.array([], dtype=str)
+        self.file_index = np.array([], dtype=np.intp)
+        self.linenos = np.array([], dtype=np.intp)
+        self.report = True
+        self._values: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @classmethod
+    def read(
+        cls, files: Iterable[Tuple[str, str]], sep: str = "\t", report: bool = True
+    ) -> "QCTable":
+        """
+        Read solo_qc.tsv files into a table.
+
+        Args:
+            files (Iterable[Tuple[str, str]]): Dataset names with paths to their QC files.
+            sep (str, optional): A separator used in the files. Defaults to '\\t'.
+            report (bool, optional): Print malformed rows and values to stderr. Defaults to True.
+
+        Returns:
+            QCTable: The table.
+        """
+        table = cls()
+        raw: Dict[str, List[str]] = {}
+        samples, file_index, linenos = [], [], []
+        for dataset, path in files:
+            with SoloQCReader(path, sep=sep, report=report) as reader:
+                rows = [(row.lineno, row.fields) for row in reader]
+            for column in reader.header:
+                if column not in raw:
+                    raw[column] = [""] * len(samples)
+            count = len(rows)
+            if count:
+                values = zip(*(fields for _, fields in rows))
+                for column, column_values in zip(reader.header, values):
+                    raw[column].extend(column_values)
+                for column in raw.keys() - set(reader.header):
+                    raw[column].extend([""] * count)
+            samples.extend(fields[0] for _, fields in rows)
+            linenos.extend(lineno for lineno, _ in rows)
+            file_index.extend([len(table.paths)] * count)
+            table.datasets.append(dataset)
+            table.paths.append(path)
+            table.headers.append(reader.header)
+            table.file_samples.append(reader.samples)
+        table.columns = list(raw)
+        table.raw = {
+            column: np.array(values, dtype=str) for column, values in raw.items()
+        }
+        table.samples = np.array(samples, dtype=str)
+        table.file_index = np.array(file_index, dtype=np.intp)
+        table.linenos = np.array(linenos, dtype=np.intp)
+        table.report = report
+        return table
+
+    def dataset_rows(self, position: int) -> np.ndarray:
+        """
+        Return indices of the rows of the file at a position.
+        """
+        return np.flatnonzero(self.file_index == position)
+
+    def column(self, column: str) -> np.ndarray:
+        """
+        Return raw values of a column, empty strings if no file has it.
+        """
+        return self.raw.get(column, np.full(len(self), "", dtype=str))
+
+    def missing(self, column: str) -> np.ndarray:
+        """
+        Return a mask of rows with a missing or malformed value of a column.
+        """
+        if column not in self.raw:
+            return np.ones(len(self), dtype=bool)
+        if column_type(column) is str:
+            return np.isin(self.raw[column], list(MISSING_VALUES))
+        return np.isnan(self.values(column))
+
+    def incomplete(self) -> np.ndarray:
+        """
+        Return a mask of rows with an empty field in any column of their own file.
+
+        Only empty fields count, values such as `NA` or malformed numbers are
+        checked by the rules of their columns. Columns of other files of the table
+        are not checked.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for column in self.columns:
+            positions = [
+                position
+                for position, header in enumerate(self.headers)
+                if column in header
+            ]
+            mask |= np.isin(self.file_index, positions) & (self.raw[column] == "")
+        return mask
+
+    def values(self, column: str) -> np.ndarray:
+        """
+        Return values of a numeric column as floats, NaN for missing and malformed values.
+
+        Malformed values are reported once, when the column is first converted.
+        """
+        if column in self._values:
+            return self._values[column]
+        raw = self.raw.get(column)
+        if raw is None:
+            return np.full(len(self), np.nan)
+        value_type = column_type(column)
+        present = ~np.isin(raw, list(MISSING_VALUES))
+        valid = present & np.char.isdigit(raw) if value_type is int else present.copy()
+        values = np.full(len(self), np.nan)
+        try:
+            values[valid] = raw[valid].astype(np.float64)
+        except ValueError:
+            # some values are not numbers, they are rare enough to find one by one
+            for idx in np.flatnonzero(valid):
+                try:
+                    values[idx] = float(raw[idx])
+                except ValueError:
+                    valid[idx] = False
+        if self.report:
+            for idx in np.flatnonzero(present & ~valid):
+                try:
+                    parse_value(str(raw[idx]), value_type)
+                    reason = f"expected {value_type.__name__}, got {raw[idx]!r}"
+                except ValueError as error:
+                    reason = str(error)
+                report_malformed(
+                    MalformedRow(
+                        self.paths[self.file_index[idx]],
+                        int(self.linenos[idx]),
+                        str(self.samples[idx]),
+                        f"column {column}: {reason}",
+                    )
+                )
+        self._values[column] = values
+        return values
+
+    def records(self, rows: Iterable[int]) -> Iterator[Dict[str, str]]:
+        """
+        Yield raw values of all columns except the sample one for rows, as SoloQCRow.as_dict.
+        """
+        columns = self.columns[1:]
+        values = [self.raw[column].tolist() for column in columns]
+        for row in rows:
+            yield dict(zip(columns, (column[row] for column in values)))
+
+
+class GateResult:
+    """
+    Reason codes of failed rules for every row of a QCTable.
+    """
+
+    def __init__(self, table: QCTable, codes: List[str], failures: np.ndarray) -> None:
+        """
+        Args:
+            table (QCTable): The gated table.
+            codes (List[str]): Distinct rule codes.
+            failures (np.ndarray): A boolean array with a row per code and a column per table row.
+        """
+        self.table = table
+        self.codes = codes
+        self.failures = failures
+        self.passed = ~failures.any(axis=0)
+
+    def reasons(self) -> List[str]:
+        """
+        Return comma-separated codes of failed rules of every row, `-` if it passed.
+        """
+        reasons = np.full(len(self.table), "", dtype=object)
+        for code, failed in zip(self.codes, self.failures):
+            reasons[failed] += "," + code
+        return [value[1:] or "-" for value in reasons]
+
+    def passed_samples(self, position: int) -> List[str]:
+        """
+        Return passed samples of the file at a position in file order.
+        """
+        rows = self.table.dataset_rows(position)
+        return self.table.samples[rows[self.passed[rows]]].tolist()
+
+
+def rule_failures(table: QCTable, rule: Rule) -> np.ndarray:
+    """
+    Return a mask of rows failing a rule.
+    """
+    if rule.column == ALL_COLUMNS:
+        failed = table.incomplete()
+    elif rule.op == PRESENT:
+        failed = table.missing(rule.column)
+    else:
+        with np.errstate(invalid="ignore"):
+            failed = ~OPERATORS[rule.op](table.values(rule.column), rule.value)
+    if rule.species is not None:
+        failed &= np.isin(table.column("Species"), rule.species)
+    if rule.whitelist is not None:
+        failed &= np.isin(table.column("WL"), rule.whitelist)
+    return failed
+
+
+def gate(table: QCTable, rules: List[Rule]) -> GateResult:
+    """
+    Evaluate rules over all rows of a table.
+
+    Rules with the same code are combined, a row fails the code if it fails any of them.
+
+    Args:
+        table (QCTable): The table.
+        rules (List[Rule]): The rules.
+
+    Returns:
+        GateResult: Pass/fail and reason codes of every row.
+    """
+    codes = list(dict.fromkeys(rule.code for rule in rules))
+    failures = np.zeros((len(codes), len(table)), dtype=bool)
+    for rule in rules:
+        failures[codes.index(rule.code)] |= rule_failures(table, rule)
+    return GateResult(table, codes, failures)
+
+
+def find_solo_qc(dataset_dir: str) -> Optional[str]:
+    """
+    Return the QC file of a dataset directory, `<dataset>.solo_qc.tsv` or the first *solo*qc.tsv file found in it.
+    """
+    path = os.path.join(dataset_dir, f"{os.path.basename(dataset_dir)}.solo_qc.tsv")
+    if os.path.isfile(path):
+        return path
+    for root, _, files in os.walk(dataset_dir):
+        for name in files:
+            if fnmatch.fnmatch(name, "*solo*qc.tsv"):
+                return os.path.join(root, name)
+    return None
+
+
+def main() -> None:
+    """
+    The main entry point for the QC gating script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    rules = load_rules(args.qc_rules)
+    with open(args.input, "r") as file:
+        dataset_dirs = [line.rstrip("\n") for line in file if line.strip()]
+
+    # optional outputs are discarded if they are not requested
+    paths = [
+        args.output,
+        args.passed_datasets,
+        args.passed_samples,
+        args.failed_datasets,
+    ]
+    outputs = [open(path or os.devnull, "w") for path in paths]
+    output, passed_datasets, passed_samples, failed_datasets = outputs
+    passed_count = samples_count = 0
+    try:
+        output.write("\t".join(GATE_HEADER) + "\n")
+        for start in range(0, len(dataset_dirs), args.batch_size):
+            batch = dataset_dirs[start : start + args.batch_size]
+            qc_files = {dataset_dir: find_solo_qc(dataset_dir) for dataset_dir in batch}
+            table = QCTable.read(
+                (dataset_dir, path) for dataset_dir, path in qc_files.items() if path
+            )
+            result = gate(table, rules)
+            for dataset, sample, passed, reasons in zip(
+                [table.datasets[position] for position in table.file_index.tolist()],
+                table.samples.tolist(),
+                result.passed.tolist(),
+                result.reasons(),
+            ):
+                dataset = os.path.basename(dataset)
+                output.write(f"{dataset}\t{sample}\t{passed}\t{reasons}\n")
+
+            # datasets are listed in the input order
+            positions = {
+                dataset_dir: idx for idx, dataset_dir in enumerate(table.datasets)
+            }
+            for dataset_dir in batch:
+                if qc_files[dataset_dir] is None:
+                    print(
+                        f"ERROR: Could not find solo_qc.tsv in {dataset_dir}",
+                        file=sys.stderr,
+                    )
+                    failed_datasets.write(dataset_dir + "\n")
+                    continue
+                samples = result.passed_samples(positions[dataset_dir])
+                if samples:
+                    passed_datasets.write(dataset_dir + "\n")
+                    passed_samples.write("".join(f"{s}\n" for s in samples))
+                    passed_count += 1
+                    samples_count += len(samples)
+                else:
+                    failed_datasets.write(dataset_dir + "\n")
+    finally:
+        for file in outputs:
+            file.close()
+    print(
+        f"All datasets: {len(dataset_dirs)}, passing datasets: {passed_count}, passing samples: {samples_count}. Results saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
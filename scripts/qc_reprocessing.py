@@ -1,18 +1,35 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
-import glob
 import argparse
-import pandas as pd
-from typing import List, Dict, Optional, Callable
+from datetime import datetime
+from typing import List, Dict, Iterable, Iterator, Optional, Callable, Pattern, Tuple
+from collections.abc import MutableMapping
 from itertools import chain
-from functools import wraps
+from functools import wraps, partial
+from concurrent.futures import ThreadPoolExecutor
+from checklist import Checklist, ChecklistWriter
+from dataset_snapshot import DatasetSnapshot
+from fastq_check import CHECK_MODES, check_fastqs, is_fastq, pair_fastqs
+from metrics import add_metrics_arguments, metrics
+from qc_cache import ValidationCache, dataset_fingerprint
+from qc_rules import (
+    MAPPING_RULES,
+    Rule,
+    add_rules_argument,
+    load_rules,
+    rules_signature,
+)
 
 
 METAFILE_SUFFIXES = ["run.list", "sample.list", "sample_x_run.tsv", "parsed.tsv"]
 DB_METAFILE_SUFFIXES = [".idf.txt", ".sdrf.txt", "_family.soft"]
 
+# accessions found in names of dataset directories
+DATASET_PATTERNS = ["GSE", "E-MTAB", "PRJNA", "SDY"]
+
 INFORMATIVE_COLUMNS = [
     "meta_exist",
     "db_meta_exist",
@@ -43,6 +60,14 @@ ADDITIONAL_COLUMNS = [
     "starsolo_existTmp_samples",
     "missing_solo_qc_samples",
     "solo_qc_mapped_samples",
+    # new columns are appended, so positions of the columns before them do not change
+    "validation_completed",
+    "validation_error",
+    "all_fastq_paired",
+    "all_fastq_intact",
+    "unpaired_fastq_samples",
+    "damaged_fastq_files",
+    "unverified_fastq_files",
 ]
 
 MUST_BE_TRUE_COLUMNS = [
@@ -51,6 +76,8 @@ MUST_BE_TRUE_COLUMNS = [
     "all runs in run.list",
     "all samples in sample.list",
     "all runs in parsed.list",
+    "all_fastq_paired",
+    "all_fastq_intact",
     "starsolo_allnonemptyexist",
     "starsolo_existOutput",
     "starsolo_existFinalLog",
@@ -58,6 +85,7 @@ MUST_BE_TRUE_COLUMNS = [
     "solo_qc_exists",
     "solo_qc_nonempty",
     "solo_qc_all_samples",
+    "validation_completed",
 ]
 
 
@@ -114,9 +142,85 @@ def init_parser() -> argparse.ArgumentParser:
         help="Specify a separator for checklist file. Default: \\t",
         default="\t",
     )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of datasets to validate concurrently. Default: 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite validation cache, unchanged datasets are not validated again. Example: qc_cache.sqlite",
+        default=None,
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Validate all datasets and overwrite their cached checklists",
+    )
+    parser.add_argument(
+        "--invalidate",
+        metavar="<dataset>",
+        type=str,
+        action="append",
+        help="Specify a dataset name or path to remove from the validation cache. Can be used several times",
+        default=[],
+    )
+    parser.add_argument(
+        "--dataset_pattern",
+        metavar="<regex>",
+        type=str,
+        action="append",
+        help="Specify a regular expression matching names of dataset directories in --source in addition to GSE, E-MTAB, PRJNA and SDY. Can be used several times",
+        default=[],
+    )
+    parser.add_argument(
+        "--prefix",
+        metavar="<str>",
+        type=str,
+        action="append",
+        help="Specify an accession prefix of datasets to validate, e.g. GSE. Can be used several times. Default: all datasets",
+        default=[],
+    )
+    parser.add_argument(
+        "--modified_since",
+        metavar="<time>",
+        type=parse_time,
+        help="Specify a date or time in ISO format, only dataset directories modified since then are validated. Example: 2024-05-01",
+        default=None,
+    )
+    parser.add_argument(
+        "--fastq_check",
+        type=str,
+        choices=CHECK_MODES,
+        help="Specify a FASTQ integrity check: tail reads the end of every file to find truncated ones, full decompresses them. R1 and R2 files of every sample must pair up. Default: None",
+        default=None,
+    )
+    parser.add_argument(
+        "--fastq_workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of FASTQ files of a dataset checked concurrently. Default: 8",
+        default=8,
+    )
+    add_rules_argument(parser, "mapping")
+    add_metrics_arguments(parser)
     return parser
 
 
+def parse_time(value: str) -> float:
+    """
+    Convert a date or time in ISO format to a timestamp.
+    """
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid ISO date or time: {value!r}")
+
+
 def validate_checklist_values(func: Callable) -> Callable:
     """
     Decorator that ensures the checklist is valid before calling the wrapped function.
@@ -130,7 +234,7 @@ def validate_checklist_values(func: Callable) -> Callable:
 
     @wraps(func)
     def wrapper(checklist: Dict[str, Optional[bool]], *args, **kwargs) -> None:
-        if isinstance(checklist, dict) and all(
+        if isinstance(checklist, MutableMapping) and all(
             value in (True, None) for value in checklist.values()
         ):
             func(checklist, *args, **kwargs)
@@ -138,6 +242,23 @@ def validate_checklist_values(func: Callable) -> Callable:
     return wrapper
 
 
+def compile_dataset_matcher(extra_patterns: Iterable[str] = ()) -> Pattern:
+    """
+    Compile a regular expression finding any of DATASET_PATTERNS or extra patterns in a name.
+
+    Args:
+        extra_patterns (Iterable[str], optional): Additional regular expressions. Defaults to none.
+
+    Returns:
+        Pattern: The compiled regular expression.
+    """
+    patterns = [re.escape(pattern) for pattern in DATASET_PATTERNS]
+    return re.compile("|".join(patterns + list(extra_patterns)))
+
+
+DATASET_MATCHER = compile_dataset_matcher()
+
+
 def check_if_dataset(dataset_path: str) -> bool:
     """
     Check if directory name suggests a valid dataset and if path is a directory.
@@ -149,32 +270,77 @@ def check_if_dataset(dataset_path: str) -> bool:
         bool: True if directory name suggests a valid dataset, otherwise False.
     """
     dataset_name = os.path.basename(dataset_path)
-    is_dataset_name = (
-        lambda dn: ("GSE" in dn) or ("E-MTAB" in dn) or ("PRJNA" in dn) or ("SDY" in dn)
-    )
-    return is_dataset_name(dataset_name) and os.path.isdir(dataset_path)
+    return bool(DATASET_MATCHER.search(dataset_name)) and os.path.isdir(dataset_path)
+
 
+def discover_datasets(
+    source: str,
+    matcher: Pattern = DATASET_MATCHER,
+    prefixes: Iterable[str] = (),
+    modified_since: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    Yield paths of dataset directories in a directory as they are found.
+
+    The directory is listed once with `os.scandir`. Names are matched before
+    anything else and directories are told from files by the entry type the
+    listing returns, so no entry is stat'ed unless it is a symlink or
+    `modified_since` is given. Hidden entries are skipped.
+
+    Args:
+        source (str): A path to the directory with datasets.
+        matcher (Pattern, optional): A regular expression dataset names contain. Defaults to DATASET_MATCHER.
+        prefixes (Iterable[str], optional): Accession prefixes of datasets to keep. Defaults to all datasets.
+        modified_since (Optional[float], optional): A timestamp, datasets modified before it are skipped. Defaults to None.
 
-def get_datasets(args: argparse.Namespace) -> List[str]:
+    Yields:
+        str: Paths of dataset directories in the listing order.
     """
-    Return a list of dataset paths based on args.source or args.dirlist.
+    prefixes = tuple(prefixes)
+    with os.scandir(source.rstrip("/") or "/") as iterator:
+        for entry in iterator:
+            name = entry.name
+            if name.startswith(".") or not matcher.search(name):
+                continue
+            if prefixes and not name.startswith(prefixes):
+                continue
+            if not entry.is_dir():
+                continue
+            if modified_since is not None and entry.stat().st_mtime < modified_since:
+                continue
+            yield entry.path
+
+
+def get_datasets(args: argparse.Namespace) -> Iterator[str]:
+    """
+    Return dataset paths based on args.source or args.dirlist, filtered by args.prefix and args.modified_since.
+
+    Datasets in args.source are discovered lazily, so validation can start
+    before the whole directory is listed.
 
     Args:
         args (argparse.Namespace): The command-line arguments.
 
     Returns:
-        List[str]: A list of dataset paths.
-    """
-    if args.dirlist:
-        with open(args.dirlist, "r") as file:
-            dataset_paths = [path.rstrip() for path in file.readlines()]
-        if len(dataset_paths) == 0:
-            print("No datasets found in the list")
-            sys.exit()
-    else:
-        dataset_paths = glob.glob(f"{args.source.rstrip('/')}/*")
-        dataset_paths = [dp for dp in dataset_paths if check_if_dataset(dp)]
-    return dataset_paths
+        Iterator[str]: Dataset paths.
+    """
+    if not args.dirlist:
+        matcher = compile_dataset_matcher(args.dataset_pattern)
+        return discover_datasets(args.source, matcher, args.prefix, args.modified_since)
+    with open(args.dirlist, "r") as file:
+        dataset_paths = [path.rstrip() for path in file.readlines()]
+    if len(dataset_paths) == 0:
+        print("No datasets found in the list")
+        sys.exit()
+    prefixes = tuple(args.prefix)
+    return (
+        path
+        for path in dataset_paths
+        if (not prefixes or os.path.basename(path).startswith(prefixes))
+        and (
+            args.modified_since is None or os.stat(path).st_mtime >= args.modified_since
+        )
+    )
 
 
 def make_full_path(basedir: str, dataset: str, filename: str) -> str:
@@ -192,31 +358,14 @@ def make_full_path(basedir: str, dataset: str, filename: str) -> str:
     return os.path.join(basedir, dataset, filename)
 
 
-def exist_nonempty(path: str, type: str = "file") -> bool:
-    """
-    Return True if file or directory at path is non-empty.
-
-    Args:
-        path (str): The file or directory path to check.
-        type (str, optional): The type of checking ('file' or 'dir'). Defaults to 'file'.
-
-    Returns:
-        bool: True if the specified path is non-empty, False otherwise.
-    """
-    if type == "file":
-        return os.path.isfile(path) and os.path.getsize(path) > 0
-    elif type == "dir":
-        return os.path.isdir(path) and os.listdir(path)
-    else:
-        raise ValueError
-
-
 # @validate_checklist_values
+@metrics.timed("qc.check_metafiles_exist", dataset_arg="datasetname")
 def check_metafiles_exist(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
     datasetname: str,
     metafile_suffixes: List[str],
+    snapshot: DatasetSnapshot,
 ) -> None:
     """
     Check if metadata files exist and update checklist.
@@ -226,26 +375,30 @@ def check_metafiles_exist(
         basedir (str): The base directory.
         datasetname (str): The dataset name.
         metafile_suffixes (List[str]): The list of metafile suffixes.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
 
     Returns:
         None
     """
     checklist.update({"meta_exist": True, "meta_lost": None})
-    meta_paths = [
-        make_full_path(basedir, datasetname, f"{datasetname}.{suffix}")
-        for suffix in metafile_suffixes
+    meta_files = [f"{datasetname}.{suffix}" for suffix in metafile_suffixes]
+    lost_files = [
+        make_full_path(basedir, datasetname, file)
+        for file in meta_files
+        if not snapshot.exist_nonempty(file, type="file")
     ]
-    lost_files = [file for file in meta_paths if not exist_nonempty(file, type="file")]
     if lost_files:
         checklist["meta_exist"] = False
         checklist["meta_lost"] = ",".join(lost_files)
 
 
+@metrics.timed("qc.check_db_meta_exist", dataset_arg="datasetname")
 def check_db_meta_exist(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
     datasetname: str,
     db_meta_suffixes: List[str],
+    snapshot: DatasetSnapshot,
 ) -> None:
     """
     Check if database metadata files exist and update checklist.
@@ -255,15 +408,13 @@ def check_db_meta_exist(
         basedir (str): The base directory.
         datasetname (str): The dataset name.
         db_meta_suffixes (List[str]): The list of database metadata file suffixes.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
 
     Returns:
         None
     """
-    db_meta_paths = [
-        make_full_path(basedir, datasetname, f"{datasetname}{suffix}")
-        for suffix in db_meta_suffixes
-    ]
-    exist_list = [exist_nonempty(file, type="file") for file in db_meta_paths]
+    db_meta_files = [f"{datasetname}{suffix}" for suffix in db_meta_suffixes]
+    exist_list = [snapshot.exist_nonempty(file, type="file") for file in db_meta_files]
     checklist["db_meta_exist"] = any(exist_list)
 
 
@@ -347,6 +498,7 @@ def check_sample_x_run_file(
 
 
 # @validate_checklist_values
+@metrics.timed("qc.check_metafiles")
 def check_metafiles(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
@@ -380,34 +532,41 @@ def check_metafiles(
 
 
 # @validate_checklist_values
+@metrics.timed("qc.validate_fastqs")
 def validate_fastqs(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
     dataset: str,
     sample_to_runs: Dict[str, Optional[List[str]]],
+    snapshot: DatasetSnapshot,
+    fastq_check: Optional[str] = None,
+    fastq_workers: int = 8,
 ) -> None:
     """
     Check the fastqs directory presence and contents.
 
+    If fastq_check is set, the FASTQ files of the samples are checked for
+    integrity as well, see `check_fastq_integrity`.
+
     Args:
         checklist (Dict[str, Optional[bool]]): The dictionary tracking validation statuses.
         basedir (str): The base directory.
         dataset (str): The dataset name.
         sample_to_runs (Dict[str, Optional[List[str]]]): A dictionary mapping samples to their run IDs.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
+        fastq_check (Optional[str], optional): The FASTQ integrity check, one of CHECK_MODES, or None to skip it. Defaults to None.
+        fastq_workers (int, optional): A number of FASTQ files checked concurrently. Defaults to 8.
 
     Returns:
         None
     """
     samples = set(sample_to_runs.keys())
-    fastqdir_path = os.path.join(basedir, dataset, "fastqs")
-    if exist_nonempty(fastqdir_path, type="dir"):
+    if snapshot.exist_nonempty("fastqs", type="dir"):
         checklist["fastqdir_nonemptyexist"] = True
-        lost_samples = samples.difference(os.listdir(fastqdir_path))
+        lost_samples = samples.difference(snapshot.listdir("fastqs"))
         if not lost_samples:
             checklist["all_fastq_samples"] = True
-            fastqnum_persample = {
-                s: len(os.listdir(os.path.join(fastqdir_path, s))) for s in samples
-            }
+            fastqnum_persample = {s: snapshot.count("fastqs", s) for s in samples}
             lostrun_samples_list = [
                 s
                 for s in samples
@@ -421,15 +580,102 @@ def validate_fastqs(
         else:
             checklist["all_fastq_samples"] = False
             checklist["missing_fastq_samples"] = ",".join(lost_samples)
+        if fastq_check is not None:
+            check_fastq_integrity(
+                checklist,
+                dataset,
+                sorted(samples.intersection(snapshot.listdir("fastqs"))),
+                snapshot,
+                fastq_check,
+                fastq_workers,
+            )
     else:
         checklist["fastqdir_nonemptyexist"] = False
 
 
+def check_fastq_integrity(
+    checklist: Dict[str, Optional[bool]],
+    dataset: str,
+    samples: List[str],
+    snapshot: DatasetSnapshot,
+    mode: str,
+    workers: int = 8,
+) -> None:
+    """
+    Check that FASTQ files of samples are intact and that their R1 and R2 files pair up.
+
+    All files of the dataset are checked concurrently. A sample is unpaired if
+    one of its R1 or R2 files has no mate, or if the last reads of mates differ.
+    Files the tail check can't verify, such as single-member gzip files, are
+    listed separately and do not count as intact.
+
+    Args:
+        checklist (Dict[str, Optional[bool]]): The dictionary tracking validation statuses.
+        dataset (str): The dataset name.
+        samples (List[str]): Samples with a directory in `fastqs`.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
+        mode (str): The check, one of CHECK_MODES.
+        workers (int, optional): A number of files checked concurrently. Defaults to 8.
+
+    Returns:
+        None
+    """
+    sample_fastqs = {
+        sample: sorted(filter(is_fastq, snapshot.listdir("fastqs", sample)))
+        for sample in samples
+        if snapshot.is_dir("fastqs", sample)
+    }
+    paths = [
+        snapshot.path("fastqs", sample, name)
+        for sample, names in sample_fastqs.items()
+        for name in names
+    ]
+    with metrics.stage(
+        "qc.check_fastqs", dataset, parent="qc.validate_fastqs"
+    ) as stage:
+        results = check_fastqs(paths, mode, workers)
+        stage.add_files(*paths)
+
+    unpaired_samples, damaged_files, unverified_files = [], [], []
+    for sample, names in sample_fastqs.items():
+        fastqs = {
+            name: results[snapshot.path("fastqs", sample, name)] for name in names
+        }
+        damaged_files.extend(
+            f"{sample}/{name}:{result.reason}"
+            for name, result in fastqs.items()
+            if not result.ok
+        )
+        unverified_files.extend(
+            f"{sample}/{name}" for name, result in fastqs.items() if not result.verified
+        )
+        pairs, unpaired = pair_fastqs(names)
+        mismatched = [
+            (read1, read2)
+            for read1, read2 in pairs
+            if fastqs[read1].last_read
+            and fastqs[read2].last_read
+            and fastqs[read1].last_read != fastqs[read2].last_read
+        ]
+        if unpaired or mismatched:
+            unpaired_samples.append(sample)
+    checklist["all_fastq_paired"] = not unpaired_samples
+    checklist["unpaired_fastq_samples"] = ",".join(unpaired_samples) or None
+    # files the tail check could not verify leave the check unset unless others are damaged
+    checklist["all_fastq_intact"] = (
+        False if damaged_files else None if unverified_files else True
+    )
+    checklist["damaged_fastq_files"] = ",".join(damaged_files) or None
+    checklist["unverified_fastq_files"] = ",".join(unverified_files) or None
+
+
+@metrics.timed("qc.validate_starsolo")
 def validate_starsolo(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
     dataset: str,
     sample_to_runs: Dict[str, Optional[List[str]]],
+    snapshot: DatasetSnapshot,
 ) -> None:
     """
     Validate the presence and completeness of STARsolo outputs.
@@ -439,36 +685,25 @@ def validate_starsolo(
         basedir (str): The base directory.
         dataset (str): The dataset name.
         sample_to_runs (Dict[str, Optional[List[str]]]): A dictionary mapping samples to their run IDs.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
 
     Returns:
         None
     """
     samples = set(sample_to_runs.keys())
-    not_ok_dirs = [
-        s
-        for s in samples
-        if not exist_nonempty(os.path.join(basedir, dataset, s), type="dir")
-    ]
+    not_ok_dirs = [s for s in samples if not snapshot.exist_nonempty(s, type="dir")]
     if not not_ok_dirs:
         checklist["starsolo_allnonemptyexist"] = True
         no_output_dirs = [
-            s
-            for s in samples
-            if not exist_nonempty(
-                os.path.join(basedir, dataset, s, "output"), type="dir"
-            )
+            s for s in samples if not snapshot.exist_nonempty(s, "output", type="dir")
         ]
         no_final_log_file = [
             s
             for s in samples
-            if not exist_nonempty(
-                os.path.join(basedir, dataset, s, "Log.final.out"), type="file"
-            )
+            if not snapshot.exist_nonempty(s, "Log.final.out", type="file")
         ]
         tmp_exists = [
-            s
-            for s in samples
-            if exist_nonempty(os.path.join(basedir, dataset, s, "_STARtmp"), type="dir")
+            s for s in samples if snapshot.exist_nonempty(s, "_STARtmp", type="dir")
         ]
         checklist["starsolo_existOutput"] = not bool(no_output_dirs)
         checklist["starsolo_emptyOutput_samples"] = (
@@ -487,95 +722,258 @@ def validate_starsolo(
         checklist["missing_starsolo_samples"] = ",".join(not_ok_dirs)
 
 
+@metrics.timed("qc.validate_solo_qc")
 def validate_solo_qc(
     checklist: Dict[str, Optional[bool]],
     basedir: str,
     dataset: str,
     sample_to_runs: Dict[str, Optional[List[str]]],
+    snapshot: DatasetSnapshot,
+    qc_rules: Optional[List[Rule]] = None,
 ) -> None:
     """
     Validate the presence and content of the solo_qc.tsv file.
 
+    The file is read in a single pass and its samples are gated with the QC
+    rules, samples that pass them are mapped. Malformed rows are reported and are
+    not counted as mapped.
+
     Args:
         checklist (Dict[str, Optional[bool]]): The dictionary tracking validation statuses.
         basedir (str): The base directory.
         dataset (str): The dataset name.
         sample_to_runs (Dict[str, Optional[List[str]]]): A dictionary mapping samples to their run IDs.
+        snapshot (DatasetSnapshot): The snapshot of the dataset directory tree.
+        qc_rules (Optional[List[Rule]], optional): The rules mapped samples pass, MAPPING_RULES if None. Defaults to None.
 
     Returns:
         None
     """
     samples = set(sample_to_runs.keys())
     solo_qc_path = os.path.join(basedir, dataset, f"{dataset}.solo_qc.tsv")
-    checklist["solo_qc_exists"] = exist_nonempty(solo_qc_path, type="file")
+    checklist["solo_qc_exists"] = snapshot.exist_nonempty(
+        f"{dataset}.solo_qc.tsv", type="file"
+    )
     if checklist["solo_qc_exists"]:
-        with open(solo_qc_path, "r") as file:
-            lines = file.readlines()
-            checklist["solo_qc_nonempty"] = bool(len(lines) - 1)
+        # numpy is only imported once a dataset with a QC file is validated
+        from qc_gate import QCTable, gate
+
+        table = QCTable.read([(dataset, solo_qc_path)])
+        # get mapped samples
+        result = gate(table, MAPPING_RULES if qc_rules is None else qc_rules)
+        mapped_samples = result.passed_samples(0)
+        samples_in_file = table.file_samples[0]
+        checklist["solo_qc_nonempty"] = bool(samples_in_file)
         if checklist["solo_qc_nonempty"]:
-            samples_in_file = get_first_column(solo_qc_path)[1:]
             lost_samples = samples.difference(samples_in_file)
             checklist["solo_qc_all_samples"] = not bool(lost_samples)
             checklist["missing_solo_qc_samples"] = (
                 ",".join(lost_samples) if lost_samples else None
             )
-            # find mapping fraction column index
-            header = lines[0].rstrip().split("\t")
-            column_idx = header.index("all_u+m")
-
-            # get mapped samples
-            mapped_samples = [
-                samples_in_file[i]
-                for i, line in enumerate(lines[1:])
-                if len(header) == len(line.rstrip().split("\t"))
-                and float(line.rstrip().split("\t")[column_idx]) > 0.5
-            ]
             checklist["solo_qc_mapped_samples"] = ",".join(mapped_samples)
 
 
-def validate_basedir(
-    dataset_paths: List[str],
+def validate_dataset(
+    dataset_path: str,
     checklist_columns: List[str],
     metafile_suffixes: List[str],
     db_metafile_suffixes: List[str],
-) -> pd.DataFrame:
+    qc_rules: Optional[List[Rule]] = None,
+    fastq_check: Optional[str] = None,
+    fastq_workers: int = 8,
+) -> Tuple[str, Checklist]:
     """
-    Validate all datasets in dataset_paths and return a DataFrame with results.
+    Validate a single dataset and return its name together with the checklist.
+
+    The dataset tree is scanned once into a DatasetSnapshot and all the
+    validators query the snapshot instead of the filesystem. An exception raised
+    by any of the validators does not propagate: the dataset is marked as not
+    validated and the error is recorded in the checklist.
 
     Args:
-        dataset_paths (List[str]): A list of dataset paths to validate.
+        dataset_path (str): A path to the dataset to validate.
         checklist_columns (List[str]): A list of columns to include in the checklist.
         metafile_suffixes (List[str]): A list of metadata file suffixes.
         db_metafile_suffixes (List[str]): A list of database metadata file suffixes.
+        qc_rules (Optional[List[Rule]], optional): The rules mapped samples pass, MAPPING_RULES if None. Defaults to None.
+        fastq_check (Optional[str], optional): The FASTQ integrity check, one of CHECK_MODES, or None to skip it. Defaults to None.
+        fastq_workers (int, optional): A number of FASTQ files checked concurrently. Defaults to 8.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the checklist results for each dataset.
-    """
-    checklist_dict: Dict[str, Dict[str, Optional[bool]]] = {}
-    for dataset_path in dataset_paths:
-        dataset, basedir = os.path.basename(dataset_path), os.path.dirname(dataset_path)
-        checklist = {col: None for col in checklist_columns}
-        check_metafiles_exist(checklist, basedir, dataset, metafile_suffixes)
-        if isinstance(checklist, dict) and all(
-            value in (True, None) for value in checklist.values()
-        ):
+        Tuple[str, Checklist]: The dataset name and its checklist.
+    """
+    dataset, basedir = os.path.basename(dataset_path), os.path.dirname(dataset_path)
+    checklist = Checklist(checklist_columns)
+    try:
+        with metrics.stage("qc.scan", dataset) as stage:
+            snapshot = DatasetSnapshot.scan(dataset_path)
+            stage.add(**snapshot.stats())
+        if snapshot.errors:
+            raise PermissionError(f"can't read {', '.join(snapshot.errors)}")
+        check_metafiles_exist(checklist, basedir, dataset, metafile_suffixes, snapshot)
+        if all(value in (True, None) for value in checklist.values()):
             sample_x_run_path = os.path.join(
                 basedir, dataset, f"{dataset}.sample_x_run.tsv"
             )
-            sample_to_run = check_sample_x_run_file(checklist, sample_x_run_path)
+            with metrics.stage("qc.check_sample_x_run_file", dataset) as stage:
+                sample_to_run = check_sample_x_run_file(checklist, sample_x_run_path)
+                stage.add_files(sample_x_run_path)
             check_metafiles(checklist, basedir, dataset, sample_to_run)
-            validate_fastqs(checklist, basedir, dataset, sample_to_run)
-            validate_starsolo(checklist, basedir, dataset, sample_to_run)
-            validate_solo_qc(checklist, basedir, dataset, sample_to_run)
-            check_db_meta_exist(checklist, basedir, dataset, db_metafile_suffixes)
-        checklist_dict[dataset] = checklist
-    return pd.DataFrame(checklist_dict).T.sort_index()
+            validate_fastqs(
+                checklist,
+                basedir,
+                dataset,
+                sample_to_run,
+                snapshot,
+                fastq_check,
+                fastq_workers,
+            )
+            validate_starsolo(checklist, basedir, dataset, sample_to_run, snapshot)
+            validate_solo_qc(
+                checklist, basedir, dataset, sample_to_run, snapshot, qc_rules
+            )
+            check_db_meta_exist(
+                checklist, basedir, dataset, db_metafile_suffixes, snapshot
+            )
+    except Exception as error:
+        print(f"ERROR: failed to validate {dataset_path}: {error}", file=sys.stderr)
+        checklist["validation_completed"] = False
+        checklist["validation_error"] = f"{type(error).__name__}: {error}"
+    else:
+        checklist["validation_completed"] = True
+    return dataset, checklist
+
+
+def validate_dataset_cached(
+    dataset_path: str,
+    checklist_columns: List[str],
+    metafile_suffixes: List[str],
+    db_metafile_suffixes: List[str],
+    cache: ValidationCache,
+    qc_rules: Optional[List[Rule]] = None,
+    fastq_check: Optional[str] = None,
+    fastq_workers: int = 8,
+) -> Tuple[str, Checklist]:
+    """
+    Return the cached checklist of a dataset or validate it if its inputs changed.
+
+    Args:
+        dataset_path (str): A path to the dataset to validate.
+        checklist_columns (List[str]): A list of columns to include in the checklist.
+        metafile_suffixes (List[str]): A list of metadata file suffixes.
+        db_metafile_suffixes (List[str]): A list of database metadata file suffixes.
+        cache (ValidationCache): The validation cache, opened with the signature of non-default QC rules.
+        qc_rules (Optional[List[Rule]], optional): The rules mapped samples pass, MAPPING_RULES if None. Defaults to None.
+        fastq_check (Optional[str], optional): The FASTQ integrity check, one of CHECK_MODES, or None to skip it. Defaults to None.
+        fastq_workers (int, optional): A number of FASTQ files checked concurrently. Defaults to 8.
+
+    Returns:
+        Tuple[str, Checklist]: The dataset name and its checklist.
+    """
+    try:
+        fingerprint = dataset_fingerprint(
+            dataset_path, fastq_files=fastq_check is not None
+        )
+    except OSError:
+        fingerprint = None
+    if fingerprint is not None:
+        cached = cache.lookup(dataset_path, fingerprint)
+        if cached is not None:
+            return os.path.basename(dataset_path), Checklist.from_dict(
+                checklist_columns, cached
+            )
+    dataset, checklist = validate_dataset(
+        dataset_path,
+        checklist_columns,
+        metafile_suffixes,
+        db_metafile_suffixes,
+        qc_rules,
+        fastq_check,
+        fastq_workers,
+    )
+    # failed validations are not cached so that they are retried on the next run
+    if fingerprint is not None and checklist["validation_completed"]:
+        cache.update(dataset_path, fingerprint, checklist)
+    return dataset, checklist
+
+
+def validate_basedir(
+    dataset_paths: Iterable[str],
+    checklist_columns: List[str],
+    metafile_suffixes: List[str],
+    db_metafile_suffixes: List[str],
+    workers: int = 1,
+    cache: Optional[ValidationCache] = None,
+    qc_rules: Optional[List[Rule]] = None,
+    fastq_check: Optional[str] = None,
+    fastq_workers: int = 8,
+) -> Iterator[Tuple[str, str, Checklist]]:
+    """
+    Validate all datasets in dataset_paths and yield their checklists sorted by dataset name.
+
+    Validation is bound by filesystem latency rather than CPU, so with workers > 1
+    datasets are validated concurrently on a thread pool, starting while
+    dataset_paths is still being consumed. Checklists are yielded
+    as soon as they and all the checklists before them are ready, so they can be
+    written out while the rest is validated. The result does not depend on the
+    number of workers. If a cache is given, datasets whose inputs did not change
+    since the last run are served from it.
+
+    Args:
+        dataset_paths (Iterable[str]): Dataset paths to validate.
+        checklist_columns (List[str]): A list of columns to include in the checklist.
+        metafile_suffixes (List[str]): A list of metadata file suffixes.
+        db_metafile_suffixes (List[str]): A list of database metadata file suffixes.
+        workers (int, optional): A number of datasets to validate concurrently. Defaults to 1.
+        cache (Optional[ValidationCache], optional): The validation cache. Defaults to None.
+        qc_rules (Optional[List[Rule]], optional): The rules mapped samples pass, MAPPING_RULES if None. Defaults to None.
+        fastq_check (Optional[str], optional): The FASTQ integrity check, one of CHECK_MODES, or None to skip it. Defaults to None.
+        fastq_workers (int, optional): A number of FASTQ files checked concurrently. Defaults to 8.
+
+    Yields:
+        Tuple[str, str, Checklist]: The dataset path, the dataset name and its checklist.
+    """
+    validate = partial(
+        validate_dataset,
+        checklist_columns=checklist_columns,
+        metafile_suffixes=metafile_suffixes,
+        db_metafile_suffixes=db_metafile_suffixes,
+        qc_rules=qc_rules,
+        fastq_check=fastq_check,
+        fastq_workers=fastq_workers,
+    )
+    if cache is not None:
+        validate = partial(
+            validate_dataset_cached,
+            checklist_columns=checklist_columns,
+            metafile_suffixes=metafile_suffixes,
+            db_metafile_suffixes=db_metafile_suffixes,
+            cache=cache,
+            qc_rules=qc_rules,
+            fastq_check=fastq_check,
+            fastq_workers=fastq_workers,
+        )
+    if workers > 1:
+        # datasets are validated as soon as they are found, results are sorted once all are found
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (path, executor.submit(validate, path)) for path in dataset_paths
+            ]
+            futures.sort(key=lambda item: os.path.basename(item[0]))
+            for path, future in futures:
+                yield (path, *future.result())
+    else:
+        for path in sorted(dataset_paths, key=os.path.basename):
+            yield (path, *validate(path))
 
 
 def main() -> None:
     """
     The main entry point for the QC reprocessing script.
 
+    Checklists are written to the checklist file and datasets to the pass or fail
+    list as soon as they are validated.
+
     Args:
         None
 
@@ -584,31 +982,67 @@ def main() -> None:
     """
     parser = init_parser()
     args = parser.parse_args()
+    metrics.configure(args.metrics)
     if args.source is None and args.dirlist is None:
         parser.print_help()
         sys.exit()
-    dataset_paths = get_datasets(args)
-    dataset_path_dict = {os.path.basename(dp): dp for dp in dataset_paths}
     checklist_columns = INFORMATIVE_COLUMNS + ADDITIONAL_COLUMNS
-    checklist_df = validate_basedir(
-        dataset_paths, checklist_columns, METAFILE_SUFFIXES, DB_METAFILE_SUFFIXES
-    )
-    pass_list = checklist_df[
-        checklist_df[MUST_BE_TRUE_COLUMNS].all(axis=1)
-    ].index.tolist()
-    fail_list = checklist_df.index.difference(pass_list).tolist()
-    print(
-        f"PASS: {len(pass_list)}, FAIL: {len(fail_list)}, ALL: {checklist_df.shape[0]}"
+    qc_rules = load_rules(args.qc_rules)
+    # checklists cached with other rules have other mapped samples and
+    # checklists cached without a FASTQ check do not have its results
+    settings = [] if qc_rules == MAPPING_RULES else [rules_signature(qc_rules)]
+    if args.fastq_check is not None:
+        settings.append(f"fastq_check={args.fastq_check}")
+    cache = (
+        ValidationCache(
+            args.cache,
+            checklist_columns,
+            refresh=args.force,
+            settings="\t".join(settings),
+        )
+        if args.cache
+        else None
     )
-    with pd.option_context("future.no_silent_downcasting", True):
-        checklist_df = checklist_df.fillna("-").infer_objects()
-    checklist_df.to_csv(args.checklist_file, sep=args.sep)
-    with open(args.pass_file, "w") as passfile:
-        pass_list = [dataset_path_dict[dataset] for dataset in pass_list]
-        passfile.write("\n".join(pass_list) + "\n")
-    with open(args.fail_file, "w") as failfile:
-        fail_list = [dataset_path_dict[dataset] for dataset in fail_list]
-        failfile.write("\n".join(fail_list) + "\n")
+    if cache is not None and args.invalidate:
+        removed = cache.invalidate(args.invalidate)
+        print(f"Removed {removed} datasets from the validation cache")
+    # checklists validated before an error are still written to the cache
+    try:
+        checklists = validate_basedir(
+            get_datasets(args),
+            checklist_columns,
+            METAFILE_SUFFIXES,
+            DB_METAFILE_SUFFIXES,
+            workers=args.workers,
+            cache=cache,
+            qc_rules=qc_rules,
+            fastq_check=args.fastq_check,
+            fastq_workers=args.fastq_workers,
+        )
+        passed = failed = 0
+        with open(args.checklist_file, "w", newline="") as checklist_file, open(
+            args.pass_file, "w"
+        ) as passfile, open(args.fail_file, "w") as failfile:
+            writer = ChecklistWriter(checklist_file, checklist_columns, sep=args.sep)
+            # pass and fail lists have dataset paths, checklists only have names
+            for dataset_path, dataset, checklist in checklists:
+                writer.write(dataset, checklist)
+                if checklist.is_passed(MUST_BE_TRUE_COLUMNS):
+                    passfile.write(dataset_path + "\n")
+                    passed += 1
+                else:
+                    failfile.write(dataset_path + "\n")
+                    failed += 1
+            # empty lists are written as a single empty line
+            for listfile, count in ((passfile, passed), (failfile, failed)):
+                if not count:
+                    listfile.write("\n")
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        print(f"CACHE: HITS: {cache.hits}, MISSES: {cache.misses}")
+    print(f"PASS: {passed}, FAIL: {failed}, ALL: {writer.rows}")
 
 
 if __name__ == "__main__":
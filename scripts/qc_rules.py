@@ -0,0 +1,101 @@
+import json
+import operator
+import argparse
+from typing import List, NamedTuple, Optional
+from solo_qc import column_type
+
+# comparisons a rule can apply to a numeric column, `present` only requires a valid value,
+# they compare whole numpy arrays of qc_gate.py as well as single values
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+PRESENT = "present"
+# a rule on this column requires values in all columns
+ALL_COLUMNS = "*"
+
+
+class Rule(NamedTuple):
+    """
+    A QC rule, a sample that does not satisfy it fails with the rule code.
+
+    A comparison fails samples with a missing or malformed value. A rule limited
+    to species or whitelists only applies to samples with the listed `Species`
+    or `WL` values, so thresholds can differ between them.
+    """
+
+    code: str
+    column: str
+    op: str = PRESENT
+    value: Optional[float] = None
+    species: Optional[List[str]] = None
+    whitelist: Optional[List[str]] = None
+
+
+# the mapped samples of qc_reprocessing.py
+MAPPING_RULES = [Rule("LOW_MAPPING", "all_u+m", ">", 0.5)]
+# the samples get_metadata.py writes metadata for
+READS_RULES = [Rule("NO_READS", "Rd_all")]
+# the passed samples of filter_failed.sh
+COMPLETE_RULES = [Rule("INCOMPLETE", ALL_COLUMNS)]
+
+RULE_SETS = {
+    "mapping": MAPPING_RULES,
+    "reads": READS_RULES,
+    "complete": COMPLETE_RULES,
+    "all": READS_RULES + MAPPING_RULES + COMPLETE_RULES,
+}
+
+
+def load_rules(value: str) -> List[Rule]:
+    """
+    Return a built-in rule set by name or rules from a JSON file.
+
+    The file has a list of objects with the Rule fields, for example
+    `[{"code": "LOW_MAPPING", "column": "all_u+m", "op": ">", "value": 0.6, "species": ["Human"]}]`.
+
+    Args:
+        value (str): A name of RULE_SETS or a path to the JSON file.
+
+    Returns:
+        List[Rule]: The rules.
+
+    Raises:
+        ValueError: If a rule is not valid.
+    """
+    if value in RULE_SETS:
+        return RULE_SETS[value]
+    with open(value, "r") as file:
+        rules = [Rule(**rule) for rule in json.load(file)]
+    for rule in rules:
+        if rule.op != PRESENT and rule.op not in OPERATORS:
+            raise ValueError(f"rule {rule.code}: unknown operator {rule.op!r}")
+        if rule.op != PRESENT and rule.value is None:
+            raise ValueError(f"rule {rule.code}: operator {rule.op!r} needs a value")
+        if rule.op != PRESENT and column_type(rule.column) is str:
+            raise ValueError(f"rule {rule.code}: column {rule.column} is not numeric")
+    return rules
+
+
+def rules_signature(rules: List[Rule]) -> str:
+    """
+    Return a string that changes whenever the rules do.
+    """
+    return json.dumps([rule._asdict() for rule in rules], sort_keys=True)
+
+
+def add_rules_argument(parser: argparse.ArgumentParser, default: str) -> None:
+    """
+    Add the argument selecting QC rules to a parser.
+    """
+    parser.add_argument(
+        "--qc_rules",
+        metavar="<file>",
+        type=str,
+        help=f"Specify a JSON file with QC gating rules or a built-in rule set: {', '.join(RULE_SETS)}. Default: {default}",
+        default=default,
+    )
@@ -10,22 +10,8 @@ fi
 transfer_list=$1
 output=$2
 
-awk '
-BEGIN { 
-    FS="\t" 
-} 
-$6 == "MISMATCH" { 
-    cmd = "ichksum " $3
-    cmd | getline result
-    close(cmd)
-    
-    split(result, arr)
-    
-    if (arr[2] == $5) 
-        status = "MATCH"
-    else 
-        status = "MISMATCH"
-    
-    print $1, $2, $3, $4, arr[2], status
-} 
-' $transfer_list > $output
+# Set script PATHS
+verify_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/verify_checksums.py
+
+# Recheck MISMATCH rows only, results have the same columns as the tracking file
+$verify_script "$transfer_list" --output "$output" --mismatch_only
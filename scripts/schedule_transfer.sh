@@ -10,7 +10,9 @@ target=/archive/cellgeni/datasets
 dataset_list=$1
 
 workdir=$2
-bsub_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/transfer_with_meta.bsub
+finalize_bsub_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/transfer_finalize.bsub
+plan_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/plan_transfer.py
+plan_bsub_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/transfer_plan.bsub
 
 # Get the number of datasets to transfer
 NUM=$(wc -l <"$dataset_list")
@@ -22,4 +24,21 @@ if [ "$NUM" -eq 0 ]; then
 fi
 
 cd $workdir
-bsub -env "all, ENV_DATASET_LIST=$dataset_list, TARGET=$target, ENV_WORKDIR=$workdir" -J "transfer_to_irods[1-${NUM}]%7" <$bsub_script
+
+# Size all datasets and pack them into 7 workers, large datasets are split by subdirectory
+$plan_script plan "$dataset_list" --workers 7 --output transfer_plan.tsv
+WORKERS=$(tail -n +2 transfer_plan.tsv | cut -f1 | sort -u | wc -l)
+if [ "$WORKERS" -eq 0 ]; then
+    echo "No files to transfer."
+    exit 0
+fi
+# bsub prints "Job <id> is submitted to queue <transfer>.", the id identifies this array only
+PLAN_JOB=$(bsub -env "all, ENV_PLAN=$workdir/transfer_plan.tsv, TARGET=$target, ENV_WORKDIR=$workdir" -J "transfer_plan[1-${WORKERS}]" <$plan_bsub_script | sed -n 's/^Job <\([0-9]*\)>.*/\1/p')
+if [ -z "$PLAN_JOB" ]; then
+    echo "Failed to submit the transfer plan."
+    exit 1
+fi
+
+# Once all uploads ended, merge ledgers of dataset parts, retry failed files, write tracking files
+# and add metadata, datasets are not walked and uploaded again
+bsub -w "ended(${PLAN_JOB})" -env "all, ENV_DATASET_LIST=$dataset_list, TARGET=$target, ENV_WORKDIR=$workdir" -J "transfer_finalize[1-${NUM}]%7" <$finalize_bsub_script
@@ -0,0 +1,204 @@
+import sys
+from typing import Dict, Iterator, List, NamedTuple, Union
+
+# columns with read and cell counts
+INTEGER_COLUMNS = {"Rd_all", "Rd_in_cells", "UMI_in_cells", "Cells"}
+# columns with fractions and medians, all `*_u+m` and `*_u` mapping columns are floats as well
+FLOAT_COLUMNS = {"Frc_in_cells", "Med_nFeature", "Good_BC"}
+FLOAT_COLUMN_SUFFIXES = ("_u+m", "_u")
+
+# values STARsolo QC writes for samples that failed
+MISSING_VALUES = {"", "-", "NA", "N/A", "NaN", "nan", "null", "None"}
+
+Value = Union[str, int, float, None]
+
+# marks values that were not converted yet
+_UNPARSED = object()
+
+
+def column_type(column: str) -> type:
+    """
+    Return the type of values in a solo_qc.tsv column.
+
+    Args:
+        column (str): A column name from the solo_qc.tsv header.
+
+    Returns:
+        type: int, float or str.
+    """
+    if column in INTEGER_COLUMNS:
+        return int
+    if column in FLOAT_COLUMNS or column.endswith(FLOAT_COLUMN_SUFFIXES):
+        return float
+    return str
+
+
+def parse_value(value: str, value_type: type) -> Value:
+    """
+    Convert a raw solo_qc.tsv value to the column type.
+
+    Args:
+        value (str): A raw value from the file.
+        value_type (type): The column type returned by `column_type`.
+
+    Returns:
+        Value: The converted value or None if the value is missing.
+
+    Raises:
+        ValueError: If the value can not be converted to the column type.
+    """
+    if value in MISSING_VALUES:
+        return None
+    if value_type is int:
+        if not value.isdigit():
+            raise ValueError(f"expected a non-negative integer, got {value!r}")
+        return int(value)
+    if value_type is float:
+        return float(value)
+    return value
+
+
+class MalformedRow(NamedTuple):
+    path: str
+    lineno: int
+    sample: str
+    reason: str
+
+
+def report_malformed(malformed: MalformedRow) -> None:
+    """
+    Print a warning about a malformed solo_qc.tsv row to stderr.
+    """
+    print(
+        f"WARNING: {malformed.path}:{malformed.lineno}: sample {malformed.sample}: {malformed.reason}",
+        file=sys.stderr,
+    )
+
+
+class SoloQCRow:
+    """
+    A row of a solo_qc.tsv file with lazily typed values.
+    """
+
+    __slots__ = ("_reader", "lineno", "fields", "_values")
+
+    def __init__(self, reader: "SoloQCReader", lineno: int, fields: List[str]) -> None:
+        self._reader = reader
+        self.lineno = lineno
+        self.fields = fields
+        self._values: List[object] = [_UNPARSED] * len(fields)
+
+    @property
+    def sample(self) -> str:
+        return self.fields[0]
+
+    def raw(self, column: str) -> str:
+        """
+        Return the value of a column as it is written in the file.
+        """
+        return self.fields[self._reader.column_index[column]]
+
+    def get(self, column: str) -> Value:
+        """
+        Return the typed value of a column or None if it is missing or malformed.
+
+        A malformed value is reported once per row and column.
+        """
+        return self._get(self._reader.column_index[column])
+
+    def __getitem__(self, column: str) -> Value:
+        return self.get(column)
+
+    def _get(self, idx: int) -> Value:
+        value = self._values[idx]
+        if value is _UNPARSED:
+            try:
+                value = parse_value(self.fields[idx], self._reader.column_types[idx])
+            except ValueError as error:
+                self._reader.add_malformed(
+                    self.lineno,
+                    self.sample,
+                    f"column {self._reader.header[idx]}: {error}",
+                )
+                value = None
+            self._values[idx] = value
+        return value
+
+    @property
+    def complete(self) -> bool:
+        """
+        True if no value in the row is missing or malformed.
+        """
+        return all(self._get(idx) is not None for idx in range(len(self.fields)))
+
+    def as_dict(self) -> Dict[str, str]:
+        """
+        Return raw values of all columns except the sample one.
+        """
+        return dict(zip(self._reader.header[1:], self.fields[1:]))
+
+
+class SoloQCReader:
+    """
+    A single-pass streaming reader of solo_qc.tsv files.
+
+    Iterating over the reader yields well-formed rows. Rows with a wrong number of
+    fields are reported and skipped, but their samples are still listed in
+    `samples`, which is complete once the iteration is finished.
+
+    Example:
+        with SoloQCReader(path) as reader:
+            mapped = [row.sample for row in reader if (row["all_u+m"] or 0) > 0.5]
+            samples = reader.samples
+    """
+
+    def __init__(self, path: str, sep: str = "\t", report: bool = True) -> None:
+        """
+        Args:
+            path (str): A path to the solo_qc.tsv file.
+            sep (str, optional): A separator used in the file. Defaults to '\t'.
+            report (bool, optional): Print malformed rows to stderr. Defaults to True.
+        """
+        self.path = path
+        self.sep = sep
+        self.report = report
+        self.samples: List[str] = []
+        self.malformed: List[MalformedRow] = []
+        self._file = open(path, "r")
+        self.header = self._file.readline().rstrip("\r\n").split(sep)
+        self.column_index = {column: idx for idx, column in enumerate(self.header)}
+        self.column_types = [column_type(column) for column in self.header]
+
+    def __iter__(self) -> Iterator[SoloQCRow]:
+        for lineno, line in enumerate(self._file, start=2):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = line.split(self.sep)
+            self.samples.append(fields[0])
+            if len(fields) != len(self.header):
+                self.add_malformed(
+                    lineno,
+                    fields[0],
+                    f"expected {len(self.header)} fields, got {len(fields)}",
+                )
+                continue
+            yield SoloQCRow(self, lineno, fields)
+
+    def add_malformed(self, lineno: int, sample: str, reason: str) -> None:
+        """
+        Record and report a malformed row.
+        """
+        malformed = MalformedRow(self.path, lineno, sample, reason)
+        self.malformed.append(malformed)
+        if self.report:
+            report_malformed(malformed)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "SoloQCReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
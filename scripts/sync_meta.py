@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from get_metadata import meta_to_pairs, read_meta_jsonl
+from irods import (
+    AVUOperation,
+    IRODSClient,
+    IRODSError,
+    add_irods_arguments,
+    get_client,
+)
+from metrics import Stage, add_metrics_arguments, metrics
+
+# keys that can have several values, other keys have a single value that is replaced
+MULTI_VALUE_KEYS = {"experiment", "run"}
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Synchronises metadata files written by get_metadata.py with AVUs of iRODS collections"
+    )
+    parser.add_argument(
+        "metadata",
+        metavar="<metadata>",
+        type=str,
+        help="Specify a path to the directory with sample metadata files or to a JSON lines file written by get_metadata.py --format jsonl",
+    )
+    parser.add_argument(
+        "target",
+        metavar="<irods_target_directory>",
+        type=str,
+        help="Specify an iRODS collection of the dataset",
+    )
+    parser.add_argument(
+        "--sep",
+        metavar="<val>",
+        type=str,
+        help="Specify a separator of metadata files. Default: \\t",
+        default="\t",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of collections synchronised concurrently. Default: 8",
+        default=8,
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only print metadata changes without applying them",
+    )
+    add_irods_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+def read_sample_meta(filepath: str, sep: str = "\t") -> List[Tuple[str, str]]:
+    """
+    Read key/value pairs of a sample metadata file, skipping incomplete lines.
+    """
+    with open(filepath, "r") as file:
+        pairs = [line.rstrip("\n").split(sep, 1) for line in file]
+    return [(pair[0], pair[1]) for pair in pairs if len(pair) == 2]
+
+
+def get_target_meta(
+    metadata: str, irods_target_dir: str, sep: str = "\t"
+) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Return the AVUs every collection of a dataset should have.
+
+    The dataset collection gets its accession number, each sample collection gets
+    the dataset accession number and the metadata of the sample, read from
+    `{sample}.tsv` of a metadata directory or from a JSON lines file.
+
+    Args:
+        metadata (str): A path to the directory with sample metadata files or to a JSON lines file.
+        irods_target_dir (str): An iRODS collection of the dataset.
+        sep (str, optional): A separator of metadata files. Defaults to '\t'.
+
+    Returns:
+        Dict[str, List[Tuple[str, str]]]: Attributes and values by collection.
+    """
+    if os.path.isdir(metadata):
+        samples = [
+            (
+                filename[: -len(".tsv")],
+                read_sample_meta(os.path.join(metadata, filename), sep),
+            )
+            for filename in sorted(os.listdir(metadata))
+            if filename.endswith(".tsv")
+        ]
+    else:
+        samples = [
+            (record["dirname"], meta_to_pairs(record["meta"]))
+            for record in read_meta_jsonl(metadata)
+        ]
+    return get_collections_meta(samples, irods_target_dir)
+
+
+def get_collections_meta(
+    samples: List[Tuple[str, List[Tuple[str, str]]]], irods_target_dir: str
+) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Return the AVUs of the dataset collection and of the sample collections.
+
+    Args:
+        samples (List[Tuple[str, List[Tuple[str, str]]]]): Sample names with their attributes and values.
+        irods_target_dir (str): An iRODS collection of the dataset.
+
+    Returns:
+        Dict[str, List[Tuple[str, str]]]: Attributes and values by collection.
+    """
+    irods_target_dir = irods_target_dir.rstrip("/")
+    dataset = os.path.basename(irods_target_dir)
+    target_meta = {irods_target_dir: [("study_accession_number", dataset)]}
+    for sample, pairs in samples:
+        # skip incomplete pairs as empty keys or values can't be AVUs
+        pairs = [(key, value) for key, value in pairs if key and value]
+        target_meta[f"{irods_target_dir}/{sample}"] = [("series", dataset)] + pairs
+    return target_meta
+
+
+def diff_meta(
+    existing: List[Dict[str, str]], target: List[Tuple[str, str]]
+) -> List[AVUOperation]:
+    """
+    Return operations that bring existing AVUs of a collection to the target ones.
+
+    Values of MULTI_VALUE_KEYS are added next to the existing ones, other keys are
+    set to their last value unless it is already the only value. AVUs that are not
+    in the target are kept.
+
+    Args:
+        existing (List[Dict[str, str]]): AVUs of the collection returned by `imeta_ls`.
+        target (List[Tuple[str, str]]): Target attributes and values.
+
+    Returns:
+        List[AVUOperation]: A list of operations to apply.
+    """
+    existing_values: Dict[str, List[str]] = {}
+    for avu in existing:
+        existing_values.setdefault(avu["attribute"], []).append(avu["value"])
+    single_values = {key: value for key, value in target if key not in MULTI_VALUE_KEYS}
+    operations = [
+        AVUOperation("set", key, value)
+        for key, value in single_values.items()
+        if existing_values.get(key) != [value]
+    ]
+    added = set()
+    for key, value in target:
+        if key not in MULTI_VALUE_KEYS or (key, value) in added:
+            continue
+        added.add((key, value))
+        if value not in existing_values.get(key, []):
+            operations.append(AVUOperation("add", key, value))
+    return operations
+
+
+def sync_collection(
+    client: IRODSClient,
+    collection: str,
+    target: List[Tuple[str, str]],
+    dry_run: bool = False,
+    stages: Optional[Dict[str, Stage]] = None,
+) -> List[AVUOperation]:
+    """
+    List AVUs of a collection once and apply the missing ones in a single batch.
+
+    Args:
+        client (IRODSClient): The iRODS client.
+        collection (str): An iRODS collection.
+        target (List[Tuple[str, str]]): Target attributes and values.
+        dry_run (bool, optional): Only compute the changes. Defaults to False.
+        stages (Optional[Dict[str, Stage]], optional): Stages timing the imeta_ls and imeta_apply calls by call. Defaults to None.
+
+    Returns:
+        List[AVUOperation]: A list of applied (or, in a dry run, pending) operations.
+    """
+    stages = stages or {
+        step: Stage(metrics, f"meta.{step}") for step in ("imeta_ls", "imeta_apply")
+    }
+    with stages["imeta_ls"].time(collections=1, remote_calls=1):
+        existing = client.imeta_ls(collection)
+    operations = diff_meta(existing, target)
+    if operations and not dry_run:
+        with stages["imeta_apply"].time(
+            collections=1, avus=len(operations), remote_calls=1
+        ):
+            client.imeta_apply(collection, operations)
+    return operations
+
+
+def main() -> None:
+    """
+    The main entry point for the metadata synchronisation script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    metrics.configure(args.metrics)
+    client = get_client(args)
+    dataset = os.path.basename(args.target.rstrip("/"))
+    with metrics.stage("meta.read", dataset) as stage:
+        target_meta = get_target_meta(args.metadata, args.target, args.sep)
+        stage.add(collections=len(target_meta))
+
+    # imeta calls of different collections overlap, the sync stage is their wall time
+    sync_stage = Stage(metrics, "meta.sync", dataset)
+    stages = {
+        step: Stage(
+            metrics, f"meta.{step}", dataset, parent=sync_stage.name, concurrent=True
+        )
+        for step in ("imeta_ls", "imeta_apply")
+    }
+
+    def sync(collection: str) -> Optional[List[AVUOperation]]:
+        try:
+            return sync_collection(
+                client, collection, target_meta[collection], args.dry_run, stages
+            )
+        except IRODSError as error:
+            print(f"ERROR: {collection}: {error}", file=sys.stderr)
+            return None
+
+    failed = 0
+    with sync_stage.time(collections=len(target_meta)), ThreadPoolExecutor(
+        args.workers
+    ) as executor:
+        for collection, operations in zip(target_meta, executor.map(sync, target_meta)):
+            if operations is None:
+                failed += 1
+                continue
+            for operation, attribute, value in operations:
+                print(f"{collection}: {operation} {attribute} {value}")
+            if not args.dry_run:
+                print(
+                    f"Metadata for {collection} synchronised: {len(operations)} changes."
+                )
+    for stage in (sync_stage, *stages.values()):
+        stage.record()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+TRACKING_HEADER = [
+    "dataset",
+    "filepath",
+    "irodspath",
+    "md5_local",
+    "md5_irods",
+    "status",
+]
+
+
+class LedgerEntry(NamedTuple):
+    dataset: str
+    local_path: str
+    irods_path: str
+    size: Optional[int]
+    mtime_ns: Optional[int]
+    md5_local: Optional[str]
+    md5_irods: Optional[str]
+    status: str
+
+
+class TransferLedger:
+    """
+    A crash-safe record of transferred files backed by SQLite.
+
+    Sizes, mtimes and statuses of all recorded files are loaded into a dict once
+    when the ledger is opened, so checking whether a file was already transferred
+    is a single hash lookup. Every record is committed on its own in WAL mode, so a
+    crash loses at most the file that was being recorded, which is then simply
+    transferred again.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): A path to the SQLite file.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transfers (
+                local_path TEXT PRIMARY KEY,
+                dataset TEXT NOT NULL,
+                irods_path TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                md5_local TEXT,
+                md5_irods TEXT,
+                status TEXT NOT NULL
+            )
+            """
+        )
+        self._index: Dict[str, Tuple[Optional[int], Optional[int], str]] = {
+            local_path: (size, mtime_ns, status)
+            for local_path, size, mtime_ns, status in self._connection.execute(
+                "SELECT local_path, size, mtime_ns, status FROM transfers"
+            )
+        }
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def is_transferred(self, local_path: str, size: int, mtime_ns: int) -> bool:
+        """
+        Return True if a file was transferred and did not change since.
+
+        Files recorded with MATCH or MISMATCH are considered transferred, as in the
+        tracking file, mismatches are rechecked by the verification tool. Entries
+        imported from a tracking file have no size and mtime and match any file.
+
+        Args:
+            local_path (str): A path to the local file.
+            size (int): The current size of the file.
+            mtime_ns (int): The current mtime of the file in nanoseconds.
+
+        Returns:
+            bool: True if the file does not have to be transferred again.
+        """
+        entry = self._index.get(local_path)
+        if entry is None or entry[2] not in ("MATCH", "MISMATCH"):
+            return False
+        recorded_size, recorded_mtime_ns, _ = entry
+        return recorded_size is None or (
+            recorded_size == size and recorded_mtime_ns == mtime_ns
+        )
+
+    def record(self, entry: LedgerEntry) -> None:
+        """
+        Record the result of a file transfer and commit it.
+        """
+        with self._connection:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO transfers
+                (local_path, dataset, irods_path, size, mtime_ns, md5_local, md5_irods, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    entry.local_path,
+                    entry.dataset,
+                    entry.irods_path,
+                    entry.size,
+                    entry.mtime_ns,
+                    entry.md5_local,
+                    entry.md5_irods,
+                    entry.status,
+                ),
+            )
+        self._index[entry.local_path] = (entry.size, entry.mtime_ns, entry.status)
+
+    def count(self, status: str) -> int:
+        """
+        Return a number of files recorded with a status.
+        """
+        return sum(entry[2] == status for entry in self._index.values())
+
+    def with_status(self, *statuses: str) -> List[LedgerEntry]:
+        """
+        Return entries of files recorded with any of the statuses, in the order they were first recorded.
+        """
+        placeholders = ", ".join("?" * len(statuses))
+        return [
+            LedgerEntry(*row)
+            for row in self._connection.execute(
+                f"""
+                SELECT dataset, local_path, irods_path, size, mtime_ns, md5_local, md5_irods, status
+                FROM transfers WHERE status IN ({placeholders}) ORDER BY rowid
+                """,
+                statuses,
+            )
+        ]
+
+    def import_tsv(self, tracking_file: str) -> int:
+        """
+        Import rows of a tracking file written by transfer_to_irods.
+
+        Args:
+            tracking_file (str): A path to the tracking file.
+
+        Returns:
+            int: A number of imported rows.
+        """
+        with open(tracking_file, "r") as file:
+            next(file, None)
+            rows = [line.rstrip("\n").split("\t") for line in file if line.strip()]
+        rows = [row for row in rows if len(row) == len(TRACKING_HEADER)]
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT OR IGNORE INTO transfers
+                (local_path, dataset, irods_path, md5_local, md5_irods, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (local_path, dataset, irods_path, md5_local, md5_irods, status)
+                    for dataset, local_path, irods_path, md5_local, md5_irods, status in rows
+                ],
+            )
+        for _, local_path, _, _, _, status in rows:
+            self._index.setdefault(local_path, (None, None, status))
+        return len(rows)
+
+    def merge(self, path: str) -> int:
+        """
+        Copy transfers recorded in another ledger, replacing entries of the same files.
+
+        Entries the other ledger imported from a tracking file are not copied, they
+        have no size and mtime and already come from this ledger.
+
+        Args:
+            path (str): A path to the other ledger.
+
+        Returns:
+            int: A number of copied entries.
+        """
+        with TransferLedger(path) as other:
+            rows = other._connection.execute(
+                """
+                SELECT local_path, dataset, irods_path, size, mtime_ns, md5_local, md5_irods, status
+                FROM transfers WHERE size IS NOT NULL ORDER BY rowid
+                """
+            ).fetchall()
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT OR REPLACE INTO transfers
+                (local_path, dataset, irods_path, size, mtime_ns, md5_local, md5_irods, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+        for local_path, _, _, size, mtime_ns, _, _, status in rows:
+            self._index[local_path] = (size, mtime_ns, status)
+        return len(rows)
+
+    def export_tsv(self, tracking_file: str) -> int:
+        """
+        Write transferred files in the tracking file format.
+
+        Files that failed to transfer are not exported. The file is written next to
+        the target and renamed, so readers never see a partial tracking file.
+
+        Args:
+            tracking_file (str): A path to the tracking file.
+
+        Returns:
+            int: A number of exported rows.
+        """
+        rows = self._connection.execute(
+            """
+            SELECT dataset, local_path, irods_path, md5_local, md5_irods, status
+            FROM transfers WHERE status IN ('MATCH', 'MISMATCH') ORDER BY rowid
+            """
+        )
+        count = 0
+        tmp_file = f"{tracking_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            file.write("\t".join(TRACKING_HEADER) + "\n")
+            for row in rows:
+                file.write("\t".join(value or "" for value in row) + "\n")
+                count += 1
+        os.replace(tmp_file, tracking_file)
+        return count
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "TransferLedger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import argparse
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from irods import IRODSClient, add_irods_arguments, get_client
+from checksum_cache import ChecksumCache, Hasher
+from transfer_ledger import LedgerEntry, TransferLedger
+from metrics import Stage, add_metrics_arguments, metrics
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Uploads dataset directories to iRODS and verifies checksums of uploaded files"
+    )
+    parser.add_argument(
+        "source",
+        metavar="<source_directory>",
+        type=str,
+        nargs="+",
+        help="Specify paths to the dataset directories to upload",
+    )
+    parser.add_argument(
+        "target",
+        metavar="<irods_target_directory>",
+        type=str,
+        help="Specify an iRODS collection to upload datasets to",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of concurrent uploads per dataset. Default: 4",
+        default=4,
+    )
+    parser.add_argument(
+        "--hash_workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of files hashed concurrently per dataset. Default: 2",
+        default=2,
+    )
+    parser.add_argument(
+        "--global_workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a maximum number of concurrent iRODS calls across all datasets. Default: 8",
+        default=8,
+    )
+    parser.add_argument(
+        "--datasets",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of datasets transferred concurrently. Default: 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--subtree",
+        metavar="<path>",
+        type=str,
+        help="Specify a subdirectory of the datasets to upload, relative to the dataset directory. Default: the whole dataset",
+        default=".",
+    )
+    parser.add_argument(
+        "--files_only",
+        action="store_true",
+        help="Only upload files directly in the subtree, without its subdirectories",
+    )
+    parser.add_argument(
+        "--finalize",
+        action="store_true",
+        help="Only merge ledgers of dataset parts, retry files recorded as FAILED and write tracking files, without scanning the datasets",
+    )
+    parser.add_argument(
+        "--checksum_cache",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite checksum cache shared with checksum_cache.py. Default: no cache",
+        default=None,
+    )
+    add_irods_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+def scan_files(source_dir: str, recursive: bool = True) -> List[Tuple[str, int, int]]:
+    """
+    Return paths, sizes and mtimes in nanoseconds of all files in a directory tree,
+    or only of the files directly in the directory if `recursive` is False.
+    """
+    files = []
+    stack = [source_dir]
+    while stack:
+        with os.scandir(stack.pop()) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name, reverse=True)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    stack.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+class FileTransfer:
+    """
+    The state of a single file going through the transfer pipeline.
+    """
+
+    __slots__ = (
+        "dataset",
+        "local_path",
+        "irods_path",
+        "size",
+        "mtime_ns",
+        "md5_local",
+        "md5_irods",
+        "status",
+        "error",
+    )
+
+    def __init__(
+        self,
+        dataset: str,
+        local_path: str,
+        irods_path: str,
+        size: Optional[int] = None,
+        mtime_ns: Optional[int] = None,
+    ) -> None:
+        self.dataset = dataset
+        self.local_path = local_path
+        self.irods_path = irods_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.md5_local: Optional[str] = None
+        self.md5_irods: Optional[str] = None
+        self.status: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+    def ledger_entry(self) -> LedgerEntry:
+        return LedgerEntry(
+            self.dataset,
+            self.local_path,
+            self.irods_path,
+            self.size,
+            self.mtime_ns,
+            self.md5_local,
+            self.md5_irods,
+            self.status,
+        )
+
+
+class TransferEngine:
+    """
+    Uploads files to iRODS in a pipeline of overlapping stages.
+
+    Every file is hashed locally on a hash pool, uploaded on an upload pool and
+    verified with ichksum on a verify pool. A file enters the next stage as soon
+    as the previous one finishes, so hashing, uploading and verifying different
+    files happen at the same time. Each collection is created once per engine.
+    All iRODS calls are additionally limited by a semaphore that can be shared
+    between engines transferring different datasets.
+    """
+
+    def __init__(
+        self,
+        client: IRODSClient,
+        workers: int = 4,
+        hash_workers: int = 2,
+        remote_slots: Optional[threading.Semaphore] = None,
+        hasher: Optional[Hasher] = None,
+    ) -> None:
+        """
+        Args:
+            client (IRODSClient): The iRODS client.
+            workers (int, optional): A number of concurrent uploads and verifications. Defaults to 4.
+            hash_workers (int, optional): A number of files hashed concurrently. Defaults to 2.
+            remote_slots (Optional[threading.Semaphore], optional): A semaphore limiting iRODS calls. Defaults to None.
+            hasher (Optional[Hasher], optional): The hasher computing local checksums. Defaults to a hasher without a cache.
+        """
+        self.client = client
+        self.workers = workers
+        self.hash_workers = hash_workers
+        self.remote_slots = remote_slots or threading.Semaphore(workers * 2)
+        self.hasher = hasher or Hasher()
+        self._collections: Set[str] = set()
+        self._collection_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def ensure_collection(self, collection: str) -> None:
+        """
+        Create a collection unless this engine already created it.
+        """
+        with self._lock:
+            lock = self._collection_locks.setdefault(collection, threading.Lock())
+        with lock:
+            if collection in self._collections:
+                return
+            with self.remote_slots:
+                self.client.imkdir(collection)
+            # imkdir -p creates all the parents as well
+            with self._lock:
+                while (
+                    collection not in ("", "/") and collection not in self._collections
+                ):
+                    self._collections.add(collection)
+                    collection = os.path.dirname(collection)
+
+    def upload(
+        self, transfer: FileTransfer, restart_file: Callable[[], Optional[str]]
+    ) -> None:
+        """
+        Create the collection of a file and upload it.
+        """
+        self.ensure_collection(os.path.dirname(transfer.irods_path))
+        metadata = {"series": transfer.dataset, "md5": transfer.md5_local}
+        with self.remote_slots:
+            self.client.iput(
+                transfer.local_path, transfer.irods_path, metadata, restart_file()
+            )
+
+    def verify(self, transfer: FileTransfer) -> None:
+        """
+        Compare the iRODS checksum of an uploaded file with the local one.
+        """
+        with self.remote_slots:
+            transfer.md5_irods = self.client.ichksum(transfer.irods_path)
+        transfer.status = (
+            "MATCH" if transfer.md5_irods == transfer.md5_local else "MISMATCH"
+        )
+
+    def transfer(
+        self,
+        transfers: List[FileTransfer],
+        restart_prefix: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> Iterator[FileTransfer]:
+        """
+        Transfer files and yield each of them as soon as it is verified or failed.
+
+        A file that failed at any stage has the FAILED status and the error of the
+        stage in `error`. The wall time of the whole pipeline and of every stage,
+        with the time of the stage summed over the files as thread seconds, is
+        recorded to metrics under `name` once all files are done.
+
+        Args:
+            transfers (List[FileTransfer]): A list of files to transfer.
+            restart_prefix (Optional[str], optional): A prefix of iput restart files. Defaults to None.
+            name (Optional[str], optional): A name of the transfer in metrics. Defaults to None.
+
+        Yields:
+            FileTransfer: Completed transfers in the order of completion.
+        """
+        hash_pool = ThreadPoolExecutor(self.hash_workers, thread_name_prefix="hash")
+        upload_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="upload")
+        verify_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="verify")
+        pipeline = Stage(metrics, "transfer.pipeline", name)
+        stages = {
+            step: Stage(
+                metrics, f"transfer.{step}", name, parent=pipeline.name, concurrent=True
+            )
+            for step in ("hash", "upload", "verify")
+        }
+
+        def timed(step: str, func: Callable, *args, **counts: int) -> Callable:
+            def run():
+                with stages[step].time(**counts):
+                    return func(*args)
+
+            return run
+
+        def restart_file() -> Optional[str]:
+            # iput restart files can't be shared between concurrent uploads
+            if restart_prefix is None:
+                return None
+            return f"{restart_prefix}.{threading.current_thread().name}.restart.txt"
+
+        def start(transfer: FileTransfer) -> "Future[FileTransfer]":
+            result: "Future[FileTransfer]" = Future()
+
+            def stage(next_stage: Callable) -> Callable[[Future], None]:
+                def callback(future: Future) -> None:
+                    error = (
+                        CancelledError() if future.cancelled() else future.exception()
+                    )
+                    if error is not None:
+                        transfer.status = "FAILED"
+                        transfer.error = error
+                        result.set_result(transfer)
+                    else:
+                        next_stage(future.result())
+
+                return callback
+
+            def hashed(md5: str) -> None:
+                transfer.md5_local = md5
+                upload_pool.submit(
+                    timed(
+                        "upload",
+                        self.upload,
+                        transfer,
+                        restart_file,
+                        files=1,
+                        bytes=transfer.size or 0,
+                        remote_calls=1,
+                    )
+                ).add_done_callback(stage(uploaded))
+
+            def uploaded(_) -> None:
+                verify_pool.submit(
+                    timed("verify", self.verify, transfer, files=1, remote_calls=1)
+                ).add_done_callback(stage(lambda _: result.set_result(transfer)))
+
+            hash_pool.submit(
+                timed(
+                    "hash",
+                    self.hasher.md5,
+                    transfer.local_path,
+                    files=1,
+                    bytes=transfer.size or 0,
+                )
+            ).add_done_callback(stage(hashed))
+            return result
+
+        try:
+            with pipeline.time(
+                files=len(transfers), bytes=sum(t.size or 0 for t in transfers)
+            ):
+                for future in as_completed([start(transfer) for transfer in transfers]):
+                    yield future.result()
+        finally:
+            for pool in (hash_pool, upload_pool, verify_pool):
+                pool.shutdown(cancel_futures=True)
+            if transfers:
+                for step in (pipeline, *stages.values()):
+                    step.record()
+
+
+def merge_parts(ledger: TransferLedger, parts_dir: str) -> None:
+    """
+    Merge ledgers of dataset parts in `parts_dir` into the dataset ledger and remove them.
+    """
+    for part_ledger in sorted(glob.glob(os.path.join(parts_dir, "*_ledger.sqlite"))):
+        merged = ledger.merge(part_ledger)
+        os.remove(part_ledger)
+        print(f"Merged {merged} files from {part_ledger}")
+
+
+def record_transfers(
+    engine: TransferEngine,
+    ledger: TransferLedger,
+    transfers: List[FileTransfer],
+    restart_prefix: str,
+    name: str,
+) -> Dict[str, int]:
+    """
+    Transfer files, record every result in the ledger and return numbers of files by status.
+    """
+    counts = {"MATCH": 0, "MISMATCH": 0, "FAILED": 0}
+    for transfer in engine.transfer(transfers, restart_prefix, name):
+        if transfer.error is not None:
+            print(
+                f"ERROR: {name}: {transfer.local_path}: {transfer.error}",
+                file=sys.stderr,
+            )
+        ledger.record(transfer.ledger_entry())
+        counts[transfer.status] += 1
+    return counts
+
+
+def transfer_dataset(
+    engine: TransferEngine,
+    source_dir: str,
+    irods_target_dir: str,
+    subtree: str = ".",
+    recursive: bool = True,
+    workdir: str = ".",
+) -> int:
+    """
+    Upload a dataset directory to iRODS and record results in a transfer ledger.
+
+    Results are recorded in `{dataset}_ledger.sqlite` as soon as each file is
+    verified, and exported to `{dataset}_tracking.txt` at the end. Files already in
+    the ledger and not changed since are skipped, so an interrupted transfer
+    continues where it stopped. An existing tracking file without a ledger is
+    imported first. Files that failed to upload are recorded as FAILED and are
+    retried on the next run.
+
+    Parts of a large dataset can be uploaded by separate processes with `subtree`.
+    SQLite locks are not reliable on Lustre across nodes, so every part records its
+    results in its own ledger in `{dataset}_parts/` and does not export a tracking
+    file. A run over the whole dataset merges and removes the part ledgers before
+    it scans the dataset, so files uploaded as parts are skipped and exported with
+    the rest. finalize_dataset does the same without scanning the dataset.
+
+    Args:
+        engine (TransferEngine): The transfer engine.
+        source_dir (str): A path to the dataset directory.
+        irods_target_dir (str): An iRODS collection to upload the dataset to.
+        subtree (str, optional): A subdirectory to upload, relative to the dataset directory. Defaults to the whole dataset.
+        recursive (bool, optional): Upload subdirectories of the subtree. Defaults to True.
+        workdir (str, optional): A directory for the ledger and tracking files. Defaults to the current directory.
+
+    Returns:
+        int: A number of files that failed to upload.
+    """
+    source_dir = source_dir.rstrip("/")
+    irods_target_dir = irods_target_dir.rstrip("/")
+    dataset = os.path.basename(source_dir)
+    tracking_file = os.path.join(workdir, f"{dataset}_tracking.txt")
+    parts_dir = os.path.join(workdir, f"{dataset}_parts")
+    # processes uploading different parts of a dataset need their own restart files and ledgers
+    part = os.path.normpath(subtree)
+    name = dataset if part == "." else f"{dataset}/{part}"
+    if not recursive:
+        name += "/*"
+    restart_prefix = os.path.join(workdir, name.replace("/", "_").replace("*", "files"))
+    whole_dataset = name == dataset
+    if whole_dataset:
+        ledger_file = os.path.join(workdir, f"{dataset}_ledger.sqlite")
+    else:
+        os.makedirs(parts_dir, exist_ok=True)
+        ledger_file = os.path.join(
+            parts_dir, f"{os.path.basename(restart_prefix)}_ledger.sqlite"
+        )
+    import_tracking = os.path.isfile(tracking_file) and not os.path.isfile(ledger_file)
+    with TransferLedger(ledger_file) as ledger:
+        if import_tracking:
+            imported = ledger.import_tsv(tracking_file)
+            print(f"Imported {imported} files from {tracking_file}")
+        if whole_dataset:
+            merge_parts(ledger, parts_dir)
+        if len(ledger):
+            print(f"{ledger_file} exists. Continuing loading...")
+
+        with metrics.stage("transfer.scan", name) as stage:
+            transfers = [
+                FileTransfer(
+                    dataset,
+                    path,
+                    f"{irods_target_dir}/{dataset}/{os.path.relpath(path, source_dir)}",
+                    size,
+                    mtime_ns,
+                )
+                for path, size, mtime_ns in scan_files(
+                    os.path.join(source_dir, part) if part != "." else source_dir,
+                    recursive,
+                )
+                if not ledger.is_transferred(path, size, mtime_ns)
+            ]
+            stage.add(files=len(transfers), bytes=sum(t.size for t in transfers))
+        counts = record_transfers(engine, ledger, transfers, restart_prefix, name)
+        if whole_dataset:
+            ledger.export_tsv(tracking_file)
+    print(
+        f"{name}: MATCH: {counts['MATCH']}, MISMATCH: {counts['MISMATCH']}, FAILED: {counts['FAILED']}"
+    )
+    return counts["FAILED"]
+
+
+def finalize_dataset(
+    engine: TransferEngine,
+    source_dir: str,
+    workdir: str = ".",
+) -> int:
+    """
+    Merge ledgers of dataset parts, retry files that failed and write the tracking file.
+
+    Unlike a run over the whole dataset with transfer_dataset, the dataset
+    directory is not scanned, only files recorded as FAILED are uploaded again.
+    This is meant to run once all parts of a dataset planned by plan_transfer.py
+    are uploaded.
+
+    Args:
+        engine (TransferEngine): The transfer engine.
+        source_dir (str): A path to the dataset directory.
+        workdir (str, optional): A directory for the ledger and tracking files. Defaults to the current directory.
+
+    Returns:
+        int: A number of files that failed to upload.
+    """
+    dataset = os.path.basename(source_dir.rstrip("/"))
+    ledger_file = os.path.join(workdir, f"{dataset}_ledger.sqlite")
+    tracking_file = os.path.join(workdir, f"{dataset}_tracking.txt")
+    with TransferLedger(ledger_file) as ledger:
+        merge_parts(ledger, os.path.join(workdir, f"{dataset}_parts"))
+        transfers = []
+        for entry in ledger.with_status("FAILED"):
+            try:
+                stat = os.stat(entry.local_path)
+            except FileNotFoundError:
+                print(
+                    f"ERROR: {dataset}: {entry.local_path}: file no longer exists",
+                    file=sys.stderr,
+                )
+                continue
+            transfers.append(
+                FileTransfer(
+                    dataset,
+                    entry.local_path,
+                    entry.irods_path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+            )
+        counts = record_transfers(
+            engine, ledger, transfers, os.path.join(workdir, dataset), dataset
+        )
+        ledger.export_tsv(tracking_file)
+        failed = ledger.count("FAILED")
+    print(
+        f"{dataset}: RETRIED: {len(transfers)}, MATCH: {counts['MATCH']}, MISMATCH: {counts['MISMATCH']}, FAILED: {failed}"
+    )
+    return failed
+
+
+def main() -> None:
+    """
+    The main entry point for the transfer script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    metrics.configure(args.metrics)
+    client = get_client(args)
+    remote_slots = threading.Semaphore(args.global_workers)
+    cache = ChecksumCache(args.checksum_cache) if args.checksum_cache else None
+    hasher = Hasher(cache)
+    engines = [
+        TransferEngine(client, args.workers, args.hash_workers, remote_slots, hasher)
+        for _ in args.source
+    ]
+    with ThreadPoolExecutor(args.datasets) as executor:
+        failed = sum(
+            executor.map(
+                lambda engine, source: (
+                    finalize_dataset(engine, source)
+                    if args.finalize
+                    else transfer_dataset(
+                        engine, source, args.target, args.subtree, not args.files_only
+                    )
+                ),
+                engines,
+                args.source,
+            )
+        )
+    if cache is not None:
+        cache.close()
+    if failed:
+        sys.exit(1)
+    print("COMPLETED")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,8 @@ IRODS_TARGET_DIR="${2%/}"
 
 # Set script PATHS
 get_meta_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/get_metadata.py
-transfer_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/transfer_to_irods.sh
-add_meta_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/add_meta.sh
+transfer_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/transfer_to_irods.py
+sync_meta_script=/lustre/scratch127/cellgen/cellgeni/aljes/reprocessing/scripts/sync_meta.py
 
 # Set output dir
 outputdir=metadata
@@ -24,7 +24,7 @@ dataset=$(basename "$SOURCE_DIR")
 
 # Get metadata
 echo "Step1. Getting metadata ..."
-$get_meta_script --outputdir "${outputdir}" $SOURCE_DIR 
+$get_meta_script --outputdir "${outputdir}" --format jsonl $SOURCE_DIR
 
 # Load Dataset to IRODS
 echo "Step2. Loading data to $IRODS_TARGET_DIR/$dataset on IRODS..."
@@ -32,4 +32,4 @@ $transfer_script "$SOURCE_DIR" "$IRODS_TARGET_DIR"
 
 # Add metadata
 echo "Step3. Adding metadata..."
-$add_meta_script "${outputdir}" "${IRODS_TARGET_DIR}/${dataset}"
+$sync_meta_script "${outputdir}/${dataset}.metadata.jsonl" "${IRODS_TARGET_DIR}/${dataset}"
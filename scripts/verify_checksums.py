@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import threading
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from irods import IRODSClient, IRODSError, add_irods_arguments, get_client
+from checksum_cache import ChecksumCache, Hasher
+from transfer_ledger import TRACKING_HEADER
+from metrics import Stage, add_metrics_arguments, metrics
+
+
+def init_parser() -> argparse.ArgumentParser:
+    """
+    Initializes and returns the argument parser.
+
+    Args:
+        None
+
+    Returns:
+        argparse.ArgumentParser: The initialized argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Verifies checksums of uploaded files against iRODS checksums"
+    )
+    parser.add_argument(
+        "input",
+        type=str,
+        help="Specify a path to a tracking file written by transfer_to_irods.py or to a headerless list with dataset, local path, iRODS path and checksum columns",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the output file. Default: checksum_results.tsv",
+        default="checksum_results.tsv",
+    )
+    parser.add_argument(
+        "--mismatch_only",
+        action="store_true",
+        help="Only recheck rows with MISMATCH status, other rows are copied as they are",
+    )
+    parser.add_argument(
+        "--rehash_local",
+        action="store_true",
+        help="Recompute local checksums instead of using the ones from the input",
+    )
+    parser.add_argument(
+        "--checksum_cache",
+        metavar="<file>",
+        type=str,
+        help="Specify a path to the SQLite checksum cache used with --rehash_local. Default: no cache",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<num>",
+        type=int,
+        help="Specify a number of concurrent iRODS checksum calls. Default: 8",
+        default=8,
+    )
+    add_irods_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+def read_checksum_list(filepath: str) -> List[List[str]]:
+    """
+    Read a tracking file or a checksum list and return rows in the tracking format.
+
+    Rows of a headerless checksum list (dataset, local path, iRODS path, checksum)
+    get empty iRODS checksum and status columns. Rows with another number of
+    columns are reported and skipped.
+
+    Args:
+        filepath (str): A path to the file.
+
+    Returns:
+        List[List[str]]: A list of rows with the TRACKING_HEADER columns.
+    """
+    rows = []
+    with open(filepath, "r") as file:
+        for lineno, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            row = line.rstrip("\n").split("\t")
+            if row == TRACKING_HEADER:
+                continue
+            if len(row) == 4:
+                row += ["", ""]
+            if len(row) != len(TRACKING_HEADER):
+                print(
+                    f"WARNING: {filepath}:{lineno}: skipped a row with {len(row)} columns",
+                    file=sys.stderr,
+                )
+                continue
+            rows.append(row)
+    return rows
+
+
+class ChecksumVerifier:
+    """
+    Compares local checksums with iRODS checksums on a bounded thread pool.
+    """
+
+    def __init__(
+        self,
+        client: IRODSClient,
+        workers: int = 8,
+        hasher: Optional[Hasher] = None,
+        mismatch_only: bool = False,
+    ) -> None:
+        """
+        Args:
+            client (IRODSClient): The iRODS client.
+            workers (int, optional): A number of concurrent checks. Defaults to 8.
+            hasher (Optional[Hasher], optional): A hasher to recompute local checksums with. Defaults to None.
+            mismatch_only (bool, optional): Only recheck rows with MISMATCH status. Defaults to False.
+        """
+        self.client = client
+        self.workers = workers
+        self.hasher = hasher
+        self.mismatch_only = mismatch_only
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def verify_row(
+        self, row: List[str], stages: Optional[Dict[str, Stage]] = None
+    ) -> List[str]:
+        """
+        Verify a row in the tracking format and return the updated row.
+
+        A data object whose checksum can't be read gets an empty iRODS checksum and
+        a local file that can't be rehashed an empty local checksum, both get the
+        MISMATCH status. Local hashing and ichksum calls are timed in `stages` by step.
+        """
+        stages = stages or {
+            step: Stage(metrics, f"checksum.{step}") for step in ("hash", "ichksum")
+        }
+        dataset, local_path, irods_path, md5_local, md5_irods, status = row
+        if self.mismatch_only and status != "MISMATCH":
+            return row
+        if self.hasher is not None:
+            try:
+                with stages["hash"].time(files=1):
+                    md5_local = self.hasher.md5(local_path)
+            except OSError as error:
+                self.report(f"{local_path}: {error.strerror}")
+                md5_local = ""
+        try:
+            with stages["ichksum"].time(files=1, remote_calls=1):
+                md5_irods = self.client.ichksum(irods_path)
+        except IRODSError as error:
+            self.report(str(error))
+            md5_irods = ""
+        status = "MATCH" if md5_local and md5_irods == md5_local else "MISMATCH"
+        return [dataset, local_path, irods_path, md5_local, md5_irods, status]
+
+    def report(self, error: str) -> None:
+        print(f"ERROR: {error}", file=sys.stderr)
+        with self._lock:
+            self.errors += 1
+
+    def verify(
+        self, rows: List[List[str]], name: Optional[str] = None
+    ) -> List[List[str]]:
+        """
+        Verify rows concurrently and return them in the input order.
+
+        The wall time of the verification and of every step, with the time of the
+        step summed over the rows as thread seconds, is recorded to metrics under
+        `name`.
+        """
+        verify = Stage(metrics, "checksum.verify", name)
+        stages = {
+            step: Stage(
+                metrics, f"checksum.{step}", name, parent=verify.name, concurrent=True
+            )
+            for step in ("hash", "ichksum")
+        }
+        try:
+            with verify.time(files=len(rows)), ThreadPoolExecutor(
+                self.workers
+            ) as executor:
+                return list(
+                    executor.map(lambda row: self.verify_row(row, stages), rows)
+                )
+        finally:
+            if rows:
+                for stage in (verify, *stages.values()):
+                    stage.record()
+
+
+def main() -> None:
+    """
+    The main entry point for the checksum verification script.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = init_parser()
+    args = parser.parse_args()
+    metrics.configure(args.metrics)
+    rows = read_checksum_list(args.input)
+    # tracking files have rows of a single dataset, lists of several are recorded without one
+    datasets = {row[0] for row in rows}
+    name = datasets.pop() if len(datasets) == 1 else None
+    cache = ChecksumCache(args.checksum_cache) if args.checksum_cache else None
+    hasher = Hasher(cache) if args.rehash_local else None
+    verifier = ChecksumVerifier(
+        get_client(args), args.workers, hasher, mismatch_only=args.mismatch_only
+    )
+    results = verifier.verify(rows, name)
+    if cache is not None:
+        cache.close()
+    with open(args.output, "w") as file:
+        file.write("\t".join(TRACKING_HEADER) + "\n")
+        file.writelines("\t".join(row) + "\n" for row in results)
+    mismatches = sum(row[5] == "MISMATCH" for row in results)
+    print(
+        f"Checksum verification completed. MATCH: {len(results) - mismatches}, MISMATCH: {mismatches}, ERRORS: {verifier.errors}. Results saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()